@@ -6,7 +6,7 @@ from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, current_app, jsonify, render_template, request, redirect, url_for, session, flash
 from flask import send_from_directory
 from models import Base, Job, Session, engine
-from main import setup_environment
+from worker import ensure_worker_initialized, start_dispatcher, worker_initialized_at
 from dotenv import load_dotenv  
 import time
 from datetime import timedelta
@@ -36,6 +36,9 @@ def create_app():
     app.config["PER_FILE_MAX_BYTES"] = int(os.getenv("PER_FILE_MAX_BYTES", 10 * 1024 * 1024))
     app.config["MAX_FILES_PER_UPLOAD"] = int(os.getenv("MAX_FILES_PER_UPLOAD", 50))
     app.config["WORKERS"] = int(os.getenv("WORKERS", "4"))
+    app.config["OCR_QUEUE_WORKERS"] = int(os.getenv("OCR_QUEUE_WORKERS", "1"))
+    # false: this process only enqueues; jobs run in `python -m worker serve` processes
+    app.config["EMBEDDED_WORKER"] = str(os.getenv("EMBEDDED_WORKER", "true")).lower() in ("1", "true", "yes")
     app.config["UPLOADED_RESULTS_PAGE_SIZE"] = int(os.getenv("UPLOADED_RESULTS_PAGE_SIZE", 50))
     app.config["SCREENINGS_PAGE_SIZE"] = int(os.getenv("SCREENINGS_PAGE_SIZE", 50))
 
@@ -53,6 +56,9 @@ def create_app():
 
     # Thread pool (shared via app.config)
     app.config["EXECUTOR"] = ThreadPoolExecutor(max_workers=app.config["WORKERS"])
+    # OCR runs on its own pool so ZIP ingest never waits behind a long OCR queue
+    app.config["OCR_EXECUTOR"] = ThreadPoolExecutor(max_workers=app.config["OCR_QUEUE_WORKERS"],
+                                                    thread_name_prefix="ocr")
 
 
     app.config["WTF_CSRF_TIME_LIMIT"] = 60 * 60  # 1 hour
@@ -60,9 +66,16 @@ def create_app():
 
     csrf.init_app(app)
 
-    # Ensure folders + schema (idempotent)
-    setup_environment()
-    Base.metadata.create_all(engine)
+    # Ensure folders + schema and warm OCR resources, once per process
+    ensure_worker_initialized()
+
+    # Durable job queue: claim queued/expired job items from the DB (job_queue.py)
+    app.config["TESTING"] = str(os.getenv("TESTING", "false")).lower() in ("1", "true", "yes")
+    if app.config["EMBEDDED_WORKER"] and not app.config["TESTING"]:
+        app.config["JOB_DISPATCHER"] = start_dispatcher(
+            app.config["EXECUTOR"], app.config["WORKERS"],
+            app.config["OCR_EXECUTOR"], app.config["OCR_QUEUE_WORKERS"],
+        )
 
     # --- RBAC: seed core roles once ---
     from sqlalchemy.orm import sessionmaker
@@ -354,8 +367,10 @@ def create_app():
             queued = db.query(Job).filter(Job.status == "queued").count()
             processing = db.query(Job).filter(Job.status == "processing").count()
             errors = db.query(Job).filter(Job.status == "error").count()
+            initialized_at = worker_initialized_at()
             return jsonify({
-                "status": "ok"
+                "status": "ok",
+                "worker_initialized_at": initialized_at.isoformat() if initialized_at else None,
                 }
             )
         except Exception as e:
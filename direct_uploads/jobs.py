@@ -1,4 +1,4 @@
-from flask import render_template, jsonify, redirect, url_for, flash
+from flask import Response, render_template, jsonify, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from sqlalchemy import select
 from . import bp
@@ -31,6 +31,14 @@ def api_upload_status(job_id):
         if not job or job.uploader_user_id != current_user.id:
             return jsonify({"error": "Upload job not found or unauthorized access."}), 404
 
-        items = db.execute(select(JobItem).where(JobItem.job_id == job_id).order_by(JobItem.id)).scalars().all()
-        payload = [{"filename": it.filename, "state": it.state, "detail": it.detail} for it in items]
-        return jsonify({"job_id": job_id, "job_status": job.status, "items": payload})
+        # Items are only loaded when the job changed since the client's copy (jobs.version)
+        etag = f"direct-{job_id}-{job.version}"
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            items = db.execute(select(JobItem).where(JobItem.job_id == job_id).order_by(JobItem.id)).scalars().all()
+            payload = [{"filename": it.filename, "state": it.state, "detail": it.detail} for it in items]
+            resp = jsonify({"job_id": job_id, "job_status": job.status, "items": payload})
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
@@ -12,6 +12,7 @@ from . import bp
 
 from models import Session, GlaucomaReport, PatientEncounters, GlaucomaResultsCleaned, EncounterFile, utcnow
 from process_pdfs import GLAUCOMA_PDF_DIR
+from reports.page_cache import page_available
 
 
 @bp.route("/results", methods=["GET"])
@@ -41,16 +42,19 @@ def glaucoma_results():
             or 0
         )
 
-        # Verify files present on disk
+        # Report pages that can be viewed: split file on disk, or extracted from the source PDF on
+        # demand (with REPORT_PAGES_VIRTUAL no split files are written at all)
         present_on_disk = 0
         if total_with_pdf:
-            for (fname,) in (
-                db.query(GlaucomaResultsCleaned.report_file_name)
+            for fname, source, page_number in (
+                db.query(GlaucomaResultsCleaned.report_file_name, EncounterFile.filename, GlaucomaReport.page_number)
+                .join(GlaucomaReport, GlaucomaResultsCleaned.glaucoma_report_id == GlaucomaReport.id)
+                .outerjoin(EncounterFile, GlaucomaReport.source_file_id == EncounterFile.id)
                 .filter(GlaucomaResultsCleaned.report_file_name.isnot(None))
                 .filter(GlaucomaResultsCleaned.report_file_name != "")
                 .all()
             ):
-                if (GLAUCOMA_PDF_DIR / fname).is_file():
+                if page_available(GLAUCOMA_PDF_DIR / fname, source, page_number):
                     present_on_disk += 1
 
         # Grouped KPIs from cleaned snapshot
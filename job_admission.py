@@ -0,0 +1,219 @@
+# job_admission.py
+# Admission control for uploads. The queue's load is its depth (ZIPs of active
+# jobs whose ingest or OCR stage is queued or running) and an estimated drain
+# time from the throughput of the last QUEUE_THROUGHPUT_WINDOW_SECONDS. Above
+# UPLOAD_MAX_QUEUED_ITEMS or UPLOAD_MAX_DRAIN_SECONDS a new upload is accepted
+# as a "deferred" job that the dispatcher releases once the backlog drops
+# (UPLOAD_BACKPRESSURE=defer), or refused with 429 and Retry-After
+# (UPLOAD_BACKPRESSURE=reject). Urgent uploads are always admitted.
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import func, select, update
+
+from job_events import bump_job_version, notify_job_changed
+from job_queue import PRIORITY_URGENT
+from job_store import CANCELLED, DEFERRED
+from models import Session, Job, JobItem
+
+# --- Admission from .env ---
+# Limits on the backlog a new upload joins; 0 disables a limit
+UPLOAD_MAX_QUEUED_ITEMS = int(os.getenv("UPLOAD_MAX_QUEUED_ITEMS", "1000"))
+UPLOAD_MAX_DRAIN_SECONDS = int(os.getenv("UPLOAD_MAX_DRAIN_SECONDS", "14400"))
+# Over a limit: "defer" (accept, start later) or "reject" (429 + Retry-After)
+UPLOAD_BACKPRESSURE = os.getenv("UPLOAD_BACKPRESSURE", "defer").strip().lower()
+# Throughput is measured over this many recent seconds
+QUEUE_THROUGHPUT_WINDOW_SECONDS = int(os.getenv("QUEUE_THROUGHPUT_WINDOW_SECONDS", "1800"))
+
+# queue_load() results are reused this long (upload page, uploads, dispatcher ticks)
+QUEUE_LOAD_CACHE_SECONDS = 5
+# Bounds of the Retry-After hint
+RETRY_AFTER_MIN_SECONDS = 60
+RETRY_AFTER_MAX_SECONDS = 3600
+
+ACTIVE_JOB_STATUSES = ("queued", "processing")
+_PENDING = ("queued", "processing")
+
+
+class QueueLoad(NamedTuple):
+    ingest_backlog: int  # ZIPs waiting for or in ingest
+    ocr_backlog: int  # ZIPs waiting for or in OCR
+    ingest_per_hour: float
+    ocr_per_hour: float
+    deferred_jobs: int
+
+    @property
+    def depth(self) -> int:
+        # An item is in at most one stage at a time: OCR is queued when ingest finishes
+        return self.ingest_backlog + self.ocr_backlog
+
+    @property
+    def drain_seconds(self) -> float | None:
+        """
+        Time to work off the backlog at recent throughput: the slower stage decides. ZIPs still
+        in ingest count as OCR work too, in the recent ratio of OCR to ingest completions (ZIPs
+        without PDFs skip OCR). None when there is a backlog but no recent throughput to
+        estimate from.
+        """
+        ocr_share = min(1.0, self.ocr_per_hour / self.ingest_per_hour) if self.ingest_per_hour else 1.0
+        waits = []
+        for backlog, per_hour in ((self.ingest_backlog, self.ingest_per_hour),
+                                  (self.ocr_backlog + self.ingest_backlog * ocr_share, self.ocr_per_hour)):
+            if backlog == 0:
+                continue
+            if per_hour <= 0:
+                return None
+            waits.append(backlog / per_hour * 3600)
+        return max(waits, default=0.0)
+
+    def seconds_to_clear(self, items: int) -> float | None:
+        """Time until `items` fewer ZIPs are waiting, at the slower stage's rate."""
+        rates = [r for r in (self.ingest_per_hour, self.ocr_per_hour) if r > 0]
+        return items / min(rates) * 3600 if rates else None
+
+
+class Admission(NamedTuple):
+    action: str  # "queue", "defer" or "reject"
+    load: QueueLoad
+    reason: str | None = None
+    retry_after: int | None = None
+
+
+_cache_lock = threading.Lock()
+_cached: tuple[float, QueueLoad] | None = None
+
+
+def _measure() -> QueueLoad:
+    since = datetime.utcnow() - timedelta(seconds=QUEUE_THROUGHPUT_WINDOW_SECONDS)
+    active = select(Job.id).where(Job.status.in_(ACTIVE_JOB_STATUSES))
+    db = Session()
+    try:
+        ingest_backlog = db.scalar(
+            select(func.count(JobItem.id)).where(JobItem.job_id.in_(active), JobItem.state.in_(_PENDING))
+        ) or 0
+        ocr_backlog = db.scalar(
+            select(func.count(JobItem.id)).where(JobItem.job_id.in_(active), JobItem.ocr_state.in_(_PENDING))
+        ) or 0
+        ingested = db.scalar(
+            select(func.count(JobItem.id)).where(JobItem.finished_at >= since, JobItem.state != CANCELLED)
+        ) or 0
+        ocred = db.scalar(
+            select(func.count(JobItem.id)).where(JobItem.ocr_finished_at >= since, JobItem.ocr_state != CANCELLED)
+        ) or 0
+        deferred = db.scalar(select(func.count(Job.id)).where(Job.status == DEFERRED)) or 0
+    finally:
+        db.close()
+    window_hours = QUEUE_THROUGHPUT_WINDOW_SECONDS / 3600
+    return QueueLoad(ingest_backlog, ocr_backlog, ingested / window_hours, ocred / window_hours, deferred)
+
+
+def queue_load(max_age: float | None = None) -> QueueLoad:
+    """Current queue load, measured at most every `max_age` (QUEUE_LOAD_CACHE_SECONDS) seconds per process."""
+    global _cached
+    max_age = QUEUE_LOAD_CACHE_SECONDS if max_age is None else max_age
+    with _cache_lock:
+        if _cached is not None and time.monotonic() - _cached[0] < max_age:
+            return _cached[1]
+    load = _measure()
+    with _cache_lock:
+        _cached = (time.monotonic(), load)
+    return load
+
+
+def _over_limits(depth: int, drain: float | None) -> list[str]:
+    reasons = []
+    if UPLOAD_MAX_QUEUED_ITEMS and depth > UPLOAD_MAX_QUEUED_ITEMS:
+        reasons.append(f"{depth} ZIPs queued (limit {UPLOAD_MAX_QUEUED_ITEMS})")
+    if UPLOAD_MAX_DRAIN_SECONDS and drain is not None and drain > UPLOAD_MAX_DRAIN_SECONDS:
+        limit = format_wait(UPLOAD_MAX_DRAIN_SECONDS).removeprefix("about ")
+        reasons.append(f"{format_wait(drain)} to drain (limit {limit})")
+    return reasons
+
+
+def _projected_drain(load: QueueLoad, extra: int) -> float | None:
+    drain = load.drain_seconds
+    if drain is None or load.depth == 0:
+        return drain
+    return drain * (load.depth + extra) / load.depth
+
+
+def check_admission(n_items: int, priority: str | None = None) -> Admission:
+    """Decide what happens to an upload of `n_items` ZIPs given the current load."""
+    load = queue_load()
+    if priority == PRIORITY_URGENT or (load.depth == 0 and not load.deferred_jobs):
+        return Admission("queue", load)
+    reasons = _over_limits(load.depth + n_items, _projected_drain(load, n_items))
+    if load.deferred_jobs and UPLOAD_BACKPRESSURE != "reject":
+        # Earlier deferred uploads go first
+        reasons.append(f"{load.deferred_jobs} deferred job(s) waiting")
+    if not reasons:
+        return Admission("queue", load)
+    if UPLOAD_BACKPRESSURE != "reject":
+        return Admission("defer", load, "; ".join(reasons))
+    waits = []
+    if UPLOAD_MAX_QUEUED_ITEMS:
+        waits.append(load.seconds_to_clear(load.depth + n_items - UPLOAD_MAX_QUEUED_ITEMS))
+    drain = _projected_drain(load, n_items)
+    if UPLOAD_MAX_DRAIN_SECONDS and drain is not None:
+        waits.append(drain - UPLOAD_MAX_DRAIN_SECONDS)
+    wait = max((w for w in waits if w is not None), default=RETRY_AFTER_MIN_SECONDS * 5)
+    retry_after = int(min(max(wait, RETRY_AFTER_MIN_SECONDS), RETRY_AFTER_MAX_SECONDS))
+    return Admission("reject", load, "; ".join(reasons), retry_after)
+
+
+def release_deferred_jobs() -> int:
+    """
+    Dispatcher hook: move deferred jobs to the queue, oldest first, while the load stays
+    within the limits. A job is always released into an empty queue, however large.
+    Returns jobs released.
+    """
+    db = Session()
+    try:
+        deferred = db.execute(
+            select(Job.id, func.count(JobItem.id))
+            .join(JobItem, JobItem.job_id == Job.id)
+            .where(Job.status == DEFERRED)
+            .group_by(Job.id)
+            .order_by(Job.created_at, Job.id)
+            .limit(50)
+        ).all()
+        if not deferred:
+            return 0
+        load = queue_load(max_age=0)
+        depth, released = load.depth, []
+        for job_id, n_items in deferred:
+            if depth and _over_limits(depth + n_items, _projected_drain(load, depth - load.depth + n_items)):
+                break
+            won = db.execute(
+                update(Job).where(Job.id == job_id, Job.status == DEFERRED).values(status="queued")
+            ).rowcount
+            if won:
+                bump_job_version(db, job_id)
+                released.append(job_id)
+                depth += n_items
+        db.commit()
+    finally:
+        db.close()
+    if released:
+        global _cached
+        with _cache_lock:
+            _cached = None
+        notify_job_changed(*released)
+        print(f"Released {len(released)} deferred job(s) to the queue.")
+    return len(released)
+
+
+def format_wait(seconds: float | None) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes = int(round(seconds / 60))
+    if minutes < 1:
+        return "under a minute"
+    if minutes < 60:
+        return f"about {minutes} min"
+    hours, minutes = divmod(minutes, 60)
+    return f"about {hours} h {minutes} min" if minutes else f"about {hours} h"
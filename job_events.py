@@ -0,0 +1,62 @@
+# job_events.py
+# Change notification for upload jobs. Every write to a job or its items bumps
+# `jobs.version` in the same transaction; status pages compare versions instead
+# of rebuilding the whole job payload (ETag / 304 on the JSON endpoints, and the
+# SSE stream at /jobs/<token>/events). Writers in this process also wake waiting
+# streams immediately; changes made by other processes (standalone workers) are
+# seen at the next JOB_EVENTS_POLL_SECONDS check of the version.
+
+import os
+import threading
+
+from sqlalchemy import update
+
+from models import Job
+
+# --- Job events from .env ---
+# How often an open event stream checks the job's version for changes from other processes
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "5"))
+# An event stream is closed after this long; the browser reconnects by itself. Each open
+# stream holds a request thread, so the server needs threads (or gevent) to spare
+JOB_EVENTS_MAX_SECONDS = int(os.getenv("JOB_EVENTS_MAX_SECONDS", "300"))
+
+# Jobs whose last change is remembered; the least recently changed are forgotten beyond this
+MAX_TRACKED_JOBS = 1024
+
+_changed = threading.Condition()
+# job id -> generation of its last change notified in this process, least recently changed
+# first. Generations come from one counter and never repeat, so a stream whose job was
+# forgotten sees a different one, wakes and re-checks the job's version.
+_generations: dict[int, int] = {}
+_last_generation = 0
+
+
+def bump_job_version(db, job_id) -> None:
+    """Mark a job as changed; `job_id` may be an id or a scalar subquery. The caller commits."""
+    db.execute(update(Job).where(Job.id == job_id).values(version=Job.version + 1))
+
+
+def notify_job_changed(*job_ids: int) -> None:
+    """Wake event streams of these jobs; call after the commit that bumped their version."""
+    global _last_generation
+    with _changed:
+        for job_id in job_ids:
+            if job_id is not None:
+                _last_generation += 1
+                _generations.pop(job_id, None)
+                _generations[job_id] = _last_generation
+        while len(_generations) > MAX_TRACKED_JOBS:
+            del _generations[next(iter(_generations))]
+        _changed.notify_all()
+
+
+def job_generation(job_id: int) -> int:
+    with _changed:
+        return _generations.get(job_id, 0)
+
+
+def wait_for_job_change(job_id: int, seen: int, timeout: float = JOB_EVENTS_POLL_SECONDS) -> int:
+    """Block until a change of `job_id` is notified after generation `seen`, or `timeout`; returns the generation."""
+    with _changed:
+        _changed.wait_for(lambda: _generations.get(job_id, 0) != seen, timeout)
+        return _generations.get(job_id, 0)
@@ -0,0 +1,679 @@
+# job_queue.py
+# Durable job queue on the jobs / job_items tables. Uploads only insert queued
+# rows (job_store.db_create_job); a dispatcher thread in each worker process
+# claims items with a conditional UPDATE, holds a lease that a heartbeat keeps
+# extending while the item runs, and requeues items whose lease expired (worker
+# crashed, process recycled). Two stages are queued per item: ZIP ingest
+# (`state`) and OCR (`ocr_state`).
+
+import errno
+import os
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+from sqlalchemy import Integer, case, cast, func, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased
+
+from job_events import bump_job_version, notify_job_changed
+from job_store import CANCELLED, DEFERRED, FAILED_STATES, FINAL_JOB_STATUSES
+from models import Session, Job, JobItem
+from pdf_sandbox import PdfCrashError, PdfTimeoutError
+
+# --- Queue from .env ---
+# A running item's lease; heartbeats extend it every JOB_LEASE_SECONDS / 3
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+# How often the dispatcher looks for queued work and expired leases
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Items of one job running at once, per stage (a job's ZIPs are independent)
+JOB_MAX_PARALLEL_ITEMS = max(1, int(os.getenv("JOB_MAX_PARALLEL_ITEMS", "4")))
+# Transient failures are retried with exponential backoff; after JOB_MAX_ATTEMPTS runs of a
+# stage the item is moved to the dead-letter state ("dead")
+JOB_MAX_ATTEMPTS = max(1, int(os.getenv("JOB_MAX_ATTEMPTS", "4")))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "1800"))
+# How often a running item checks whether its job was cancelled (one indexed lookup)
+JOB_CANCEL_CHECK_SECONDS = float(os.getenv("JOB_CANCEL_CHECK_SECONDS", "2"))
+
+STAGE_INGEST = "ingest"
+STAGE_OCR = "ocr"
+
+PRIORITY_URGENT = "urgent"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BACKFILL = "backfill"
+JOB_PRIORITIES = (PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_BACKFILL)
+PRIORITY_RANK = {p: i for i, p in enumerate(JOB_PRIORITIES)}
+DEFAULT_PRIORITY_WEIGHTS = {PRIORITY_URGENT: 8.0, PRIORITY_NORMAL: 2.0, PRIORITY_BACKFILL: 1.0}
+
+
+def _parse_weights(spec: str) -> dict[str, float]:
+    weights = dict(DEFAULT_PRIORITY_WEIGHTS)
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() in weights and value.strip():
+            weights[name.strip()] = max(float(value), 0.01)
+    return weights
+
+
+# Fair-share weight per priority class, e.g. "urgent=8,normal=2,backfill=1"
+PRIORITY_WEIGHTS = _parse_weights(os.getenv("JOB_PRIORITY_WEIGHTS", ""))
+
+# Identifies this process in lease_owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class ClaimedItem(NamedTuple):
+    id: int
+    job_token: str
+    filename: str
+    ocr_pdfs: str | None
+    owner: str
+    job_id: int
+
+
+def _state_column(stage: str):
+    return JobItem.state if stage == STAGE_INGEST else JobItem.ocr_state
+
+
+def _attempts_column(stage: str):
+    return JobItem.attempts if stage == STAGE_INGEST else JobItem.ocr_attempts
+
+
+def retry_delay(attempt: int) -> float:
+    """Backoff before retry number `attempt` (1-based): base * 2^(attempt-1), capped, with +-20% jitter."""
+    delay = min(JOB_RETRY_BASE_SECONDS * (2 ** max(attempt - 1, 0)), JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+# Failures worth another attempt: locks, timeouts, crashed sandboxes, a busy database
+_TRANSIENT_TYPES = (PermissionError, TimeoutError, ConnectionError, PdfTimeoutError, PdfCrashError,
+                    sqlite3.OperationalError, OperationalError)
+_TRANSIENT_ERRNOS = {errno.EAGAIN, errno.EBUSY, errno.ETXTBSY, errno.EINTR}
+_TRANSIENT_PATTERNS = re.compile(
+    r"database is locked|database table is locked|timed out|timeout|permissionerror|permission denied"
+    r"|being used by another process|resource temporarily unavailable|worker process crashed",
+    re.IGNORECASE,
+)
+
+
+def is_transient_error(error: BaseException | str | None) -> bool:
+    """
+    Classify a failure: True for conditions that may clear on their own (file locks, a locked
+    SQLite DB, OCR timeouts and crashes), False for problems with the upload itself (bad or
+    malicious ZIP, unreadable PDF), which fail the same way every time.
+    """
+    if error is None:
+        return False
+    if isinstance(error, BaseException):
+        if isinstance(error, _TRANSIENT_TYPES):
+            return True
+        if isinstance(error, OSError) and error.errno in _TRANSIENT_ERRNOS:
+            return True
+        error = f"{type(error).__name__}: {error}"
+    return bool(_TRANSIENT_PATTERNS.search(str(error)))
+
+
+def _lease_deadline() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def requeue_expired() -> int:
+    """
+    Put items whose lease expired (or that were running before leases existed) back in the
+    queue. An item that already used JOB_MAX_ATTEMPTS runs (e.g. a ZIP that kills its worker
+    every time) goes to "dead" instead, and an item of a cancelled job to "cancelled".
+    """
+    now = datetime.utcnow()
+    expired = or_(JobItem.lease_expires_at.is_(None), JobItem.lease_expires_at < now)
+    cancelled_jobs = select(Job.id).where(Job.status == CANCELLED)
+    db = Session()
+    try:
+        n = 0
+        job_ids: set[int] = set()
+        for stage in (STAGE_INGEST, STAGE_OCR):
+            col, attempts = _state_column(stage), _attempts_column(stage)
+            detail = "detail" if stage == STAGE_INGEST else "ocr_detail"
+            job_ids.update(db.scalars(select(JobItem.job_id).where(col == "processing", expired)))
+            n += db.execute(
+                update(JobItem)
+                .where(col == "processing", expired, JobItem.job_id.in_(cancelled_jobs))
+                .values({col.key: CANCELLED, detail: "Cancelled (worker lost)",
+                         "lease_owner": None, "lease_expires_at": None})
+            ).rowcount
+            n += db.execute(
+                update(JobItem)
+                .where(col == "processing", expired, attempts >= JOB_MAX_ATTEMPTS)
+                .values({col.key: "dead", detail: f"Worker lost {JOB_MAX_ATTEMPTS} time(s) while running this item",
+                         "lease_owner": None, "lease_expires_at": None})
+            ).rowcount
+            n += db.execute(
+                update(JobItem)
+                .where(col == "processing", expired)
+                .values({col.key: "queued", "lease_owner": None, "lease_expires_at": None})
+            ).rowcount
+        for job_id in job_ids:
+            bump_job_version(db, job_id)
+        db.commit()
+        if n:
+            notify_job_changed(*job_ids)
+            print(f"Requeued {n} job item(s) with an expired lease.")
+        return n
+    finally:
+        db.close()
+
+
+def priority_weight(priority: str | None) -> float:
+    return PRIORITY_WEIGHTS.get(priority or PRIORITY_NORMAL, PRIORITY_WEIGHTS[PRIORITY_NORMAL])
+
+
+def _inflight_by_uploader(db, col) -> dict:
+    rows = (
+        db.query(Job.uploader_user_id, func.count(JobItem.id))
+        .join(JobItem, JobItem.job_id == Job.id)
+        .filter(col == "processing")
+        .group_by(Job.uploader_user_id)
+        .all()
+    )
+    return {uploader: n for uploader, n in rows}
+
+
+def _inflight_by_job(db, col) -> dict:
+    rows = db.query(JobItem.job_id, func.count(JobItem.id)).filter(col == "processing").group_by(JobItem.job_id)
+    return {job_id: n for job_id, n in rows.all()}
+
+
+def claim_items(stage: str, limit: int, owner: str = WORKER_ID,
+                per_job: int = JOB_MAX_PARALLEL_ITEMS) -> list[ClaimedItem]:
+    """
+    Claim up to `limit` queued items of `stage`. Each claim is a conditional UPDATE (still
+    queued, and fewer than `per_job` items of the job running in this stage), so concurrent
+    dispatchers never run an item twice or exceed the per-job cap. All claims are one
+    transaction, with one status update and version bump per job.
+
+    Order is weighted fair queuing across uploaders: the next slot goes to the uploader with
+    the lowest (running items + 1) / weight, where weight comes from the priority of that
+    uploader's next item (JOB_PRIORITY_WEIGHTS). One uploader's bulk upload therefore cannot
+    take every slot, and an urgent file from an idle uploader is picked first.
+    """
+    if limit <= 0:
+        return []
+    col = _state_column(stage)
+    db = Session()
+    try:
+        job_inflight = _inflight_by_job(db, col)
+        full_jobs = [job_id for job_id, n in job_inflight.items() if n >= per_job]
+        # Oldest `limit` queued items per (uploader, priority): every uploader is a candidate
+        ranked = (
+            db.query(
+                JobItem.id.label("id"), JobItem.job_id.label("job_id"), Job.token.label("token"),
+                JobItem.filename.label("filename"), JobItem.ocr_pdfs.label("ocr_pdfs"),
+                Job.uploader_user_id.label("uploader"), Job.priority.label("priority"),
+                func.row_number().over(
+                    partition_by=(Job.uploader_user_id, Job.priority), order_by=JobItem.id
+                ).label("rn"),
+            )
+            .join(Job, JobItem.job_id == Job.id)
+            .filter(col == "queued", JobItem.job_id.notin_(full_jobs), Job.status.notin_((CANCELLED, DEFERRED)))
+            .filter(or_(JobItem.retry_at.is_(None), JobItem.retry_at <= datetime.utcnow()))
+            .subquery()
+        )
+        candidates = db.query(ranked).filter(ranked.c.rn <= limit).order_by(ranked.c.id).all()
+        queues: dict = {}
+        for c in candidates:
+            queues.setdefault(c.uploader, []).append(c)
+        for q in queues.values():
+            q.sort(key=lambda c: (PRIORITY_RANK.get(c.priority, 1), c.id))
+        inflight = _inflight_by_uploader(db, col)
+
+        claimed: list[ClaimedItem] = []
+        busy = aliased(JobItem)
+        busy_col = getattr(busy, col.key)
+        attempts_col = _attempts_column(stage)
+        while queues and len(claimed) < limit:
+            uploader = min(queues, key=lambda u: (
+                (inflight.get(u, 0) + 1) / priority_weight(queues[u][0].priority),
+                PRIORITY_RANK.get(queues[u][0].priority, 1),
+                queues[u][0].id,
+            ))
+            c = queues[uploader].pop(0)
+            if not queues[uploader]:
+                del queues[uploader]
+            if job_inflight.get(c.job_id, 0) >= per_job:
+                continue
+            running = (
+                select(func.count(busy.id))
+                .where(busy.job_id == c.job_id, busy_col == "processing")
+                .scalar_subquery()
+            )
+            conditions = [JobItem.id == c.id, col == "queued", running < per_job]
+            started = "started_at" if stage == STAGE_INGEST else "ocr_started_at"
+            won = db.execute(
+                update(JobItem).where(*conditions).values({
+                    col.key: "processing",
+                    attempts_col.key: attempts_col + 1,
+                    "retry_at": None,
+                    started: datetime.utcnow(),
+                    "lease_owner": owner,
+                    "lease_expires_at": _lease_deadline(),
+                })
+            ).rowcount
+            if won:
+                claimed.append(ClaimedItem(c.id, c.token, c.filename, c.ocr_pdfs, owner, c.job_id))
+                inflight[uploader] = inflight.get(uploader, 0) + 1
+                job_inflight[c.job_id] = job_inflight.get(c.job_id, 0) + 1
+        job_ids = sorted({c.job_id for c in claimed})
+        if job_ids:
+            db.execute(update(Job).where(Job.id.in_(job_ids), Job.status == "queued").values(status="processing"))
+            for job_id in job_ids:
+                bump_job_version(db, job_id)
+        db.commit()
+        if job_ids:
+            notify_job_changed(*job_ids)
+        return claimed
+    finally:
+        db.close()
+
+
+def set_job_priority(job_token: str, priority: str) -> bool:
+    """Change the dispatch class of a job that is not finished yet; False if unknown/finished."""
+    if priority not in JOB_PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    db = Session()
+    try:
+        job_id = db.scalar(select(Job.id).where(Job.token == job_token, Job.status.notin_(FINAL_JOB_STATUSES)))
+        if job_id is None:
+            return False
+        n = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status.notin_(FINAL_JOB_STATUSES))
+            .values(priority=priority, version=Job.version + 1)
+        ).rowcount
+        db.commit()
+        if n:
+            notify_job_changed(job_id)
+        return bool(n)
+    finally:
+        db.close()
+
+
+# /jobs shows the queue wait on every view; measured at most this often per process
+QUEUE_STATS_CACHE_SECONDS = 30
+_stats_lock = threading.Lock()
+_stats_cache: dict[int, tuple[float, dict]] = {}
+
+
+def _seconds_between(start, end):
+    return (func.julianday(end) - func.julianday(start)) * 86400
+
+
+def _wait_by_priority(db, wait, *conditions) -> dict:
+    """{priority: (count, average, p95)} of the `wait` expression in seconds, aggregated in SQL."""
+    waits = (
+        select(
+            Job.priority.label("priority"),
+            wait.label("wait"),
+            func.row_number().over(partition_by=Job.priority, order_by=wait).label("rn"),
+            func.count().over(partition_by=Job.priority).label("n"),
+        )
+        .join(JobItem, JobItem.job_id == Job.id)
+        .where(*conditions)
+        .subquery()
+    )
+    p95_rank = cast(func.round((waits.c.n - 1) * 0.95), Integer) + 1
+    rows = db.execute(
+        select(
+            waits.c.priority, func.count(), func.avg(waits.c.wait),
+            func.max(case((waits.c.rn == p95_rank, waits.c.wait))),
+        ).group_by(waits.c.priority)
+    )
+    return {priority: (n, avg, p95) for priority, n, avg, p95 in rows}
+
+
+def _round(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds, 1)
+
+
+def queue_wait_stats(hours: int = 24, max_age: float | None = None) -> dict:
+    """
+    Queue wait per priority class over the last `hours`: ingest wait (upload -> claimed) and
+    OCR wait (ingested -> OCR claimed), plus what is waiting right now. Aggregated in SQL,
+    and measured at most every `max_age` (QUEUE_STATS_CACHE_SECONDS) seconds per process.
+    """
+    max_age = QUEUE_STATS_CACHE_SECONDS if max_age is None else max_age
+    with _stats_lock:
+        cached = _stats_cache.get(hours)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+    since = datetime.utcnow() - timedelta(hours=hours)
+    now = datetime.utcnow()
+    db = Session()
+    try:
+        started = JobItem.started_at >= since
+        ingest = _wait_by_priority(db, _seconds_between(Job.created_at, JobItem.started_at),
+                                   started, Job.created_at.isnot(None))
+        ocr = _wait_by_priority(db, _seconds_between(JobItem.finished_at, JobItem.ocr_started_at),
+                                started, JobItem.ocr_started_at.isnot(None), JobItem.finished_at.isnot(None))
+        waiting = (
+            db.query(Job.priority, func.count(JobItem.id), func.min(Job.created_at))
+            .join(JobItem, JobItem.job_id == Job.id)
+            .filter(JobItem.state == "queued")
+            .group_by(Job.priority)
+            .all()
+        )
+    finally:
+        db.close()
+
+    stats = {}
+    for priority in JOB_PRIORITIES:
+        n, avg, p95 = ingest.get(priority, (0, None, None))
+        _n, ocr_avg, ocr_p95 = ocr.get(priority, (0, None, None))
+        stats[priority] = {
+            "weight": priority_weight(priority),
+            "started": n,
+            "wait_avg_s": _round(avg),
+            "wait_p95_s": _round(p95),
+            "ocr_wait_avg_s": _round(ocr_avg),
+            "ocr_wait_p95_s": _round(ocr_p95),
+            "queued": 0,
+            "oldest_queued_s": None,
+        }
+    for priority, count, oldest in waiting:
+        row = stats.setdefault(priority, {"weight": priority_weight(priority)})
+        row["queued"] = count
+        row["oldest_queued_s"] = round((now - oldest).total_seconds(), 1) if oldest else None
+    with _stats_lock:
+        if len(_stats_cache) >= 32:
+            _stats_cache.clear()  # `hours` comes from the query string
+        _stats_cache[hours] = (time.monotonic(), stats)
+    return stats
+
+
+def heartbeat(item_id: int, owner: str = WORKER_ID) -> bool:
+    """Extend the lease; False when it was lost (expired and requeued elsewhere)."""
+    db = Session()
+    try:
+        n = db.execute(
+            update(JobItem)
+            .where(JobItem.id == item_id, JobItem.lease_owner == owner)
+            .values(lease_expires_at=_lease_deadline())
+        ).rowcount
+        db.commit()
+        return bool(n)
+    finally:
+        db.close()
+
+
+def finish_item(claimed: ClaimedItem, stage: str, state: str, detail: str | None = None, **values) -> bool:
+    """
+    Record the stage outcome and release the lease, only if this worker still holds it.
+    Extra `values` are written to the item too (e.g. ocr_state / ocr_pdfs after ingest).
+    """
+    col = _state_column(stage)
+    finished = "finished_at" if stage == STAGE_INGEST else "ocr_finished_at"
+    detail_col = "detail" if stage == STAGE_INGEST else "ocr_detail"
+    values.update({col.key: state, "lease_owner": None, "lease_expires_at": None})
+    if state != "queued":
+        values[finished] = datetime.utcnow()
+    if detail:
+        values[detail_col] = detail
+    db = Session()
+    try:
+        n = db.execute(
+            update(JobItem)
+            .where(JobItem.id == claimed.id, JobItem.lease_owner == claimed.owner, col == "processing")
+            .values(values)
+        ).rowcount
+        if n:
+            bump_job_version(db, claimed.job_id)
+        db.commit()
+        if n:
+            notify_job_changed(claimed.job_id)
+        else:
+            print(f"Lease on job item {claimed.id} was lost; result for '{claimed.filename}' discarded.")
+        return bool(n)
+    finally:
+        db.close()
+
+
+def fail_item(claimed: ClaimedItem, stage: str, message: str, transient: bool) -> str | None:
+    """
+    Record a failed run. A transient failure with attempts left goes back to the queue after
+    retry_delay(); otherwise the item ends as "error" (permanent) or "dead" (out of attempts).
+    Returns the new state, or None when the lease was lost.
+    """
+    db = Session()
+    try:
+        attempts = db.scalar(select(_attempts_column(stage)).where(JobItem.id == claimed.id)) or 0
+    finally:
+        db.close()
+    if not transient:
+        state, detail, values = "error", message, {}
+    elif attempts >= JOB_MAX_ATTEMPTS:
+        state, detail, values = "dead", f"Gave up after {attempts} attempt(s): {message}", {}
+    else:
+        delay = retry_delay(attempts)
+        state = "queued"
+        detail = f"Attempt {attempts}/{JOB_MAX_ATTEMPTS} failed, retrying in {delay:.0f}s: {message}"
+        values = {"retry_at": datetime.utcnow() + timedelta(seconds=delay)}
+    return state if finish_item(claimed, stage, state, detail, **values) else None
+
+
+def retry_failed_items(job_tokens: list[str]) -> int:
+    """
+    Manual retry: put the failed ("error" / "dead") stage of every item of these jobs back in
+    the queue with a fresh attempt budget, and reopen the jobs. Cancelled jobs are left alone.
+    Returns items requeued.
+    """
+    db = Session()
+    try:
+        job_ids = list(db.scalars(select(Job.id).where(Job.token.in_(job_tokens), Job.status != CANCELLED)))
+        if not job_ids:
+            return 0
+        failed = FAILED_STATES
+        n = db.execute(
+            update(JobItem)
+            .where(JobItem.job_id.in_(job_ids), JobItem.state.in_(failed))
+            .values(state="queued", attempts=0, retry_at=None, detail="Retry requested",
+                    started_at=None, finished_at=None, ocr_state=None, ocr_detail=None)
+        ).rowcount
+        n += db.execute(
+            update(JobItem)
+            .where(JobItem.job_id.in_(job_ids), JobItem.ocr_state.in_(failed))
+            .values(ocr_state="queued", ocr_attempts=0, retry_at=None, ocr_detail="Retry requested",
+                    ocr_started_at=None, ocr_finished_at=None)
+        ).rowcount
+        reopened = (
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.status == "error",
+                   Job.id.in_(select(JobItem.job_id).where(JobItem.job_id.in_(job_ids),
+                                                           or_(JobItem.state == "queued", JobItem.ocr_state == "queued"))))
+            .values(status="processing", error=None)
+        )
+        db.execute(reopened)
+        for job_id in job_ids:
+            bump_job_version(db, job_id)
+        db.commit()
+        notify_job_changed(*job_ids)
+        return n
+    finally:
+        db.close()
+
+
+def cancel_job(job_token: str) -> list[str] | None:
+    """
+    Cancel a job that is not finished: stages not started yet are dropped ("cancelled") and the
+    job is closed as cancelled at once; running stages stop at their next CancelCheck.
+    Returns the filenames whose ingest never started (their ZIPs are still in the upload
+    folder), or None when the job is unknown or already finished.
+    """
+    db = Session()
+    try:
+        job_id = db.scalar(select(Job.id).where(Job.token == job_token, Job.status.notin_(FINAL_JOB_STATUSES)))
+        if job_id is None:
+            return None
+        won = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status.notin_(FINAL_JOB_STATUSES))
+            .values(status=CANCELLED, error="Cancelled")
+        ).rowcount
+        if not won:
+            db.rollback()
+            return None
+        now = datetime.utcnow()
+        dropped = list(db.scalars(select(JobItem.filename).where(JobItem.job_id == job_id, JobItem.state == "queued")))
+        db.execute(
+            update(JobItem)
+            .where(JobItem.job_id == job_id, JobItem.state == "queued")
+            .values(state=CANCELLED, detail="Cancelled before it started", retry_at=None, finished_at=now)
+        )
+        db.execute(
+            update(JobItem)
+            .where(JobItem.job_id == job_id, JobItem.ocr_state == "queued")
+            .values(ocr_state=CANCELLED, ocr_detail="Cancelled before it started", retry_at=None,
+                    ocr_finished_at=now)
+        )
+        bump_job_version(db, job_id)
+        db.commit()
+        notify_job_changed(job_id)
+        return dropped
+    finally:
+        db.close()
+
+
+def is_job_cancelled(job_token: str) -> bool:
+    db = Session()
+    try:
+        return db.scalar(select(Job.status).where(Job.token == job_token)) == CANCELLED
+    finally:
+        db.close()
+
+
+class CancelCheck:
+    """
+    Cooperative stop flag for a running item, passed as `should_stop` to process_zip_file /
+    process_all_pdfs_for_ocr. Calling it is cheap: the job's status is read at most every
+    JOB_CANCEL_CHECK_SECONDS, and once cancelled it stays True.
+    """
+
+    def __init__(self, job_token: str, interval: float = JOB_CANCEL_CHECK_SECONDS):
+        self.job_token = job_token
+        self.interval = interval
+        self.cancelled = False
+        self._checked_at = float("-inf")
+
+    def __call__(self, force: bool = False) -> bool:
+        if self.cancelled:
+            return True
+        now = time.monotonic()
+        if force or now - self._checked_at >= self.interval:
+            self._checked_at = now
+            try:
+                self.cancelled = is_job_cancelled(self.job_token)
+            except Exception as e:
+                print(f"Cancel check for job {self.job_token[:8]} failed: {e}")
+        return self.cancelled
+
+
+class Lease:
+    """Heartbeats a claimed item's lease from a background thread while the `with` block runs."""
+
+    def __init__(self, claimed: ClaimedItem, interval: float | None = None):
+        self.claimed = claimed
+        self.interval = interval if interval is not None else max(1.0, JOB_LEASE_SECONDS / 3)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{claimed.id}", daemon=True)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if not heartbeat(self.claimed.id, self.claimed.owner):
+                    self.lost = True
+                    return
+            except Exception as e:
+                print(f"Heartbeat for job item {self.claimed.id} failed: {e}")
+
+    def __enter__(self) -> "Lease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class Dispatcher:
+    """
+    Polls the queue and runs claimed items on the given executors, never more than
+    `capacity` per stage from this process. wake() triggers an immediate poll.
+    `hooks` run at the start of every poll, before claiming (e.g. releasing deferred jobs).
+    """
+
+    def __init__(self, stages: dict[str, tuple[Executor, int, Callable[[ClaimedItem], None]]],
+                 hooks: tuple[Callable[[], object], ...] = ()):
+        self.stages = stages
+        self.hooks = hooks
+        self._inflight = {stage: 0 for stage in stages}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+
+    def start(self) -> "Dispatcher":
+        self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        """Stop claiming new work; items already submitted keep running on their executors."""
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Job dispatcher error: {e}")
+            self._wake.wait(JOB_POLL_SECONDS)
+            self._wake.clear()
+
+    def tick(self) -> int:
+        """Requeue expired leases, run the hooks, then claim and submit as much work as there is free capacity."""
+        requeue_expired()
+        for hook in self.hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"Dispatcher hook {getattr(hook, '__name__', hook)} failed: {e}")
+        submitted = 0
+        for stage, (executor, capacity, handler) in self.stages.items():
+            with self._lock:
+                free = capacity - self._inflight[stage]
+            for claimed in claim_items(stage, free):
+                with self._lock:
+                    self._inflight[stage] += 1
+                executor.submit(self._run, stage, handler, claimed)
+                submitted += 1
+        return submitted
+
+    def _run(self, stage: str, handler: Callable[[ClaimedItem], None], claimed: ClaimedItem) -> None:
+        try:
+            handler(claimed)
+        except Exception as e:
+            print(f"Job item {claimed.id} ({stage}) failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight[stage] -= 1
+            self.wake()
@@ -0,0 +1,301 @@
+# job_retention.py
+# Retention for upload job history. Jobs that finished (done / error / cancelled, or
+# completed for direct uploads) more than JOB_RETENTION_DAYS ago are compacted into
+# one `job_archive` row each (status, uploader, timings, per-stage state counts and
+# the first failures), then
+# their `job_items` and `jobs` rows are deleted. Every step runs in transactions of
+# at most JOB_RETENTION_BATCH rows, so a large purge never holds the SQLite write
+# lock for long, and a run that stops half-way resumes where it left off.
+#
+# Runs from the dispatcher every JOB_RETENTION_INTERVAL_SECONDS, or by hand:
+#   python job_retention.py --dry-run
+#   python job_retention.py --days 30
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, func, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from job_store import FAILED_STATES, FINAL_JOB_STATUSES
+from models import Session, Job, JobArchive, JobItem, engine
+
+# --- Job retention from .env ---
+# Finished jobs are archived and deleted this many days after their last change; 0 keeps everything
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "90"))
+# Rows archived or deleted per transaction
+JOB_RETENTION_BATCH = int(os.getenv("JOB_RETENTION_BATCH", "500"))
+# How often the dispatcher starts a purge
+JOB_RETENTION_INTERVAL_SECONDS = int(os.getenv("JOB_RETENTION_INTERVAL_SECONDS", "3600"))
+
+# Pause between batches, so uploads and workers get the write lock in between
+JOB_RETENTION_PAUSE_SECONDS = 0.05
+# Failed items kept per archived job, and the length their detail is cut to
+ARCHIVE_MAX_FAILURES = 20
+ARCHIVE_DETAIL_CHARS = 300
+
+_PENDING = ("queued", "processing")
+_ITEM_FAILED = or_(JobItem.state.in_(FAILED_STATES), JobItem.ocr_state.in_(FAILED_STATES))
+
+_run_lock = threading.Lock()
+_last_started: float | None = None
+
+
+def _expired_jobs(cutoff: datetime):
+    """Finished before `cutoff`, no stage still queued or running (a cancelled job's item may be), not archived since."""
+    return select(Job).where(
+        Job.status.in_(FINAL_JOB_STATUSES),
+        Job.updated_at < cutoff,
+        ~exists().where(JobItem.job_id == Job.id, JobItem.state.in_(_PENDING)),
+        ~exists().where(JobItem.job_id == Job.id, JobItem.ocr_state.in_(_PENDING)),
+        ~exists().where(JobArchive.token == Job.token, JobArchive.archived_at >= Job.updated_at),
+    )
+
+
+def _archived_job_ids():
+    """Jobs with an archive row and unchanged since; only these are deleted."""
+    return (
+        select(Job.id)
+        .join(JobArchive, JobArchive.token == Job.token)
+        .where(Job.status.in_(FINAL_JOB_STATUSES), Job.updated_at <= JobArchive.archived_at)
+    )
+
+
+def _archive_rows(db, jobs: list[Job]) -> list[JobArchive]:
+    ids = [job.id for job in jobs]
+    stages: dict[int, dict] = defaultdict(lambda: {"ingest": {}, "ocr": {}})
+    for job_id, state, n in db.execute(
+        select(JobItem.job_id, JobItem.state, func.count(JobItem.id))
+        .where(JobItem.job_id.in_(ids)).group_by(JobItem.job_id, JobItem.state)
+    ):
+        stages[job_id]["ingest"][state] = n
+    for job_id, state, n in db.execute(
+        select(JobItem.job_id, JobItem.ocr_state, func.count(JobItem.id))
+        .where(JobItem.job_id.in_(ids), JobItem.ocr_state.is_not(None)).group_by(JobItem.job_id, JobItem.ocr_state)
+    ):
+        stages[job_id]["ocr"][state] = n
+    totals = {
+        r.job_id: r
+        for r in db.execute(
+            select(
+                JobItem.job_id,
+                func.count(JobItem.id).label("items"),
+                func.count(JobItem.id).filter(_ITEM_FAILED).label("failed"),
+                func.min(JobItem.started_at).label("first_started_at"),
+                func.max(func.coalesce(JobItem.ocr_finished_at, JobItem.finished_at)).label("last_finished_at"),
+            ).where(JobItem.job_id.in_(ids)).group_by(JobItem.job_id)
+        )
+    }
+    failures: dict[int, list] = defaultdict(list)
+    for it in db.execute(
+        select(JobItem.job_id, JobItem.filename, JobItem.state, JobItem.detail, JobItem.ocr_detail)
+        .where(JobItem.job_id.in_(ids), _ITEM_FAILED).order_by(JobItem.job_id, JobItem.id)
+    ):
+        if len(failures[it.job_id]) < ARCHIVE_MAX_FAILURES:
+            ingest_failed = it.state in FAILED_STATES
+            detail = it.detail if ingest_failed else it.ocr_detail
+            failures[it.job_id].append({
+                "filename": it.filename,
+                "stage": "ingest" if ingest_failed else "ocr",
+                "detail": (detail or "")[:ARCHIVE_DETAIL_CHARS] or None,
+            })
+
+    now = datetime.utcnow()
+    rows = []
+    for job in jobs:
+        t = totals.get(job.id)
+        rows.append(JobArchive(
+            token=job.token,
+            job_id=job.id,
+            status=job.status,
+            priority=job.priority or "normal",
+            error=job.error,
+            rejected_summary=job.rejected_summary,
+            uploader_user_id=job.uploader_user_id,
+            uploader_username=job.uploader_username,
+            uploader_ip=job.uploader_ip,
+            created_at=job.created_at,
+            first_started_at=t.first_started_at if t else None,
+            last_finished_at=t.last_finished_at if t else None,
+            items=t.items if t else 0,
+            failed=t.failed if t else 0,
+            stages=json.dumps(stages[job.id]),
+            failures=json.dumps(failures[job.id]) if failures[job.id] else None,
+            archived_at=now,
+        ))
+    return rows
+
+
+def _archive_batch(cutoff: datetime, batch: int) -> int:
+    db = Session()
+    try:
+        jobs = db.scalars(_expired_jobs(cutoff).order_by(Job.id).limit(batch)).all()
+        if not jobs:
+            return 0
+        rows = _archive_rows(db, jobs)
+        # A job archived before and changed since (e.g. retried) gets a fresh summary
+        db.execute(
+            delete(JobArchive).where(JobArchive.token.in_([job.token for job in jobs]))
+            .execution_options(synchronize_session=False)
+        )
+        db.add_all(rows)
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+
+def _delete_items_batch(batch: int) -> int:
+    db = Session()
+    try:
+        ids = select(JobItem.id).where(JobItem.job_id.in_(_archived_job_ids())).limit(batch)
+        n = db.execute(
+            delete(JobItem).where(JobItem.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+def _delete_jobs_batch(batch: int) -> int:
+    db = Session()
+    try:
+        ids = (
+            select(Job.id)
+            .where(Job.id.in_(_archived_job_ids()), ~exists().where(JobItem.job_id == Job.id))
+            .limit(batch)
+        )
+        n = db.execute(
+            delete(Job).where(Job.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+def _batches(step, batch: int) -> int:
+    """Run `step(batch)` until it returns nothing; returns the total."""
+    total = 0
+    while True:
+        n = step(batch)
+        if not n:
+            return total
+        total += n
+        time.sleep(JOB_RETENTION_PAUSE_SECONDS)
+
+
+def purge_expired_jobs(days: int | None = None, batch: int | None = None, dry_run: bool = False) -> dict:
+    """
+    Archive finished jobs last changed more than `days` (JOB_RETENTION_DAYS) ago, then delete
+    their items and job rows, `batch` (JOB_RETENTION_BATCH) rows per transaction. With
+    `dry_run`, only count what would be archived. Only one run per process at a time; a
+    concurrent call returns immediately.
+    """
+    days = JOB_RETENTION_DAYS if days is None else days
+    batch = max(1, JOB_RETENTION_BATCH if batch is None else batch)
+    summary = {"archived": 0, "items_deleted": 0, "jobs_deleted": 0, "skipped": False}
+    if days <= 0 or not _run_lock.acquire(blocking=False):
+        summary["skipped"] = True
+        return summary
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        if dry_run:
+            db = Session()
+            try:
+                expired = _expired_jobs(cutoff).with_only_columns(Job.id)
+                summary["archived"] = db.scalar(select(func.count()).select_from(expired.subquery())) or 0
+                summary["items_deleted"] = db.scalar(
+                    select(func.count(JobItem.id)).where(or_(JobItem.job_id.in_(expired), JobItem.job_id.in_(_archived_job_ids())))
+                ) or 0
+                summary["jobs_deleted"] = summary["archived"] + (
+                    db.scalar(select(func.count()).select_from(_archived_job_ids().subquery())) or 0
+                )
+            finally:
+                db.close()
+            return summary
+        try:
+            summary["archived"] = _batches(lambda n: _archive_batch(cutoff, n), batch)
+        except IntegrityError:
+            # Another process archived the same jobs at the same moment; delete what is archived
+            print("Job retention: jobs archived concurrently by another process; continuing with deletes.")
+        summary["items_deleted"] = _batches(_delete_items_batch, batch)
+        summary["jobs_deleted"] = _batches(_delete_jobs_batch, batch)
+    finally:
+        _run_lock.release()
+    if summary["jobs_deleted"] or summary["archived"]:
+        print(f"Job retention: archived {summary['archived']} job(s) older than {days} day(s); "
+              f"deleted {summary['jobs_deleted']} job(s) and {summary['items_deleted']} item(s).")
+    return summary
+
+
+def _purge_in_background() -> None:
+    try:
+        purge_expired_jobs()
+    except Exception as e:
+        print(f"Job retention failed: {e}")
+
+
+def run_retention_if_due() -> bool:
+    """
+    Dispatcher hook: every JOB_RETENTION_INTERVAL_SECONDS start purge_expired_jobs() in a
+    background thread, so a long purge never holds up claiming. Returns whether one was started.
+    """
+    global _last_started
+    if JOB_RETENTION_DAYS <= 0 or _run_lock.locked():
+        return False
+    now = time.monotonic()
+    if _last_started is not None and now - _last_started < JOB_RETENTION_INTERVAL_SECONDS:
+        return False
+    _last_started = now
+    threading.Thread(target=_purge_in_background, name="job-retention", daemon=True).start()
+    return True
+
+
+def db_get_archived_job(job_token: str) -> dict | None:
+    """The archive summary of a deleted job, or None."""
+    db = Session()
+    try:
+        row = db.scalar(select(JobArchive).where(JobArchive.token == job_token))
+        if row is None:
+            return None
+        return {
+            "token": row.token,
+            "status": row.status,
+            "priority": row.priority,
+            "error": row.error,
+            "rejected_summary": row.rejected_summary,
+            "uploader_user_id": row.uploader_user_id,
+            "uploader_username": row.uploader_username,
+            "uploader_ip": row.uploader_ip,
+            "created_at": row.created_at.isoformat() + "Z" if row.created_at else None,
+            "first_started_at": row.first_started_at.isoformat() + "Z" if row.first_started_at else None,
+            "last_finished_at": row.last_finished_at.isoformat() + "Z" if row.last_finished_at else None,
+            "archived_at": row.archived_at.isoformat() + "Z" if row.archived_at else None,
+            "items": row.items,
+            "failed": row.failed,
+            "stages": json.loads(row.stages),
+            "failures": json.loads(row.failures) if row.failures else [],
+        }
+    finally:
+        db.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Archive and delete finished upload jobs past the retention period")
+    ap.add_argument("--days", type=int, default=None, help="Retention in days (default JOB_RETENTION_DAYS)")
+    ap.add_argument("--batch", type=int, default=None, help="Rows per transaction (default JOB_RETENTION_BATCH)")
+    ap.add_argument("--dry-run", action="store_true", help="Only count the jobs and items that would go")
+    args = ap.parse_args()
+    JobArchive.__table__.create(engine, checkfirst=True)
+    print(purge_expired_jobs(days=args.days, batch=args.batch, dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 # job_store.py
+import os
 import uuid
+from collections import Counter
 from datetime import datetime
 from typing import List, Optional
+from sqlalchemy import and_, func, or_, select, update
 from sqlalchemy.orm import Session as DBSession
+from job_events import notify_job_changed
 from models import Session, Job, JobItem
 
 def db_create_job(
@@ -12,12 +16,16 @@ def db_create_job(
     uploader_user_id: Optional[int] = None,
     uploader_username: Optional[str] = None,
     uploader_ip: Optional[str] = None,
+    priority: str = "normal",
+    status: str = "queued",
 ) -> str:
+    """Insert a job and one queued item per file; status DEFERRED holds it back from dispatch (job_admission.py)."""
     db: DBSession = Session()
     try:
         job = Job(
             token=uuid.uuid4().hex,
-            status="queued",
+            status=status,
+            priority=priority,
             rejected_summary="; ".join(rejected) if rejected else None,
             uploader_user_id=uploader_user_id,
             uploader_username=uploader_username,
@@ -42,49 +50,137 @@ def db_create_job(
     finally:
         db.close()
 
-def db_set_job_status(job_token: str, status: str, error: str | None = None) -> None:
+# An item failed if either stage failed ("error", or "dead" after exhausting its retries);
+# an ingest failure means there is no OCR stage. A cancelled stage is finished, not failed.
+FAILED_STATES = ("error", "dead")
+CANCELLED = "cancelled"
+# Accepted while the queue was over its admission limits; released to "queued" by the dispatcher
+DEFERRED = "deferred"
+# Direct uploads (direct_uploads/upload.py) are stored in one request and finish as "completed" or "error"
+COMPLETED = "completed"
+# Job statuses that no worker, finalizer or priority change touches again
+FINAL_JOB_STATUSES = ("done", "error", CANCELLED, COMPLETED)
+_ITEM_FAILED = or_(JobItem.state.in_(FAILED_STATES), JobItem.ocr_state.in_(FAILED_STATES))
+_ITEM_FINISHED = or_(
+    JobItem.state.in_(FAILED_STATES + (CANCELLED,)),
+    and_(
+        JobItem.state.in_(("ok", "ingested")),
+        or_(JobItem.ocr_state.is_(None), JobItem.ocr_state.in_(("ok", "skipped", CANCELLED) + FAILED_STATES)),
+    ),
+)
+
+def db_finalize_job(job_token: str) -> str | None:
+    """
+    Set the job to done/error once every item has finished both stages.
+    Returns the final status, or None while ingest or OCR work is still outstanding.
+    A cancelled job keeps its status.
+
+    Items of a job finish concurrently, and each finisher calls this after recording its
+    own item, so the last one always sees every item finished. The status UPDATE only
+    applies to an unfinished job, so concurrent finishers agree on a single result.
+    """
     db = Session()
     try:
         job = db.query(Job).filter_by(token=job_token).first()
         if not job:
-            return
-        job.status = status
-        if error:
-            job.error = error
-        db.add(job)
+            return None
+        if job.status in FINAL_JOB_STATUSES:
+            return job.status
+        unfinished, failed = db.query(
+            func.count(JobItem.id).filter(~_ITEM_FINISHED),
+            func.count(JobItem.id).filter(_ITEM_FAILED),
+        ).filter(JobItem.job_id == job.id).one()
+        if unfinished:
+            return None
+        values = {"status": "error", "error": "One or more files failed"} if failed else {"status": "done"}
+        values["version"] = Job.version + 1
+        won = db.execute(
+            update(Job).where(Job.id == job.id, Job.status.notin_(FINAL_JOB_STATUSES)).values(values)
+        ).rowcount
         db.commit()
+        if won:
+            notify_job_changed(job.id)
+        return db.query(Job.status).filter(Job.id == job.id).scalar()
     finally:
         db.close()
 
-def db_set_item_state(job_token: str, filename: str, state: str, detail: str | None = None) -> None:
+JOBS_PAGE_SIZE = int(os.getenv("JOBS_PAGE_SIZE", "50"))
+
+def encode_jobs_cursor(created_at: datetime, job_id: int) -> str:
+    return f"{created_at.isoformat()}_{job_id}"
+
+def decode_jobs_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    try:
+        created, _, job_id = (cursor or "").rpartition("_")
+        return datetime.fromisoformat(created), int(job_id)
+    except ValueError:
+        return None
+
+def db_list_jobs(
+    *,
+    limit: int = JOBS_PAGE_SIZE,
+    before: tuple[datetime, int] | None = None,
+    uploader: str | None = None,
+    status: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+) -> tuple[list, str | None]:
+    """
+    One page of jobs, newest first, with per-job item totals in a single grouped query:
+    `items`, `errors` (either stage), `finished` (both stages), `first_started_at`,
+    `last_finished_at`. Keyset pagination on (created_at, id): pass the returned cursor,
+    decoded, as `before` for the next page. Returns (rows, next_cursor or None).
+    """
+    conditions = []
+    if before is not None:
+        created, job_id = before
+        conditions.append(or_(Job.created_at < created, and_(Job.created_at == created, Job.id < job_id)))
+    if uploader:
+        conditions.append(Job.uploader_username == uploader)
+    if status:
+        conditions.append(Job.status == status)
+    if created_from:
+        conditions.append(Job.created_at >= created_from)
+    if created_to:
+        conditions.append(Job.created_at < created_to)
+
+    # The page of jobs first (an index range scan on created_at, id), then items of those jobs only
+    page = (
+        select(Job)
+        .where(*conditions)
+        .order_by(Job.created_at.desc(), Job.id.desc())
+        .limit(limit + 1)
+        .subquery()
+    )
+    q = (
+        select(
+            page,
+            func.count(JobItem.id).label("items"),
+            func.count(JobItem.id).filter(_ITEM_FAILED).label("errors"),
+            func.count(JobItem.id).filter(_ITEM_FINISHED).label("finished"),
+            func.min(JobItem.started_at).label("first_started_at"),
+            func.max(func.coalesce(JobItem.ocr_finished_at, JobItem.finished_at)).label("last_finished_at"),
+        )
+        .outerjoin(JobItem, JobItem.job_id == page.c.id)
+        .group_by(*page.c)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+    )
     db = Session()
     try:
-        job = db.query(Job).filter_by(token=job_token).first()
-        if not job:
-            return
-        item = db.query(JobItem).filter_by(job_id=job.id, filename=filename).first()
-        if not item:
-            return
-        now = datetime.utcnow()
-        if state == "processing":
-            item.started_at = now
-        if state in ("ok", "error"):
-            item.finished_at = now
-        item.state = state
-        if detail:
-            item.detail = detail
-        db.add(item)
-        db.commit()
+        rows = db.execute(q).all()
     finally:
         db.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_jobs_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
 
-def db_any_item_error(job_token: str) -> bool:
+def db_get_job_version(job_token: str) -> int | None:
+    """The job's change counter (one indexed lookup, no items loaded); None if unknown."""
     db = Session()
     try:
-        job = db.query(Job).filter_by(token=job_token).first()
-        if not job:
-            return True
-        return any(it.state == "error" for it in job.items)
+        return db.scalar(select(Job.version).where(Job.token == job_token))
     finally:
         db.close()
 
@@ -98,6 +194,8 @@ def db_get_job_payload(job_token: str) -> dict | None:
             "id": job.id,
             "token": job.token,
             "status": job.status,
+            "priority": job.priority,
+            "version": job.version,
             "error": job.error,
             "rejected_summary": job.rejected_summary,
             "uploader_user_id": job.uploader_user_id,
@@ -105,6 +203,11 @@ def db_get_job_payload(job_token: str) -> dict | None:
             "uploader_ip": job.uploader_ip,
             "created_at": job.created_at.isoformat() + "Z" if job.created_at else None,
             "updated_at": job.updated_at.isoformat() + "Z" if job.updated_at else None,
+            # Per-stage state counts, e.g. {"ingest": {"ingested": 3}, "ocr": {"ok": 1, "queued": 2}}
+            "stages": {
+                "ingest": dict(Counter(it.state for it in job.items)),
+                "ocr": dict(Counter(it.ocr_state for it in job.items if it.ocr_state)),
+            },
             "items": [
                 {
                     "id": it.id,
@@ -116,6 +219,13 @@ def db_get_job_payload(job_token: str) -> dict | None:
                     "uploader_ip": it.uploader_ip,
                     "started_at": it.started_at.isoformat() + "Z" if it.started_at else None,
                     "finished_at": it.finished_at.isoformat() + "Z" if it.finished_at else None,
+                    "ocr_state": it.ocr_state,
+                    "ocr_detail": it.ocr_detail,
+                    "ocr_started_at": it.ocr_started_at.isoformat() + "Z" if it.ocr_started_at else None,
+                    "ocr_finished_at": it.ocr_finished_at.isoformat() + "Z" if it.ocr_finished_at else None,
+                    "attempts": it.attempts,
+                    "ocr_attempts": it.ocr_attempts,
+                    "retry_at": it.retry_at.isoformat() + "Z" if it.retry_at else None,
                 }
                 for it in job.items
             ],
@@ -1,51 +1,248 @@
 # jobs/routes.py
-from flask import jsonify, render_template
+import json
+import shutil
+import time
+from datetime import date, datetime, timedelta
+
+from flask import Response, jsonify, render_template, redirect, url_for, flash
 from flask import current_app
 from flask import request
+from flask_login import current_user
 from auth.roles import roles_required
-from job_store import db_get_job_payload
-from models import Session, Job, JobItem  # <-- add this import
+from job_events import JOB_EVENTS_MAX_SECONDS, JOB_EVENTS_POLL_SECONDS, job_generation, wait_for_job_change
+from job_store import (
+    COMPLETED, FINAL_JOB_STATUSES, JOBS_PAGE_SIZE, db_create_job, db_get_job_payload, db_get_job_version, db_list_jobs,
+    decode_jobs_cursor,
+)
+from job_retention import db_get_archived_job
+from job_queue import JOB_PRIORITIES, cancel_job, queue_wait_stats, retry_failed_items, set_job_priority
+from models import PROCESSING_ERROR_DIR, UPLOAD_DIR
+from worker import queue_job
 
 
 from . import jobs_bp
 
-@jobs_bp.route("/", methods=["GET"])
-def list_recent_jobs():
-    db = Session()
+# Queued uploads, then direct uploads (same table, listed alongside)
+JOB_STATUSES = ("deferred", "queued", "processing", "done", "error", "cancelled", COMPLETED)
+
+def _parse_day(value: str | None) -> date | None:
     try:
-        jobs = (
-            db.query(Job)
-            .order_by(Job.created_at.desc())
-            .limit(100)
-            .all()
-        )
-        # Compute rejected counts per job (any item with error state)
-        rejections = {}
-        for j in jobs:
-            cnt = (
-                db.query(JobItem)
-                .filter(JobItem.job_id == j.id)
-                .filter(JobItem.state == "error")
-                .count()
-            )
-            rejections[j.id] = cnt
-        return render_template("jobs/jobs_list.html", jobs=jobs, rejections=rejections)
-    finally:
-        db.close()
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
 
+@jobs_bp.route("/", methods=["GET"])
+def list_recent_jobs():
+    # Filters and keyset cursor come from the query string; links keep the filters
+    uploader = (request.args.get("uploader") or "").strip() or None
+    status = request.args.get("status") if request.args.get("status") in JOB_STATUSES else None
+    day_from = _parse_day(request.args.get("from"))
+    day_to = _parse_day(request.args.get("to"))
+    limit = min(max(request.args.get("limit", default=JOBS_PAGE_SIZE, type=int), 1), 200)
+    jobs, next_cursor = db_list_jobs(
+        limit=limit,
+        before=decode_jobs_cursor(request.args.get("before")),
+        uploader=uploader,
+        status=status,
+        created_from=datetime.combine(day_from, datetime.min.time()) if day_from else None,
+        created_to=datetime.combine(day_to + timedelta(days=1), datetime.min.time()) if day_to else None,
+    )
+    filters = {k: v for k, v in {
+        "uploader": uploader, "status": status,
+        "from": day_from.isoformat() if day_from else None, "to": day_to.isoformat() if day_to else None,
+    }.items() if v}
+    return render_template(
+        "jobs/jobs_list.html",
+        jobs=jobs,
+        filters=filters,
+        statuses=JOB_STATUSES,
+        next_cursor=next_cursor,
+        is_first_page=not request.args.get("before"),
+        priorities=JOB_PRIORITIES,
+        wait_stats=queue_wait_stats(),
+        can_reprioritize=current_user.is_authenticated and current_user.has_role("admin"),
+    )
 
+def _job_etag(job_token: str, version: int) -> str:
+    return f"{job_token}-{version}"
 
 @jobs_bp.route("/<job_token>", methods=["GET"])
 @roles_required("admin")
 def job_status_json(job_token: str):
+    # Unchanged since the client's copy: 304 after one version lookup, without loading items
+    version = db_get_job_version(job_token)
+    if version is not None and request.if_none_match.contains(_job_etag(job_token, version)):
+        resp = Response(status=304)
+        resp.set_etag(_job_etag(job_token, version))
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
     payload = db_get_job_payload(job_token)
     if not payload:
+        # Past the retention period only the archive summary is left
+        archived = db_get_archived_job(job_token)
+        if archived:
+            return jsonify({"error": "job archived", "archive": archived}), 410
         return jsonify({"error": "job not found"}), 404
-    return jsonify(payload)
+    resp = jsonify(payload)
+    resp.set_etag(_job_etag(job_token, payload["version"]))
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def _sse(event: str, data: dict, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _job_event_stream(job_token: str):
+    """
+    Yield the job as SSE: first every item, then only items that changed. The payload is
+    rebuilt only when the job's version moved; otherwise the stream sleeps until a writer in
+    this process notifies it, or checks the version every JOB_EVENTS_POLL_SECONDS.
+    """
+    deadline = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+    yield f"retry: {int(JOB_EVENTS_POLL_SECONDS * 1000)}\n\n"
+    version = None
+    items: dict = {}
+    job_id = None
+    generation = 0
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        current = db_get_job_version(job_token)
+        if current is None:
+            yield _sse("gone", {"token": job_token})
+            return
+        if current != version:
+            payload = db_get_job_payload(job_token)
+            if payload is None:
+                yield _sse("gone", {"token": job_token})
+                return
+            if job_id is None:
+                job_id = payload["id"]
+                generation = job_generation(job_id)
+            version = payload["version"]
+            changed = [it for it in payload["items"] if items.get(it["id"]) != it]
+            items = {it["id"]: it for it in payload["items"]}
+            job = {k: v for k, v in payload.items() if k != "items"}
+            yield _sse("job", {"job": job, "items": changed}, event_id=version)
+            last_sent = time.monotonic()
+            # A cancelled job is final at once, but its running items still report how they stopped
+            running = any("processing" in (it["state"], it["ocr_state"]) for it in items.values())
+            if job["status"] in FINAL_JOB_STATUSES and not running:
+                yield _sse("end", {"status": job["status"]})
+                return
+        elif time.monotonic() - last_sent >= 15:
+            yield ": keepalive\n\n"  # keeps proxies from closing an idle stream
+            last_sent = time.monotonic()
+        generation = wait_for_job_change(job_id, generation)
+
+@jobs_bp.route("/<job_token>/events", methods=["GET"])
+@roles_required("admin")
+def job_events(job_token: str):
+    if db_get_job_version(job_token) is None:
+        return jsonify({"error": "job not found"}), 404
+    return Response(
+        _job_event_stream(job_token),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @jobs_bp.route("/<job_token>/view", methods=["GET"])
 @roles_required("admin")
 def job_status_page(job_token: str):
     # simple HTML page that polls <token> JSON
+    if db_get_job_version(job_token) is None:
+        archived = db_get_archived_job(job_token)
+        if archived:
+            return render_template("jobs/job_archived.html", job_id=job_token, archive=archived)
     return render_template("jobs/job_status.html", job_id=job_token)
 
+@jobs_bp.route("/<job_token>/cancel", methods=["POST"])
+@roles_required("admin")
+def cancel(job_token: str):
+    dropped = cancel_job(job_token)
+    if dropped is None:
+        flash("Job not found or already finished.", "warning")
+        return redirect(url_for("jobs.job_status_page", job_token=job_token))
+    # ZIPs that were never started leave the upload folder like failed ones, so they can be re-submitted
+    PROCESSING_ERROR_DIR.mkdir(parents=True, exist_ok=True)
+    for name in dropped:
+        src = UPLOAD_DIR / name
+        if src.exists() and not (PROCESSING_ERROR_DIR / name).exists():
+            shutil.move(str(src), str(PROCESSING_ERROR_DIR / name))
+    flash(f"Job {job_token[:8]} cancelled: {len(dropped)} queued ZIP(s) dropped; running items stop shortly.", "info")
+    return redirect(url_for("jobs.job_status_page", job_token=job_token))
+
+@jobs_bp.route("/queue-stats", methods=["GET"])
+@roles_required("admin")
+def queue_stats_json():
+    hours = request.args.get("hours", default=24, type=int)
+    return jsonify(queue_wait_stats(hours=max(1, hours)))
+
+@jobs_bp.route("/<job_token>/priority", methods=["POST"])
+@roles_required("admin")
+def set_priority(job_token: str):
+    priority = request.form.get("priority", "")
+    if priority not in JOB_PRIORITIES:
+        flash("Unknown priority.", "danger")
+    elif set_job_priority(job_token, priority):
+        flash(f"Job {job_token[:8]} set to {priority}.", "success")
+    else:
+        flash("Job not found or already finished.", "warning")
+    return redirect(url_for("jobs.list_recent_jobs"))
+
+@jobs_bp.route("/retry", methods=["POST"])
+@roles_required("admin")
+def retry_jobs():
+    tokens = request.form.getlist("job_token")
+    n = retry_failed_items(tokens) if tokens else 0
+    if n:
+        dispatcher = current_app.config.get("JOB_DISPATCHER")
+        if dispatcher is not None:
+            dispatcher.wake()
+        flash(f"Requeued {n} failed item stage(s) from {len(tokens)} job(s).", "success")
+    else:
+        flash("No failed items in the selected jobs.", "warning")
+    return redirect(request.referrer or url_for("jobs.list_recent_jobs"))
+
+def _processing_error_zips() -> list[dict]:
+    if not PROCESSING_ERROR_DIR.exists():
+        return []
+    files = []
+    for p in PROCESSING_ERROR_DIR.iterdir():
+        if p.is_file() and p.suffix.lower() == ".zip":
+            st = p.stat()
+            files.append({"name": p.name, "size": st.st_size, "modified": datetime.utcfromtimestamp(st.st_mtime)})
+    return sorted(files, key=lambda f: f["modified"], reverse=True)
+
+@jobs_bp.route("/processing-errors", methods=["GET"])
+@roles_required("admin")
+def processing_errors():
+    return render_template("jobs/processing_errors.html", files=_processing_error_zips())
+
+@jobs_bp.route("/processing-errors/retry", methods=["POST"])
+@roles_required("admin")
+def retry_processing_errors():
+    """Move the selected ZIPs back to the upload folder and queue them as a new job."""
+    available = {f["name"] for f in _processing_error_zips()}
+    names, skipped = [], []
+    for name in request.form.getlist("filename"):
+        if name not in available:
+            continue  # only names listed from PROCESSING_ERROR_DIR, never a path from the form
+        if (UPLOAD_DIR / name).exists():
+            skipped.append(name)
+            continue
+        shutil.move(str(PROCESSING_ERROR_DIR / name), str(UPLOAD_DIR / name))
+        names.append(name)
+    if not names:
+        flash("Nothing to retry" + (f"; already in the upload folder: {', '.join(skipped)}" if skipped else "."), "warning")
+        return redirect(url_for("jobs.processing_errors"))
+    xff = (request.headers.get("X-Forwarded-For") or "").split(",")[0].strip()
+    job_token = db_create_job(
+        names,
+        [f"{n} (already in the upload folder)" for n in skipped],
+        uploader_user_id=getattr(current_user, "id", None),
+        uploader_username=getattr(current_user, "username", None),
+        uploader_ip=xff or (request.remote_addr or "-"),
+    )
+    queue_job(current_app, job_token, [UPLOAD_DIR / n for n in names])
+    flash(f"Queued {len(names)} ZIP(s) from {PROCESSING_ERROR_DIR.name} for another attempt.", "info")
+    return redirect(url_for("jobs.job_status_page", job_token=job_token))
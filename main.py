@@ -6,6 +6,7 @@ import re
 import shutil
 from pathlib import Path
 from datetime import datetime, date as _date
+from typing import Callable
 from dotenv import load_dotenv  
 load_dotenv()
 
@@ -41,6 +42,11 @@ class MaliciousZipError(Exception):
     pass
 
 
+class ProcessingCancelled(Exception):
+    """Raised when `should_stop` asks a running ingest to stop (job cancelled)."""
+    pass
+
+
 def _sniff_member_type(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
     """Best-effort magic-bytes sniffing.
     Returns one of: 'pdf', 'jpg', 'pe', 'elf', 'zip', 'script', 'unknown'.
@@ -131,10 +137,13 @@ def daily_dup_dir() -> Path:
 
 
 # --- Main Processing Logic ---
-def process_zip_file(zip_path: Path, session) -> list[str]:
+def process_zip_file(zip_path: Path, session, should_stop: Callable[[], bool] | None = None) -> list[str]:
     """
     Processes a single ZIP file, extracts metadata, and organizes files.
     Ensures the ZIP file is CLOSED before attempting to move it.
+    `should_stop` is checked between members; when it returns True the files extracted so far
+    are removed, nothing is committed, the ZIP goes to the error folder and ProcessingCancelled
+    is raised.
     """
     def safe_move(src: Path, dst: Path, attempts: int = 5):
         # Small retry helper for Windows lock shenanigans
@@ -168,7 +177,9 @@ def process_zip_file(zip_path: Path, session) -> list[str]:
 
     success = False  # track outcome to decide where to move the ZIP
     deleted_zip = False  # if we delete due to disallowed content, skip any move
+    cancelled = False
     added_pdf_filenames: list[str] = []
+    extracted_paths: list[Path] = []  # files this call created; removed again when cancelled
     error_message = ""
 
     try:
@@ -398,6 +409,9 @@ def process_zip_file(zip_path: Path, session) -> list[str]:
                 if member_info.is_dir() or not str(Path(member_info.filename)).startswith(str(dir_in_zip)):
                     continue
 
+                if should_stop is not None and should_stop():
+                    raise ProcessingCancelled(f"Cancelled after extracting {len(files_to_add)} file(s)")
+
                 original_filepath = Path(member_info.filename)
                 ext = original_filepath.suffix.lower()
                 new_filename = f"{patient_id}_{name.replace(' ', '_')}_{capture_date}_{original_filepath.name.replace('/', '_')}"
@@ -412,6 +426,8 @@ def process_zip_file(zip_path: Path, session) -> list[str]:
                     continue
 
                 target_path = dest_dir / new_filename
+                if not target_path.exists():
+                    extracted_paths.append(target_path)
                 # Ensure both source and target are closed promptly
                 with zf.open(member_info) as source, open(target_path, "wb") as target:
                     shutil.copyfileobj(source, target)
@@ -437,6 +453,12 @@ def process_zip_file(zip_path: Path, session) -> list[str]:
         error_message = str(e)
         # Treat structural/format errors as hard failures for job items
         raise
+    except ProcessingCancelled as e:
+        print(f"Stopped processing '{zip_path.name}': {e}")
+        session.rollback()
+        cancelled = True
+        error_message = str(e)
+        raise
     except MaliciousZipError as e:
         # Propagate to caller so /jobs item shows explicit rejection reason
         print(f"Rejected malicious ZIP '{zip_path.name}': {e}")
@@ -452,6 +474,13 @@ def process_zip_file(zip_path: Path, session) -> list[str]:
         error_message = str(e)
         raise
     finally:
+        if cancelled:
+            # Rows were rolled back: the files extracted so far would be orphans
+            for path in extracted_paths:
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError as e:
+                    print(f"  Could not remove partial file '{path.name}': {e}")
         try:
             if deleted_zip:
                 # Already deleted due to disallowed content; nothing to move
@@ -463,7 +492,7 @@ def process_zip_file(zip_path: Path, session) -> list[str]:
             else:
                 safe_move(zip_path, PROCESSING_ERROR_DIR / zip_path.name)
                 print(f"Moved '{zip_path.name}' to error directory.")
-                log_status(zip_path.name, "ERROR", error_message or "")
+                log_status(zip_path.name, "CANCELLED" if cancelled else "ERROR", error_message or "")
         except PermissionError as pe:
             # If it’s still locked by some external process, surface a clear message
             print(f"Final move failed for '{zip_path.name}' due to a lock: {pe}. "
@@ -85,7 +85,11 @@ class DiabeticRetinopathyReport(Base):
     result: Mapped[str]
     qualitative_result: Mapped[str | None] = mapped_column(nullable=True)
     report_file_name: Mapped[str | None] = mapped_column(nullable=True)
+    # Source PDF + 1-based page of the report, so the page can be served without a split copy
+    source_file_id: Mapped[int | None] = mapped_column(ForeignKey('encounter_files.id'), nullable=True, index=True)
+    page_number: Mapped[int | None] = mapped_column(Integer, nullable=True)
     patient_encounter: Mapped["PatientEncounters"] = relationship(back_populates="dr_reports")
+    source_file: Mapped["EncounterFile | None"] = relationship("EncounterFile")
 
 class GlaucomaReport(Base):
     __tablename__ = 'glaucoma_reports'
@@ -97,7 +101,11 @@ class GlaucomaReport(Base):
     result: Mapped[str]
     qualitative_result: Mapped[str | None] = mapped_column(nullable=True)
     report_file_name: Mapped[str | None] = mapped_column(nullable=True)
+    # Source PDF + 1-based page of the report, so the page can be served without a split copy
+    source_file_id: Mapped[int | None] = mapped_column(ForeignKey('encounter_files.id'), nullable=True, index=True)
+    page_number: Mapped[int | None] = mapped_column(Integer, nullable=True)
     patient_encounter: Mapped["PatientEncounters"] = relationship(back_populates="glaucoma_reports")
+    source_file: Mapped["EncounterFile | None"] = relationship("EncounterFile")
 
 class GlaucomaResultsCleaned(Base):
     __tablename__ = 'glaucoma_results_cleaned'
@@ -117,6 +125,65 @@ class GlaucomaResultsCleaned(Base):
     patient_encounter: Mapped["PatientEncounters"] = relationship("PatientEncounters")
     glaucoma_report: Mapped["GlaucomaReport"] = relationship("GlaucomaReport")
 
+class EncounterFileTextIndex(Base):
+    """One row per PDF whose page text is in the `encounter_file_text` FTS5 table (see text_index.py)."""
+    __tablename__ = 'encounter_file_text_index'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    encounter_file_id: Mapped[int] = mapped_column(ForeignKey('encounter_files.id', ondelete="CASCADE"), unique=True, index=True)
+    page_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    pages_ocr: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # pages read by OCR (no text layer)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    indexed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False)
+    encounter_file: Mapped["EncounterFile"] = relationship("EncounterFile")
+
+class ReocrCampaign(Base):
+    """A re-OCR run over a selected subset of PDFs; results go to ReocrResult, not the live reports."""
+    __tablename__ = 'reocr_campaigns'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(150), nullable=False)
+    template_version: Mapped[str] = mapped_column(String(32), nullable=False)
+    filters: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON of the selection criteria
+    status: Mapped[str] = mapped_column(String(16), default="running", nullable=False)  # running|done|applied
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_by: Mapped[str | None] = mapped_column(String(150), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    applied_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    results: Mapped[List["ReocrResult"]] = relationship(back_populates="campaign", cascade="all, delete-orphan")
+
+class ReocrResult(Base):
+    """Shadow extraction of one PDF in a ReocrCampaign (cleaned like the live report fields)."""
+    __tablename__ = 'reocr_results'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    campaign_id: Mapped[int] = mapped_column(ForeignKey('reocr_campaigns.id'), index=True)
+    encounter_file_id: Mapped[int] = mapped_column(ForeignKey('encounter_files.id'), index=True)
+    patient_encounter_id: Mapped[int] = mapped_column(ForeignKey('patient_encounters.id'), index=True)
+    dr_page: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    dr_result: Mapped[str | None] = mapped_column(Text, nullable=True)
+    dr_qual: Mapped[str | None] = mapped_column(Text, nullable=True)
+    gl_page: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    gl_result: Mapped[str | None] = mapped_column(Text, nullable=True)
+    vcdr_right: Mapped[str | None] = mapped_column(Text, nullable=True)
+    vcdr_left: Mapped[str | None] = mapped_column(Text, nullable=True)
+    gl_qual: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    applied: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
+    campaign: Mapped["ReocrCampaign"] = relationship(back_populates="results")
+    __table_args__ = (UniqueConstraint('campaign_id', 'encounter_file_id', name='uq_reocr_results_campaign_file'),)
+
+class ReportPageStat(Base):
+    """How often a DR / Glaucoma report page was found at a page index, per PDF page count (template proxy)."""
+    __tablename__ = 'report_page_stats'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    page_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    report_type: Mapped[str] = mapped_column(String(16), nullable=False)
+    page_number: Mapped[int] = mapped_column(Integer, nullable=False)
+    hits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False)
+    __table_args__ = (UniqueConstraint('page_count', 'report_type', 'page_number', name='uq_report_page_stats_key'),)
+
 class ImageGrading(Base):
     __tablename__ = 'image_gradings'
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -135,9 +202,19 @@ class ImageGrading(Base):
 
 class Job(Base):
     __tablename__ = "jobs"
+    # Jobs list: newest first, optionally by status or uploader (keyset pagination on created_at, id)
+    __table_args__ = (
+        Index("ix_jobs_created_id", "created_at", "id"),
+        Index("ix_jobs_status_created", "status", "created_at"),
+        Index("ix_jobs_uploader_created", "uploader_username", "created_at"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     token: Mapped[str] = mapped_column(unique=True)
     status: Mapped[str] = mapped_column(default="queued")
+    # Dispatch class (job_queue.JOB_PRIORITIES): urgent, normal, backfill
+    priority: Mapped[str] = mapped_column(String(16), default="normal", server_default="normal", index=True)
+    # Bumped on every change to the job or its items (job_events.py); ETag of the status endpoints
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     rejected_summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -149,6 +226,14 @@ class Job(Base):
 
 class JobItem(Base):
     __tablename__ = "job_items"
+    __table_args__ = (
+        Index("ix_job_items_job_state", "job_id", "state"),
+        Index("ix_job_items_job_ocr_state", "job_id", "ocr_state"),
+        Index("ix_job_items_job_filename", "job_id", "filename"),
+        # Recent throughput per stage (job_admission.queue_load)
+        Index("ix_job_items_finished_at", "finished_at"),
+        Index("ix_job_items_ocr_finished_at", "ocr_finished_at"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     job_id: Mapped[int] = mapped_column(ForeignKey("jobs.id"), index=True)
     filename: Mapped[str]
@@ -156,11 +241,56 @@ class JobItem(Base):
     detail: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # OCR stage, run on its own queue after ingest: None (not reached), queued, processing, ok, error, skipped
+    ocr_state: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    ocr_detail: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    ocr_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    ocr_finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # PDFs produced by ingest (JSON list), OCR'd by the OCR stage
+    ocr_pdfs: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Durable queue lease (job_queue.py): set while a worker runs the item's current stage
+    lease_owner: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
+    # Runs of each stage so far; transient failures are retried with backoff until JOB_MAX_ATTEMPTS
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    ocr_attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # A retried item is not claimed before this time (exponential backoff)
+    retry_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
     uploader_user_id: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
     uploader_username: Mapped[str | None] = mapped_column(String(150), nullable=True, index=True)
     uploader_ip: Mapped[str | None] = mapped_column(String(64), nullable=True)
     job: Mapped["Job"] = relationship(back_populates="items")
 
+class JobArchive(Base):
+    """Summary of a finished job whose `jobs` / `job_items` rows were removed by the retention policy (job_retention.py)."""
+    __tablename__ = "job_archive"
+    __table_args__ = (
+        Index("ix_job_archive_created", "created_at"),
+        Index("ix_job_archive_uploader_created", "uploader_username", "created_at"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    # Links the summary to the job while its rows are being deleted; job ids may be reused afterwards
+    token: Mapped[str] = mapped_column(String(64), unique=True)
+    job_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    priority: Mapped[str] = mapped_column(String(16), nullable=False)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    rejected_summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    uploader_user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    uploader_username: Mapped[str | None] = mapped_column(String(150), nullable=True)
+    uploader_ip: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    first_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    items: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Per-stage state counts (JSON), e.g. {"ingest": {"ingested": 3}, "ocr": {"ok": 2, "skipped": 1}}
+    stages: Mapped[str] = mapped_column(Text, nullable=False)
+    # First failed items (JSON list of {"filename", "stage", "detail"}), details shortened
+    failures: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Set when archived; a job changed after this (e.g. retried) is archived again, not deleted
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
 class User(Base):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -0,0 +1,192 @@
+# ocr_cache.py
+# Persistent cache of OCR region reads, keyed by
+# (PDF SHA-256, page, region coords, DPI, engine version), so re-OCR of the same
+# content (reset, re-upload under a new ZIP name, re-OCR campaign) skips
+# rendering and Tesseract. Stored in its own SQLite file (stdlib sqlite3, WAL)
+# so sandboxed/pool worker processes can share it without the app's ORM.
+#
+# CLI:
+#   python ocr_cache.py --stats
+#   python ocr_cache.py --clear
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# --- OCR cache from .env ---
+OCR_CACHE_ENABLED = str(os.getenv("OCR_CACHE", "true")).lower() in ("1", "true", "yes")
+OCR_CACHE_PATH = BASE_DIR / os.getenv("OCR_CACHE_PATH", "files/ocr_cache.db")
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "200000"))
+
+# Eviction runs every EVICT_EVERY inserts, trimming least recently used rows down to the cap.
+# Inserts are counted by the table's rowid, not per OcrCache, since each sandboxed PDF
+# runs in a fresh process that only writes a few dozen rows.
+EVICT_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_regions (
+    pdf_sha256 TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    coords TEXT NOT NULL,
+    dpi INTEGER NOT NULL,
+    engine TEXT NOT NULL,
+    text TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (pdf_sha256, page, coords, dpi, engine)
+);
+CREATE INDEX IF NOT EXISTS ix_ocr_regions_last_used ON ocr_regions (last_used_at);
+"""
+
+
+def file_sha256(path: str | Path, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class OcrCache:
+    """Region-level OCR cache. One SQLite connection per thread; safe across processes."""
+
+    def __init__(self, path: Path = OCR_CACHE_PATH, max_entries: int = OCR_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(pdf_sha256: str, page: int, coords, dpi: int, engine: str) -> tuple:
+        return (pdf_sha256, int(page), ",".join(str(int(c)) for c in coords), int(dpi), engine)
+
+    def get(self, pdf_sha256: str, page: int, coords, dpi: int, engine: str) -> tuple[str, float] | None:
+        key = self._key(pdf_sha256, page, coords, dpi, engine)
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT text, confidence FROM ocr_regions "
+                "WHERE pdf_sha256=? AND page=? AND coords=? AND dpi=? AND engine=?", key,
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE ocr_regions SET hits = hits + 1, last_used_at = ? "
+                    "WHERE pdf_sha256=? AND page=? AND coords=? AND dpi=? AND engine=?", (time.time(), *key),
+                )
+        except sqlite3.Error as e:
+            print(f"OCR cache read failed: {e}")
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return (row[0], float(row[1])) if row is not None else None
+
+    def put(self, pdf_sha256: str, page: int, coords, dpi: int, engine: str, text: str, confidence: float) -> None:
+        key = self._key(pdf_sha256, page, coords, dpi, engine)
+        now = time.time()
+        try:
+            cur = self._conn().execute(
+                "INSERT OR REPLACE INTO ocr_regions "
+                "(pdf_sha256, page, coords, dpi, engine, text, confidence, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)", (*key, text, float(confidence), now, now),
+            )
+        except sqlite3.Error as e:
+            print(f"OCR cache write failed: {e}")
+            return
+        # Every write (REPLACE too) takes the next rowid, whichever process makes it
+        if cur.lastrowid and cur.lastrowid % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used rows beyond max_entries; returns rows removed."""
+        try:
+            cur = self._conn().execute(
+                "DELETE FROM ocr_regions WHERE rowid IN ("
+                " SELECT rowid FROM ocr_regions ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            return cur.rowcount
+        except sqlite3.Error as e:
+            print(f"OCR cache eviction failed: {e}")
+            return 0
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        entries, total_hits, pdfs = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0), COUNT(DISTINCT pdf_sha256) FROM ocr_regions"
+        ).fetchone()
+        size = sum(p.stat().st_size for p in self.path.parent.glob(self.path.name + "*") if p.is_file())
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "pdfs": pdfs,
+            "lifetime_hits": total_hits,
+            "size_bytes": size,
+            "session_hits": self.hits,
+            "session_misses": self.misses,
+        }
+
+    def clear(self) -> int:
+        cur = self._conn().execute("DELETE FROM ocr_regions")
+        self._conn().execute("VACUUM")
+        return cur.rowcount
+
+
+_cache: OcrCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OcrCache | None:
+    """Process-wide cache, or None when disabled via OCR_CACHE."""
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = OcrCache()
+        return _cache
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Inspect or clear the OCR region cache")
+    ap.add_argument("--stats", action="store_true", help="Print cache statistics")
+    ap.add_argument("--clear", action="store_true", help="Delete all cached OCR reads")
+    args = ap.parse_args()
+    cache = OcrCache()
+    if args.clear:
+        print(f"Removed {cache.clear()} cached region(s).")
+    if args.stats or not args.clear:
+        for k, v in cache.stats().items():
+            print(f"{k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,231 @@
 # ocr_extraction.py
 # uses PyMuPDF  PIL,  pytesseract  matplotlib
+import hashlib
+import os
+import re
+from functools import lru_cache
 import fitz  # PyMuPDF 
 from PIL import Image
 import pytesseract
 import io
 import matplotlib.pyplot as plt  # Import matplotlib
 
-def find_report_pages_by_coords_with_grid(pdf_path):
+from page_classifier import (
+    PAGE_TYPE_DR, PAGE_TYPE_GLAUCOMA, PAGE_TYPE_OTHER, get_classifier, header_vector, use_classifier,
+)
+from ocr_cache import file_sha256, get_ocr_cache
+
+# Region coordinates below are measured on pages rendered at BASE_DPI
+BASE_DPI = 300
+
+DIABETIC_REPORT_COORDS = (0, 200, 1200, 400)
+DIABETIC_RESULT_COORDS = (350, 650, 2000, 800)
+DIABETIC_QUAL_COORDS = (50, 3100, 1600, 3200)
+
+GLAUCOMA_REPORT_COORDS = (0, 400, 1200, 600)
+GLAUCOMA_RESULT_COORDS = (0, 1550, 2000, 1650)
+GLAUCOMA_VCDR_RT_COORDS = (0, 1300, 1000, 1500)
+GLAUCOMA_VCDR_LT_COORDS = (1300, 1300, 2200, 1500)
+GLAUCOMA_QUAL_COORDS = (50, 3100, 1700, 3200)
+
+# --- Adaptive DPI from .env ---
+# Each region is OCR'd at the lowest tier first and only re-rendered at the
+# next tier when word confidence is low or the region's pattern check fails.
+DEFAULT_DPI_TIERS = (150, 300)
+
+
+def _parse_dpi_tiers(spec: str | None) -> tuple[int, ...]:
+    """Ascending, distinct, positive DPIs from "150,300"; the default tiers when none is valid."""
+    tiers = set()
+    for part in (spec or "").split(","):
+        try:
+            dpi = int(part.strip())
+        except ValueError:
+            continue
+        if dpi > 0:
+            tiers.add(dpi)
+    if not tiers:
+        if (spec or "").strip():
+            print(f"Ignoring invalid OCR_DPI_TIERS={spec!r}; using {','.join(map(str, DEFAULT_DPI_TIERS))}")
+        return DEFAULT_DPI_TIERS
+    return tuple(sorted(tiers))
+
+
+OCR_DPI_TIERS = _parse_dpi_tiers(os.getenv("OCR_DPI_TIERS"))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "60"))
+
+VCDR_PATTERN = re.compile(r"\d\s*[.,]\s*\d")
+
+
+def template_version() -> str:
+    """Short hash of the region coordinates and DPI settings; changes whenever the extraction template does."""
+    template = (
+        BASE_DPI,
+        DIABETIC_REPORT_COORDS, DIABETIC_RESULT_COORDS, DIABETIC_QUAL_COORDS,
+        GLAUCOMA_REPORT_COORDS, GLAUCOMA_RESULT_COORDS, GLAUCOMA_VCDR_RT_COORDS,
+        GLAUCOMA_VCDR_LT_COORDS, GLAUCOMA_QUAL_COORDS,
+        OCR_DPI_TIERS, OCR_MIN_CONFIDENCE,
+    )
+    return hashlib.sha1(repr(template).encode()).hexdigest()[:12]
+
+
+# Tesseract version handed over by the parent process (adopt_warm_state), so a child skips the probe
+_warm_engine: str | None = None
+
+
+@lru_cache(maxsize=1)
+def _probe_engine_version() -> str | None:
+    try:
+        return f"tesseract-{pytesseract.get_tesseract_version()}"
+    except Exception:
+        return None
+
+
+def _engine_version() -> str | None:
+    """Part of the OCR cache key: reads from another Tesseract version are not reused."""
+    return _warm_engine or _probe_engine_version()
+
+
+def warm_state() -> dict:
+    """
+    This process's OCR start-up state (Tesseract version, loaded header templates), for
+    adopt_warm_state() in sandboxed and pool child processes. Probed and loaded once; templates
+    learned by earlier children since are picked up.
+    """
+    classifier = get_classifier()
+    if classifier is not None:
+        classifier.refresh()
+    return {"engine": _engine_version(), "classifier": classifier}
+
+
+def adopt_warm_state(state: dict) -> None:
+    """Child process initializer: use the parent's warm_state() instead of probing Tesseract and reading templates again."""
+    global _warm_engine
+    _warm_engine = state.get("engine")
+    if state.get("classifier") is not None:
+        use_classifier(state["classifier"])
+
+
+class _PageRenderer:
+    """Renders a single page lazily, at most once per DPI tier.
+
+    With `cache_key` = (pdf_sha256, page_index, engine) region reads go through the OCR cache,
+    so a cached region never triggers a render.
+    """
+
+    def __init__(self, page, cache=None, cache_key: tuple | None = None):
+        self.page = page
+        self.cache = cache if cache_key else None
+        self.cache_key = cache_key
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.renders = 0
+        self.engine_calls = 0
+        self._images: dict[int, Image.Image] = {}
+
+    def at(self, dpi: int) -> Image.Image:
+        if dpi not in self._images:
+            self.renders += 1
+            pix = self.page.get_pixmap(dpi=dpi)
+            self._images[dpi] = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        return self._images[dpi]
+
+
+def _scale_coords(coords: tuple[int, int, int, int], dpi: int) -> tuple[int, int, int, int]:
+    factor = dpi / BASE_DPI
+    return tuple(int(round(c * factor)) for c in coords)
+
+
+def _ocr_region(image: Image.Image, coords: tuple[int, int, int, int], dpi: int) -> tuple[str, float]:
+    """
+    OCR one region of a page image rendered at `dpi`.
+    Returns (text, mean word confidence); confidence is -1 when no words were read.
+    """
+    region = image.crop(_scale_coords(coords, dpi))
+    data = pytesseract.image_to_data(region, output_type=pytesseract.Output.DICT)
+    lines: dict[tuple[int, int, int], list[str]] = {}
+    confs: list[float] = []
+    for i, word in enumerate(data["text"]):
+        if not word or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confs.append(conf)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, (sum(confs) / len(confs) if confs else -1.0)
+
+
+def _read_region(renderer: _PageRenderer, coords, dpi: int) -> tuple[str, float]:
+    """_ocr_region() on the page rendered at `dpi`, answered from the OCR cache when possible."""
+    cache = getattr(renderer, "cache", None)
+    if cache is None:
+        renderer.engine_calls += 1
+        return _ocr_region(renderer.at(dpi), coords, dpi)
+    sha, page_index, engine = renderer.cache_key
+    hit = cache.get(sha, page_index, coords, dpi, engine)
+    if hit is not None:
+        renderer.cache_hits += 1
+        return hit
+    renderer.cache_misses += 1
+    renderer.engine_calls += 1
+    text, conf = _ocr_region(renderer.at(dpi), coords, dpi)
+    cache.put(sha, page_index, coords, dpi, engine, text, conf)
+    return text, conf
+
+
+def _ocr_region_adaptive(renderer: _PageRenderer, coords, accept) -> tuple[str, int, bool]:
+    """
+    Walk OCR_DPI_TIERS from lowest to highest until `accept(text, conf)` passes.
+    Returns (text, dpi, accepted) of the accepted tier, or of the highest tier.
+    """
+    text, dpi, accepted = "", OCR_DPI_TIERS[-1], False
+    for dpi in OCR_DPI_TIERS:
+        text, conf = _read_region(renderer, coords, dpi)
+        accepted = accept(text, conf)
+        if accepted:
+            break
+    return text, dpi, accepted
+
+
+def _accept_header(keyword: str):
+    # A confidently-read header without the keyword means "not this report"; no need to escalate
+    return lambda text, conf: keyword in text.lower() or conf >= OCR_MIN_CONFIDENCE
+
+
+def _accept_field(text: str, conf: float) -> bool:
+    return bool(text.strip()) and conf >= OCR_MIN_CONFIDENCE
+
+
+def _accept_vcdr(text: str, conf: float) -> bool:
+    return _accept_field(text, conf) and VCDR_PATTERN.search(text) is not None
+
+
+def _page_scan_order(page_count: int, likely_pages: list[int] | None) -> list[int]:
+    """0-based page indexes: likely report pages (1-based hints) first, then the rest in order."""
+    likely = []
+    for p in likely_pages or []:
+        if 1 <= p <= page_count and (p - 1) not in likely:
+            likely.append(p - 1)
+    return likely + [i for i in range(page_count) if i not in likely]
+
+
+def find_report_pages_by_coords_with_grid(pdf_path, stats: dict | None = None,
+                                          page_hints: dict[int, list[int]] | None = None):
     """
     Analyzes a PDF by checking specific coordinates, and saves an image
     of each page with a grid overlay.
 
     Args:
-        pdf_path (str): The file path to the PDF.
+        pdf_path (str | fitz.Document): The file path to the PDF, or an already open
+            document (left open, so the caller can split pages from the same handle).
+        stats (dict, optional): Filled with the DPI tier that succeeded for each
+            region under stats["dpi"], so defaults can be tuned from production runs,
+            plus stats["page_count"], stats["pages_scanned"] and
+            stats["pages_by_template"] (pages classified without header OCR).
+        page_hints (dict, optional): {page_count: [likely 1-based page numbers]}
+            learned from earlier runs; those pages are scanned first.
 
     Returns:
         tuple: A tuple containing the page numbers for the Diabetic and Glaucoma reports.
@@ -27,34 +240,48 @@ def find_report_pages_by_coords_with_grid(pdf_path):
     vcdr_lt = None
     text_gl_qual_result = None
 
+    dpi_used: dict[str, int | str] = {}
+    if stats is not None:
+        stats["dpi"] = dpi_used
+    classifier = get_classifier()
 
-    diabetic_report_coords = (0, 200, 1200, 400)
-    diabetic_result_coords = (350, 650, 2000, 800)
-    diabetic_qual_coords = (50, 3100, 1600, 3200)
+    owns_doc = not isinstance(pdf_path, fitz.Document)
+    if owns_doc:
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            print(f"Error opening PDF file: {e}")
+            return (None,) * 8
+    else:
+        doc = pdf_path
 
-    glaucoma_report_coords = (0, 400, 1200, 600)
-    glaucoma_result_coords = (0, 1550, 2000, 1650)
-    glaucoma_vcdr_rt_coords = (0, 1300, 1000, 1500)
-    glaucoma_vcdr_lt_coords = (1300, 1300, 2200, 1500)
-    glaucoma_qual_coords =   (50, 3100, 1700, 3200)
+    # OCR cache key prefix: content hash of the PDF on disk + engine version
+    cache = get_ocr_cache()
+    pdf_sha256 = engine = None
+    if cache is not None and doc.name and os.path.isfile(doc.name):
+        engine = _engine_version()
+        try:
+            pdf_sha256 = file_sha256(doc.name)
+        except OSError as e:
+            print(f"Could not hash PDF for OCR cache: {e}")
 
-
-    try:
-        doc = fitz.open(pdf_path)
-    except Exception as e:
-        print(f"Error opening PDF file: {e}")
-        return None, None
-
-    for page_num in range(len(doc)):
+    page_count = len(doc)
+    pages_scanned = 0
+    pages_by_template = 0
+    cache_hits = cache_misses = 0
+    pages_rendered = engine_calls = 0
+    for page_num in _page_scan_order(page_count, (page_hints or {}).get(page_count)):
         if pageNumberDiabeticReport is not None and pageNumberGlaucomaReport is not None:
             break
+        pages_scanned += 1
 
         page = doc.load_page(page_num)
-        pix = page.get_pixmap(dpi=300)
-        image = Image.open(io.BytesIO(pix.tobytes("png")))
-        #image.show()
+        renderer = _PageRenderer(
+            page, cache, (pdf_sha256, page_num, engine) if pdf_sha256 and engine else None,
+        )
         """
         # --- Generate and save the image with a grid overlay ---
+        image = renderer.at(BASE_DPI)
         plt.figure(figsize=(12, 16))
         plt.imshow(image)
         plt.title(f"Page {page_num + 1} with Coordinate Grid")
@@ -71,42 +298,75 @@ def find_report_pages_by_coords_with_grid(pdf_path):
         print(f"Generated grid image: {grid_image_filename}")
         # --- End of new code block ---
         """
-        if pageNumberDiabeticReport is None:
-            region_diabetic = image.crop(diabetic_report_coords)
-            #region_diabetic.show()
-            text_diabetic = pytesseract.image_to_string(region_diabetic).lower()
-            if "diabetic" in text_diabetic:
-                pageNumberDiabeticReport = page_num + 1
-                diabeticresult_area = image.crop(diabetic_result_coords)
-                #diabeticresult_area.show()  
-                text_diabetic_result = pytesseract.image_to_string(diabeticresult_area)
-                diabetic_qual_area = image.crop(diabetic_qual_coords)
-                text_diabetic_qual_result = pytesseract.image_to_string(diabetic_qual_area)
-
-                # EXTRACT DIABETIC RESULTS from cooridnates - 
-
-        if pageNumberGlaucomaReport is None:
-            region_glaucoma = image.crop(glaucoma_report_coords)
-            text_glaucoma = pytesseract.image_to_string(region_glaucoma).lower()
-            if "glaucoma" in text_glaucoma:
-                pageNumberGlaucomaReport = page_num + 1
-                glaucoma_result_area = image.crop(glaucoma_result_coords)
-                text_glaucoma_result = pytesseract.image_to_string(glaucoma_result_area)
-
-                glaucoma_vcdrRt_area = image.crop(glaucoma_vcdr_rt_coords)
-                vcdr_rt = pytesseract.image_to_string(glaucoma_vcdrRt_area)
-
-                glaucoma_vcdrLt_area = image.crop(glaucoma_vcdr_lt_coords)
-                vcdr_lt = pytesseract.image_to_string(glaucoma_vcdrLt_area)
-    
-                gl_qual_area = image.crop(glaucoma_qual_coords)
-                #gl_qual_area.show()
-                text_gl_qual_result = pytesseract.image_to_string(gl_qual_area)
-                
+        def read(name, coords, accept):
+            text, dpi_used[name], _ = _ocr_region_adaptive(renderer, coords, accept)
+            return text
+
+        # Template match on the header band first; header OCR only when no template matches confidently
+        vector = header_vector(page) if classifier else None
+        page_type = classifier.classify(vector)[0] if classifier else None
+        is_dr = page_type == PAGE_TYPE_DR
+        is_gl = page_type == PAGE_TYPE_GLAUCOMA
+        dpi = dpi_gl = "template"
+        if page_type is not None:
+            pages_by_template += 1
+            # A template only vouches for its own report: a DR page may also carry the glaucoma
+            # header (and vice versa), so the other header is still read while that report is missing
+            if is_dr and pageNumberGlaucomaReport is None:
+                text_glaucoma, dpi_gl, _ = _ocr_region_adaptive(renderer, GLAUCOMA_REPORT_COORDS, _accept_header("glaucoma"))
+                is_gl = "glaucoma" in text_glaucoma.lower()
+            elif is_gl and pageNumberDiabeticReport is None:
+                text_diabetic, dpi, _ = _ocr_region_adaptive(renderer, DIABETIC_REPORT_COORDS, _accept_header("diabetic"))
+                is_dr = "diabetic" in text_diabetic.lower()
+        else:
+            headers_checked = 0
+            if pageNumberDiabeticReport is None:
+                text_diabetic, dpi, confident = _ocr_region_adaptive(renderer, DIABETIC_REPORT_COORDS, _accept_header("diabetic"))
+                is_dr = "diabetic" in text_diabetic.lower()
+                headers_checked += int(confident)
+            if pageNumberGlaucomaReport is None:
+                text_glaucoma, dpi_gl, confident = _ocr_region_adaptive(renderer, GLAUCOMA_REPORT_COORDS, _accept_header("glaucoma"))
+                is_gl = "glaucoma" in text_glaucoma.lower()
+                headers_checked += int(confident)
+            if classifier:
+                # Only learn from unambiguous, confidently read headers
+                if is_dr and not is_gl:
+                    classifier.learn(PAGE_TYPE_DR, vector)
+                elif is_gl and not is_dr:
+                    classifier.learn(PAGE_TYPE_GLAUCOMA, vector)
+                elif not is_dr and not is_gl and headers_checked == 2:
+                    classifier.learn(PAGE_TYPE_OTHER, vector)
+
+        if is_dr and pageNumberDiabeticReport is None:
+            pageNumberDiabeticReport = page_num + 1
+            dpi_used["diabetic_header"] = dpi
+            text_diabetic_result = read("diabetic_result", DIABETIC_RESULT_COORDS, _accept_field)
+            text_diabetic_qual_result = read("diabetic_qual", DIABETIC_QUAL_COORDS, _accept_field)
+
+        if is_gl and pageNumberGlaucomaReport is None:
+            pageNumberGlaucomaReport = page_num + 1
+            dpi_used["glaucoma_header"] = dpi_gl
+            text_glaucoma_result = read("glaucoma_result", GLAUCOMA_RESULT_COORDS, _accept_field)
+            vcdr_rt = read("glaucoma_vcdr_rt", GLAUCOMA_VCDR_RT_COORDS, _accept_vcdr)
+            vcdr_lt = read("glaucoma_vcdr_lt", GLAUCOMA_VCDR_LT_COORDS, _accept_vcdr)
+            text_gl_qual_result = read("glaucoma_qual", GLAUCOMA_QUAL_COORDS, _accept_field)
 
+        cache_hits += renderer.cache_hits
+        cache_misses += renderer.cache_misses
+        pages_rendered += renderer.renders
+        engine_calls += renderer.engine_calls
 
-    doc.close()
-    print(f" Report for {pdf_path}")
+    if owns_doc:
+        doc.close()
+    if stats is not None:
+        stats["page_count"] = page_count
+        stats["pages_scanned"] = pages_scanned
+        stats["pages_by_template"] = pages_by_template
+        stats["cache_hits"] = cache_hits
+        stats["cache_misses"] = cache_misses
+        stats["pages_rendered"] = pages_rendered  # full-page renders (one per page and DPI tier)
+        stats["engine_calls"] = engine_calls      # Tesseract invocations
+    print(f" Report for {doc.name or pdf_path}")
     print(f"pageNumberDiabeticReport = {pageNumberDiabeticReport}")
     print(f"Diabetic Result ----- {text_diabetic_result} \
           WARNINGS --- {text_diabetic_qual_result}")
@@ -114,6 +374,7 @@ def find_report_pages_by_coords_with_grid(pdf_path):
     print(f"pageNumberGlaucomaReport = {pageNumberGlaucomaReport}")
     print(f"Glacuaom Result = {text_glaucoma_result} VCDR RT ---{vcdr_rt} \
           VCDR LT --- {vcdr_lt} -- Qual {text_gl_qual_result} ")
+    print(f"DPI tiers used = {dpi_used}")
 
     return pageNumberDiabeticReport, pageNumberGlaucomaReport, text_diabetic_result, \
         text_diabetic_qual_result, text_glaucoma_result, vcdr_rt, vcdr_lt, text_gl_qual_result
@@ -0,0 +1,154 @@
+# page_classifier.py
+# Classifies report pages (DR / Glaucoma / other) from their header band using
+# normalized cross-correlation against stored reference templates, so report
+# detection does not need a Tesseract call per page.
+# uses PyMuPDF  PIL  numpy
+
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# --- Templates from .env ---
+TEMPLATE_DIR = BASE_DIR / os.getenv("OCR_TEMPLATE_DIR", "files/ocr_templates")
+TEMPLATE_ENABLED = str(os.getenv("OCR_TEMPLATE_CLASSIFIER", "true")).lower() in ("1", "true", "yes")
+MATCH_THRESHOLD = float(os.getenv("OCR_TEMPLATE_THRESHOLD", "0.92"))
+# The best page type must beat the runner-up by this much, else the page is left to header OCR
+MATCH_MARGIN = float(os.getenv("OCR_TEMPLATE_MARGIN", "0.05"))
+MAX_TEMPLATES_PER_TYPE = int(os.getenv("OCR_TEMPLATE_MAX_PER_TYPE", "8"))
+
+PAGE_TYPE_DR = "dr"
+PAGE_TYPE_GLAUCOMA = "glaucoma"
+PAGE_TYPE_OTHER = "other"
+PAGE_TYPES = (PAGE_TYPE_DR, PAGE_TYPE_GLAUCOMA, PAGE_TYPE_OTHER)
+
+# Header band spanning both report-title regions of ocr_extraction, in pixels at 300 DPI
+HEADER_BAND_COORDS = (0, 200, 1200, 600)
+HEADER_BAND_DPI = 300
+RENDER_DPI = 36
+VECTOR_SIZE = (96, 32)  # (width, height) of the downsampled grayscale band
+
+
+def header_vector(page: fitz.Page) -> np.ndarray:
+    """Render only the header band at a tiny DPI and return it as a zero-mean, unit-norm vector."""
+    scale = 72 / HEADER_BAND_DPI
+    clip = fitz.Rect(*(c * scale for c in HEADER_BAND_COORDS))
+    pix = page.get_pixmap(dpi=RENDER_DPI, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples).resize(VECTOR_SIZE, Image.BILINEAR)
+    vec = np.asarray(img, dtype=np.float32).ravel()
+    vec -= vec.mean()
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class TemplateClassifier:
+    """Reference templates per page type, stored as <type>_<id>.npy under TEMPLATE_DIR."""
+
+    def __init__(self, template_dir: Path = TEMPLATE_DIR):
+        self.template_dir = Path(template_dir)
+        self._lock = threading.Lock()
+        self._templates: dict[str, np.ndarray] = {}
+        self._loaded_mtime: int | None = None
+        self.reload()
+
+    def __getstate__(self) -> dict:
+        # Picklable, so a loaded classifier can be handed to sandboxed children (ocr_extraction.warm_state)
+        return {"template_dir": self.template_dir, "templates": self._templates, "loaded_mtime": self._loaded_mtime}
+
+    def __setstate__(self, state: dict) -> None:
+        self.template_dir = state["template_dir"]
+        self._lock = threading.Lock()
+        self._templates = state["templates"]
+        self._loaded_mtime = state["loaded_mtime"]
+
+    def _dir_mtime(self) -> int | None:
+        try:
+            return self.template_dir.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self) -> None:
+        """Reload if templates were added to TEMPLATE_DIR since (e.g. learned by another process); one stat call."""
+        if self._dir_mtime() != self._loaded_mtime:
+            self.reload()
+
+    def reload(self) -> None:
+        self._loaded_mtime = self._dir_mtime()
+        templates: dict[str, list[np.ndarray]] = {t: [] for t in PAGE_TYPES}
+        if self.template_dir.exists():
+            for path in sorted(self.template_dir.glob("*.npy")):
+                page_type = path.stem.rsplit("_", 1)[0]
+                if page_type in templates:
+                    templates[page_type].append(np.load(path).astype(np.float32).ravel())
+        with self._lock:
+            self._templates = {t: np.vstack(v) for t, v in templates.items() if v}
+
+    def count(self, page_type: str) -> int:
+        m = self._templates.get(page_type)
+        return 0 if m is None else m.shape[0]
+
+    def score(self, vector: np.ndarray, page_type: str) -> float:
+        m = self._templates.get(page_type)
+        if m is None or m.shape[1] != vector.shape[0]:
+            return -1.0
+        return float(np.max(m @ vector))
+
+    def classify(self, vector: np.ndarray) -> tuple[str | None, float]:
+        """
+        Returns (page_type, score) when the best template scores at least MATCH_THRESHOLD and
+        beats every other page type by MATCH_MARGIN; otherwise (None, best score).
+        """
+        scores = sorted(((self.score(vector, t), t) for t in PAGE_TYPES), reverse=True)
+        (best, best_type), (runner_up, _) = scores[0], scores[1]
+        if best >= MATCH_THRESHOLD and best - runner_up >= MATCH_MARGIN:
+            return best_type, best
+        return None, best
+
+    def learn(self, page_type: str, vector: np.ndarray) -> bool:
+        """Store `vector` as a new template unless one already matches or the per-type cap is reached."""
+        if page_type not in PAGE_TYPES:
+            raise ValueError(f"Unknown page type: {page_type}")
+        with self._lock:
+            if self.count(page_type) >= MAX_TEMPLATES_PER_TYPE or self.score(vector, page_type) >= MATCH_THRESHOLD:
+                return False
+            self.template_dir.mkdir(parents=True, exist_ok=True)
+            # Unique name, written under a temporary name and renamed: OCR worker processes learn
+            # concurrently and must never overwrite or half-read each other's templates
+            name = f"{page_type}_{uuid.uuid4().hex[:12]}.npy"
+            tmp = self.template_dir / f".{name}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, vector.astype(np.float32))
+            os.replace(tmp, self.template_dir / name)
+            existing = self._templates.get(page_type)
+            row = vector.astype(np.float32)[None, :]
+            self._templates[page_type] = row if existing is None else np.vstack([existing, row])
+        print(f"Learned new '{page_type}' header template: {name}")
+        return True
+
+
+_classifier: TemplateClassifier | None = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> TemplateClassifier | None:
+    """Process-wide classifier (templates loaded once), or None when disabled via OCR_TEMPLATE_CLASSIFIER."""
+    global _classifier
+    if not TEMPLATE_ENABLED:
+        return None
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = TemplateClassifier()
+        return _classifier
+
+
+def use_classifier(classifier: TemplateClassifier) -> None:
+    """Make an already loaded classifier (e.g. one handed over by the parent process) this process's own."""
+    global _classifier
+    with _classifier_lock:
+        _classifier = classifier
@@ -0,0 +1,74 @@
+# pdf_sandbox.py
+# Runs one unit of PDF work (render/OCR/split) in a child process with a
+# wall-clock timeout and an address-space limit, so a corrupt or huge PDF that
+# hangs or balloons fitz/Tesseract cannot block or kill the calling worker.
+
+import multiprocessing
+
+try:
+    import resource  # POSIX only
+except ImportError:  # Windows: timeout still applies, memory cap does not
+    resource = None
+
+
+class PdfSandboxError(Exception):
+    """Raised when sandboxed PDF work fails; message is suitable for logs and job items."""
+
+
+class PdfTimeoutError(PdfSandboxError):
+    """The child exceeded its wall-clock timeout and was killed."""
+
+
+class PdfCrashError(PdfSandboxError):
+    """The child died without returning a result (segfault, OOM kill, ...)."""
+
+
+def _child(conn, mem_limit_mb: int | None, fn, args, initializer=None, initargs=()):
+    if resource is not None and mem_limit_mb:
+        limit = int(mem_limit_mb) * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+        conn.send(("ok", fn(*args)))
+    except BaseException as e:  # report MemoryError etc. instead of dying silently
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_sandboxed(fn, *args, timeout: float | None, mem_limit_mb: int | None, initializer=None, initargs=()):
+    """
+    Call fn(*args) in a fresh (spawned) child process and return its result.
+    `initializer(*initargs)` runs in the child first, as for ProcessPoolExecutor.
+    `fn`, its args and its return value must be picklable.
+    Raises PdfTimeoutError, PdfCrashError or PdfSandboxError (exception inside fn).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(send_conn, mem_limit_mb, fn, args, initializer, initargs),
+                       daemon=True)
+    proc.start()
+    send_conn.close()  # keep only the child's copy so EOF is seen if it dies
+    try:
+        if not recv_conn.poll(timeout):
+            proc.kill()
+            proc.join()
+            raise PdfTimeoutError(f"Timed out after {timeout:g}s")
+        try:
+            status, payload = recv_conn.recv()
+        except EOFError:
+            proc.join()
+            raise PdfCrashError(f"Worker process crashed (exit code {proc.exitcode})")
+    finally:
+        recv_conn.close()
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+    if status != "ok":
+        raise PdfSandboxError(payload)
+    return payload
@@ -4,13 +4,21 @@
 
 import re
 import os
+import glob
+from collections import deque
 from pathlib import Path
 from sqlalchemy.orm import Session as DBSession # Renamed to avoid conflict with `session` variable
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exists, or_
 import fitz # Import PyMuPDF for PDF splitting
 from datetime import datetime
 import time
 
+from typing import Callable, NamedTuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import argparse
+
 from dotenv import load_dotenv
 
 
@@ -34,6 +42,22 @@ from models import (
 # --- Directories from .env ---
 DR_PDF_DIR = BASE_DIR / os.getenv("DR_PDF_DIR", "files/dr_pdfs")
 GLAUCOMA_PDF_DIR = BASE_DIR / os.getenv("GLAUCOMA_PDF_DIR", "files/glaucoma_pdfs")
+# Virtual report pages: store source file + page only; reports/page_cache.py extracts pages on demand
+REPORT_PAGES_VIRTUAL = str(os.getenv("REPORT_PAGES_VIRTUAL", "false")).lower() in ("1", "true", "yes")
+
+# --- OCR parallelism from .env ---
+# OCR_WORKERS > 1 renders/OCRs/splits PDFs in a process pool; the parent is the single DB writer.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+# PDFs applied (one savepoint each) per DB commit; a batch is also committed once its first
+# write is OCR_COMMIT_SECONDS old, and before waiting on OCR so it never holds the write lock
+OCR_COMMIT_BATCH = int(os.getenv("OCR_COMMIT_BATCH", "20"))
+OCR_COMMIT_SECONDS = float(os.getenv("OCR_COMMIT_SECONDS", "10"))
+
+# --- Per-PDF sandbox from .env ---
+# Each PDF is analyzed in its own child process with a wall-clock timeout and memory cap
+OCR_SANDBOX = str(os.getenv("OCR_SANDBOX", "true")).lower() in ("1", "true", "yes")
+OCR_PDF_TIMEOUT = float(os.getenv("OCR_PDF_TIMEOUT", "300"))
+OCR_PDF_MEMORY_MB = int(os.getenv("OCR_PDF_MEMORY_MB", "2048"))
 
 # --- Logs from .env ---
 SUCCESS_LOG = BASE_DIR / os.getenv("SUCCESS_LOG", "logs/process_pdf_success_log.txt")
@@ -42,7 +66,9 @@ ERROR_LOG   = BASE_DIR / os.getenv("ERROR_LOG", "logs/process_pdf_error_log.txt"
 
 # Import the OCR extraction function from your separate file
 # Make sure your OCR function is in 'ocr_extraction.py' in the same directory
-from ocr_extraction import find_report_pages_by_coords_with_grid
+from ocr_extraction import adopt_warm_state, find_report_pages_by_coords_with_grid, warm_state
+from report_page_stats import load_page_hints, record_report_pages
+from pdf_sandbox import run_sandboxed
 
 
 def clean_ocr_text(text: str | None) -> str | None:
@@ -52,6 +78,12 @@ def clean_ocr_text(text: str | None) -> str | None:
     return " ".join(text.split())
 
 
+def report_base_name(patient_encounter: PatientEncounters) -> str:
+    """"<patient_id>_<name>_<capture_date>" from DB values, used to name split report pages."""
+    name_for_filename = (patient_encounter.name or '').replace(' ', '_')
+    return f"{patient_encounter.patient_id}_{name_for_filename}_{patient_encounter.capture_date}"
+
+
 # Log files
 
 
@@ -73,16 +105,373 @@ def log_error(filename: str, message: str):
 
 
 
+class PdfResult(NamedTuple):
+    """Plain, picklable result of analyzing one PDF (OCR + split) in a worker process."""
+    filename: str
+    dr_page: int | None
+    gl_page: int | None
+    dr_result: str | None
+    dr_qual: str | None
+    gl_result: str | None
+    vcdr_rt: str | None
+    vcdr_lt: str | None
+    gl_qual: str | None
+    dr_pdf_filename: str | None
+    gl_pdf_filename: str | None
+    ocr_stats: dict
+
+
+# Split pages are written with unused objects dropped and streams compressed
+SPLIT_SAVE_OPTIONS = {"garbage": 4, "deflate": True}
+
+
+def _split_page(pdf_document, page_number: int, out_dir: Path, out_filename: str, source_name: str, label: str) -> str | None:
+    """Save one (1-based) page of `pdf_document` as its own PDF; returns the filename or None on failure."""
+    try:
+        # Pages are 0-indexed in PyMuPDF, so subtract 1 from page_number
+        output_pdf = fitz.open() # Create new PDF
+        output_pdf.insert_pdf(pdf_document, from_page=page_number - 1, to_page=page_number - 1)
+        out_path = out_dir / out_filename
+        output_pdf.save(out_path, **SPLIT_SAVE_OPTIONS)
+        output_pdf.close()
+        print(f"  Saved {label} report page {page_number} to '{out_path.name}'.")
+        return out_filename
+    except Exception as e:
+        err = f"Error saving {label} report page {page_number}: {e}"
+        print(f"  {err} for '{source_name}'")
+        log_error(source_name, err)
+        return None
+
+
+def _partial_name(out_filename: str, source_name: str) -> str:
+    """Name a split page is written under until the analysis of `source_name` completes."""
+    return f"{out_filename}.{source_name}.part"
+
+
+def analyze_pdf(pdf_path: str, base_name: str, page_hints: dict[int, list[int]] | None = None,
+                split: bool = True) -> PdfResult:
+    """
+    OCR one PDF and split its report pages into DR_PDF_DIR / GLAUCOMA_PDF_DIR.
+    The PDF is opened once; OCR and both splits read from the same document handle.
+    With REPORT_PAGES_VIRTUAL (or split=False) nothing is written: the split file names are still
+    returned (templates and URLs use them) and the page is extracted on demand when viewed.
+    Split pages are written under partial names (see _partial_name) and renamed once both are saved.
+    Does not touch the database, so it can run in a worker process.
+    `base_name` is "<patient_id>_<name>_<capture_date>", used for the split file names.
+    """
+    path = Path(pdf_path)
+    ocr_stats: dict = {}
+    dr_pdf_filename = None
+    gl_pdf_filename = None
+    try:
+        pdf_document = fitz.open(str(path))
+    except Exception as e:
+        msg = f"Error opening PDF: {e}"
+        print(f"Error opening PDF '{path.name}': {e}")
+        log_error(path.name, msg)
+        return PdfResult(path.name, *([None] * 8), None, None, ocr_stats)
+
+    try:
+        (pageNumberDiabeticReport, pageNumberGlaucomaReport,
+         text_diabetic_result, text_diabetic_qual_result,
+         text_glaucoma_result, vcdr_rt, vcdr_lt, text_gl_qual_result) = \
+            find_report_pages_by_coords_with_grid(pdf_document, stats=ocr_stats, page_hints=page_hints)
+
+        splits = []  # (out_dir, filename) written under their partial names
+        if pageNumberDiabeticReport is not None:
+            dr_pdf_filename = f"{base_name}_DR_Page{pageNumberDiabeticReport}.pdf"
+            if split and not REPORT_PAGES_VIRTUAL:
+                written = _split_page(pdf_document, pageNumberDiabeticReport, DR_PDF_DIR,
+                                      _partial_name(dr_pdf_filename, path.name), path.name, "DR")
+                if written:
+                    splits.append((DR_PDF_DIR, dr_pdf_filename))
+                else:
+                    dr_pdf_filename = None
+        if pageNumberGlaucomaReport is not None:
+            gl_pdf_filename = f"{base_name}_GL_Page{pageNumberGlaucomaReport}.pdf"
+            if split and not REPORT_PAGES_VIRTUAL:
+                written = _split_page(pdf_document, pageNumberGlaucomaReport, GLAUCOMA_PDF_DIR,
+                                      _partial_name(gl_pdf_filename, path.name), path.name, "Glaucoma")
+                if written:
+                    splits.append((GLAUCOMA_PDF_DIR, gl_pdf_filename))
+                else:
+                    gl_pdf_filename = None
+        # Only a completed analysis publishes its pages under their real names
+        for out_dir, fname in splits:
+            os.replace(out_dir / _partial_name(fname, path.name), out_dir / fname)
+    finally:
+        pdf_document.close()
+
+    return PdfResult(
+        path.name, pageNumberDiabeticReport, pageNumberGlaucomaReport,
+        text_diabetic_result, text_diabetic_qual_result,
+        text_glaucoma_result, vcdr_rt, vcdr_lt, text_gl_qual_result,
+        dr_pdf_filename, gl_pdf_filename, ocr_stats,
+    )
+
+
+def _analyze_isolated(pdf_path: Path, base_name: str, page_hints: dict[int, list[int]] | None,
+                      split: bool = True) -> PdfResult:
+    """
+    analyze_pdf() in a sandboxed child process (OCR_SANDBOX), or inline when disabled.
+    The child starts from this process's warm OCR state rather than probing and loading its own.
+    """
+    if OCR_SANDBOX:
+        return run_sandboxed(analyze_pdf, str(pdf_path), base_name, page_hints, split,
+                             timeout=OCR_PDF_TIMEOUT, mem_limit_mb=OCR_PDF_MEMORY_MB,
+                             initializer=adopt_warm_state, initargs=(warm_state(),))
+    return analyze_pdf(str(pdf_path), base_name, page_hints, split)
+
+
+def _discard_partial_splits(source_name: str) -> None:
+    """Remove the partial split pages a crashed/timed-out analysis of `source_name` may have left."""
+    pattern = _partial_name("*.pdf", glob.escape(source_name))
+    for out_dir in (DR_PDF_DIR, GLAUCOMA_PDF_DIR):
+        for path in out_dir.glob(pattern):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def _record_failure(failures: dict[str, str], pdf_path: Path, msg: str) -> None:
+    print(f"  {msg} for '{pdf_path.name}'")
+    log_error(pdf_path.name, msg)
+    _discard_partial_splits(pdf_path.name)
+    failures[pdf_path.name] = msg
+
+
+def _discard_split_files(result: PdfResult) -> None:
+    """Remove split pages written for a result whose DB changes were rolled back."""
+    if REPORT_PAGES_VIRTUAL:
+        return  # names are virtual, nothing was written
+    for out_dir, fname in ((DR_PDF_DIR, result.dr_pdf_filename), (GLAUCOMA_PDF_DIR, result.gl_pdf_filename)):
+        if fname:
+            try:
+                (out_dir / fname).unlink(missing_ok=True)
+            except OSError:
+                pass
+
+
+def _apply_result(db_session: DBSession, patient_encounter: PatientEncounters,
+                  encounter_file: EncounterFile | None, result: PdfResult) -> None:
+    """Write the reports for one analyzed PDF and mark its EncounterFile processed (caller commits)."""
+    ocr_stats = result.ocr_stats
+    if ocr_stats.get("dpi"):
+        # Record which DPI tier each region succeeded at, for tuning OCR_DPI_TIERS
+        tiers = ",".join(f"{region}={dpi}" for region, dpi in ocr_stats["dpi"].items())
+        log_success(result.filename, f"OCR DPI tiers: {tiers}")
+    if ocr_stats.get("page_count"):
+        log_success(result.filename, f"OCR pages scanned: {ocr_stats['pages_scanned']}/{ocr_stats['page_count']} "
+                                     f"(classified by template: {ocr_stats.get('pages_by_template', 0)})")
+    if ocr_stats.get("cache_hits"):
+        log_success(result.filename, f"OCR cache: {ocr_stats['cache_hits']} region(s) reused, "
+                                     f"{ocr_stats.get('cache_misses', 0)} OCR'd")
+    record_report_pages(db_session, ocr_stats.get("page_count"), result.dr_page, result.gl_page)
+
+    source_file_id = encounter_file.id if encounter_file else None
+
+    # Process and store Diabetic Retinopathy Report if found
+    if result.dr_page is not None:
+        new_dr_report = DiabeticRetinopathyReport(
+            patient_encounter_id=patient_encounter.id,
+            result=clean_ocr_text(result.dr_result), # Directly use OCR output
+            qualitative_result=clean_ocr_text(result.dr_qual), # Store qualitative result
+            report_file_name=result.dr_pdf_filename, # Store the name of the split DR PDF
+            source_file_id=source_file_id,
+            page_number=result.dr_page,
+        )
+        db_session.add(new_dr_report)
+        print(f"  Added Diabetic Retinopathy Report for {patient_encounter.name}.")
+
+    # Process and store Glaucoma Report if found
+    if result.gl_page is not None:
+        new_glaucoma_report = GlaucomaReport(
+            patient_encounter_id=patient_encounter.id,
+            vcdr_right=clean_ocr_text(result.vcdr_rt), # Directly use string OCR output
+            vcdr_left=clean_ocr_text(result.vcdr_lt),  # Directly use string OCR output
+            result=clean_ocr_text(result.gl_result), # Directly use OCR output
+            qualitative_result=clean_ocr_text(result.gl_qual), # Store qualitative result
+            report_file_name=result.gl_pdf_filename, # Store the name of the split Glaucoma PDF
+            source_file_id=source_file_id,
+            page_number=result.gl_page,
+        )
+        db_session.add(new_glaucoma_report)
+        print(f"  Added Glaucoma Report for {patient_encounter.name}.")
+        if result.vcdr_rt is not None:
+            print(f"    VCDR Right: {result.vcdr_rt}")
+        if result.vcdr_lt is not None:
+            print(f"    VCDR Left: {result.vcdr_lt}")
+
+    # Update the ocr_processed flag for the specific PDF file
+    # This is important to know which files have had their OCR extracted and stored
+    if encounter_file:
+        encounter_file.ocr_processed = True
+        db_session.add(encounter_file)
+        msg = f"Marked '{result.filename}' as OCR processed in EncounterFile."
+        print(f"  {msg}")
+        log_success(result.filename, msg)
+    else:
+        warn = f"Could not find EncounterFile entry for '{result.filename}'."
+        print(f"  Warning: {warn}")
+        log_error(result.filename, warn)
+
+
 # --- Main PDF Processing Logic ---
 
-def process_all_pdfs_for_ocr(limit_filenames: set[str] | None = None):
+def _apply_in_savepoint(db_session: DBSession, patient_encounter: PatientEncounters,
+                        encounter_file: EncounterFile, result: PdfResult, summary: dict) -> bool:
+    """Apply one result in its own savepoint; on failure only this PDF's rows and split files are dropped."""
+    try:
+        with db_session.begin_nested():
+            _apply_result(db_session, patient_encounter, encounter_file, result)
+    except Exception as e:
+        _discard_split_files(result)
+        _record_failure(summary["failed"], Path(result.filename), f"Failed to store OCR results: {e}")
+        return False
+    summary["processed"] += 1
+    log_success(result.filename, "OCR and split pages completed")
+    return True
+
+
+def _begin_sqlite(conn) -> None:
+    conn.exec_driver_sql("BEGIN")
+
+
+def _writer_session() -> DBSession:
+    """
+    Session for the OCR writer on its own connection. pysqlite only BEGINs before DML, so a
+    SAVEPOINT outside a transaction starts one that its RELEASE commits; SQLAlchemy's pysqlite
+    SAVEPOINT recipe (driver autocommit plus an explicit BEGIN) makes begin_nested() nest inside
+    the batch instead. Close it with _close_writer_session().
+    """
+    conn = engine.connect()
+    if conn.dialect.name == "sqlite":
+        conn.connection.driver_connection.isolation_level = None
+        event.listen(conn, "begin", _begin_sqlite)
+    return Session(bind=conn, expire_on_commit=False)
+
+
+def _close_writer_session(db_session: DBSession) -> None:
+    conn = db_session.get_bind()
+    db_session.close()
+    if conn.dialect.name == "sqlite":
+        conn.connection.driver_connection.isolation_level = ""  # pysqlite's default, before it is pooled
+    conn.close()
+
+
+class _CommitBatcher:
+    """
+    Commits every OCR_COMMIT_BATCH PDFs, or sooner once writes are OCR_COMMIT_SECONDS old.
+    flush() also ends a read-only transaction so no lock is held while waiting on OCR.
+    """
+
+    def __init__(self, db_session: DBSession, size: int = OCR_COMMIT_BATCH, max_age: float = OCR_COMMIT_SECONDS):
+        self.db_session = db_session
+        self.size = max(1, size)
+        self.max_age = max_age
+        self.count = 0
+        self.first_write = None
+
+    def added(self) -> None:
+        if self.count == 0:
+            self.first_write = time.monotonic()
+        self.count += 1
+        if self.count >= self.size:
+            self.flush()
+        else:
+            self.flush_if_stale()
+
+    def flush_if_stale(self) -> None:
+        if self.count and time.monotonic() - self.first_write >= self.max_age:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.count or self.db_session.in_transaction():
+            self.db_session.commit()
+        self.count = 0
+
+
+def _load_worklist(db_session: DBSession, limit_filenames: set[str] | None):
+    """
+    Unprocessed PDF EncounterFiles with their encounter and whether that encounter
+    already has a DR or Glaucoma report, in one query: [(EncounterFile, PatientEncounters, has_reports)].
+    """
+    has_reports = or_(
+        exists().where(DiabeticRetinopathyReport.patient_encounter_id == PatientEncounters.id),
+        exists().where(GlaucomaReport.patient_encounter_id == PatientEncounters.id),
+    ).label("has_reports")
+    q = (
+        db_session.query(EncounterFile, PatientEncounters, has_reports)
+        .join(PatientEncounters, EncounterFile.patient_encounter_id == PatientEncounters.id)
+        .filter(EncounterFile.file_type == 'pdf')
+        .filter((EncounterFile.ocr_processed == False) | (EncounterFile.ocr_processed.is_(None)))
+        .filter(EncounterFile.filename.isnot(None), EncounterFile.filename != "")
+    )
+    if limit_filenames is not None:
+        q = q.filter(EncounterFile.filename.in_(limit_filenames))
+    return q.order_by(EncounterFile.id).all()
+
+
+
+def _make_pool(workers: int):
+    if OCR_SANDBOX:
+        # Threads only wait on their sandboxed child processes
+        return ThreadPoolExecutor(max_workers=workers)
+    # spawn: never fork a process that may be running Flask/executor threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=adopt_warm_state, initargs=(warm_state(),))
+
+
+def _skip_reported(items, batch: "_CommitBatcher") -> None:
+    """Mark PDFs of an encounter that got its reports during this run processed without OCR."""
+    for pdf_path, patient_encounter, encounter_file in items:
+        log_error(pdf_path.name, f"Reports for patient ID  {patient_encounter.patient_id}  already exist. Skipping OCR")
+        encounter_file.ocr_processed = True
+        batch.added()
+
+
+def _discard_unapplied(pending: dict, handled: set) -> None:
+    """After a stop: drop split pages of analyses that finished but whose results were not stored."""
+    for fut in pending:
+        if fut in handled or not fut.done() or fut.cancelled() or fut.exception() is not None:
+            continue
+        _discard_split_files(fut.result())
+
+
+def process_all_pdfs_for_ocr(limit_filenames: set[str] | None = None, workers: int | None = None,
+                             should_stop: Callable[[], bool] | None = None) -> dict:
     """
     Iterates through all PDF files in the PDF_DIR, performs OCR,
     stores the extracted results into the database, and
     splits and saves individual report pages to new directories.
+
+    The worklist (files, encounters, existing-report flags) comes from one query.
+    Each PDF is applied in its own savepoint, so one bad file never undoes its
+    neighbours. Savepoints are committed every OCR_COMMIT_BATCH PDFs (or
+    OCR_COMMIT_SECONDS), and always before waiting on OCR.
+
+    With workers > 1 (default OCR_WORKERS), rendering, OCR and splitting run in a
+    process pool; this process stays the only DB writer. PDFs of one encounter are
+    analyzed one after another, so an encounter never gets reports from two PDFs.
+
+    With OCR_SANDBOX each PDF runs in its own child process (OCR_PDF_TIMEOUT,
+    OCR_PDF_MEMORY_MB); a crash, timeout or error fails only that PDF.
+
+    `should_stop` is checked between PDFs: when it returns True, PDFs not analyzed yet are left
+    unprocessed, results already stored are kept and "cancelled": True is added to the summary.
+
+    Returns {"processed": int, "failed": {filename: reason}}.
     """
-    print("Starting PDF OCR processing workflow...")
-    db_session: DBSession = Session() # Create a session instance
+    workers = OCR_WORKERS if workers is None else max(1, int(workers))
+    print(f"Starting PDF OCR processing workflow (workers={workers}, sandbox={OCR_SANDBOX})...")
+    # Worklist objects are read once up front; don't re-SELECT each of them after every batch commit
+    db_session = _writer_session()
+    pool = None
+    pending: dict = {}  # future -> (pdf_path, patient_encounter, encounter_file)
+    handled: set = set()  # futures whose result was stored or recorded as a failure
+    summary: dict = {"processed": 0, "failed": {}}
+    batch = _CommitBatcher(db_session)
 
     # Ensure new split PDF directories exist
     DR_PDF_DIR.mkdir(parents=True, exist_ok=True)
@@ -90,183 +479,149 @@ def process_all_pdfs_for_ocr(limit_filenames: set[str] | None = None):
     print(f"Created directories: {DR_PDF_DIR} and {GLAUCOMA_PDF_DIR}")
 
     try:
-        # Build a targeted worklist from DB: only unprocessed EncounterFile PDFs
-        rows = (
-            db_session.query(EncounterFile, PatientEncounters)
-            .join(PatientEncounters, EncounterFile.patient_encounter_id == PatientEncounters.id)
-            .filter(EncounterFile.file_type == 'pdf')
-            .filter((EncounterFile.ocr_processed == False) | (EncounterFile.ocr_processed.is_(None)))
-            .all()
-        )
-
+        rows = _load_worklist(db_session, limit_filenames)
         if not rows:
             print("\nNo unprocessed PDFs found (EncounterFile.ocr_processed==False). Nothing to do.")
-            return
-
-        work_items: list[tuple[Path, PatientEncounters, str]] = []  # (pdf_path, encounter, filename)
-        for ef, enc in rows:
-            pdf_path = PDF_DIR / (ef.filename or "")
-            if not ef.filename:
-                continue
-            if limit_filenames is not None and ef.filename not in limit_filenames:
+            return summary
+
+        work_items: list[tuple[Path, PatientEncounters, EncounterFile]] = []
+        for ef, enc, has_reports in rows:
+            if has_reports:
+                # Reports already exist for this encounter: mark the file so it is not picked up again
+                log_error(ef.filename, f"Reports for patient ID  {enc.patient_id}  already exist. Skipping OCR")
+                ef.ocr_processed = True
+                batch.added()
                 continue
+            pdf_path = PDF_DIR / ef.filename
             if not pdf_path.exists():
                 log_error(ef.filename, "PDF file missing on disk; skipping")
                 continue
-            work_items.append((pdf_path, enc, ef.filename))
+            work_items.append((pdf_path, enc, ef))
+        batch.flush()
 
         total_files = len(work_items)
-        for idx, (pdf_path, patient_encounter, ef_filename) in enumerate(work_items, start=1):
+        # Learned report page positions: scan the likely pages of each PDF first
+        page_hints = load_page_hints(db_session)
+        # Encounters that got reports during this run; their other PDFs are skipped like above
+        reported: set[int] = set()
+
+        if workers > 1:
+            pool = _make_pool(workers)
+            # One analysis per encounter at a time: its PDFs are tried in order until one yields
+            # reports, as in the sequential path, and never write the same split file names at once
+            queues: dict[int, deque] = {}
+            for pdf_path, patient_encounter, encounter_file in work_items:
+                queues.setdefault(patient_encounter.id, deque()).append((pdf_path, patient_encounter, encounter_file))
+
+            def submit_next(encounter_id: int) -> None:
+                if queues[encounter_id]:
+                    item = queues[encounter_id].popleft()
+                    pdf_path, patient_encounter, encounter_file = item
+                    base_name = report_base_name(patient_encounter)
+                    try:
+                        if OCR_SANDBOX:
+                            fut = pool.submit(_analyze_isolated, pdf_path, base_name, page_hints)
+                        else:
+                            fut = pool.submit(analyze_pdf, str(pdf_path), base_name, page_hints)
+                    except BrokenProcessPool:
+                        queues[encounter_id].appendleft(item)
+                        stalled.add(encounter_id)
+                        return
+                    pending[fut] = item
+                    outstanding.add(fut)
+
+            outstanding: set = set()
+            # Encounters whose next PDF waits for a new pool: a crashed worker process (only
+            # without OCR_SANDBOX) breaks the whole ProcessPoolExecutor
+            stalled: set[int] = set()
+            for encounter_id in queues:
+                submit_next(encounter_id)
+            # Single writer: apply results as workers finish them
+            while outstanding or stalled:
+                if should_stop is not None and should_stop():
+                    left = len(outstanding) + sum(len(q) for q in queues.values())
+                    print(f"\nStop requested; {left} PDF(s) left unprocessed.")
+                    summary["cancelled"] = True
+                    break
+                if not outstanding:
+                    # Every PDF the broken pool held has failed by now; the rest go to a new pool
+                    print("\nOCR worker pool broke; starting a new one.")
+                    pool.shutdown(wait=True)
+                    pool = _make_pool(workers)
+                    retry, stalled = stalled, set()
+                    for encounter_id in retry:
+                        submit_next(encounter_id)
+                    if not outstanding:
+                        # Not even a new pool takes work: fail what is left instead of retrying forever
+                        for encounter_id in stalled:
+                            for pdf_path, _enc, _ef in queues.pop(encounter_id):
+                                _record_failure(summary["failed"], pdf_path,
+                                                "OCR failed: the worker pool could not be restarted")
+                        stalled.clear()
+                    continue
+                done, outstanding = wait(outstanding, timeout=0, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Nothing to store yet: commit so the write lock isn't held while OCR runs
+                    batch.flush()
+                    done, outstanding = wait(outstanding, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    pdf_path, patient_encounter, encounter_file = pending[fut]
+                    handled.add(fut)
+                    try:
+                        result = fut.result()
+                    except BrokenProcessPool:
+                        # Which PDF killed the worker is unknown: every PDF in flight fails
+                        _record_failure(summary["failed"], pdf_path,
+                                        "OCR failed: a worker process crashed while this PDF was being analyzed")
+                        submit_next(patient_encounter.id)
+                        continue
+                    except Exception as e:
+                        _record_failure(summary["failed"], pdf_path, f"OCR failed: {e}")
+                        submit_next(patient_encounter.id)
+                        continue
+                    applied = _apply_in_savepoint(db_session, patient_encounter, encounter_file, result, summary)
+                    if applied:
+                        batch.added()
+                    if applied and (result.dr_page is not None or result.gl_page is not None):
+                        _skip_reported(queues.pop(patient_encounter.id), batch)
+                    else:
+                        submit_next(patient_encounter.id)
+            if summary.get("cancelled"):
+                # Queued analyses are dropped; running ones finish and their split pages are removed
+                pool.shutdown(wait=True, cancel_futures=True)
+                _discard_unapplied(pending, handled)
+            batch.flush()
+            return summary
+
+        for idx, (pdf_path, patient_encounter, encounter_file) in enumerate(work_items, start=1):
+            if should_stop is not None and should_stop():
+                print(f"\nStop requested; {total_files - idx + 1} PDF(s) left unprocessed.")
+                summary["cancelled"] = True
+                break
             print(f"\n--- Processing file {idx}/{total_files}: '{pdf_path.name}' ---")
 
-            # Use data from DB for consistent naming
-            extracted_patient_id = patient_encounter.patient_id
-            patient_name_for_filename = (patient_encounter.name or '').replace(' ', '_')
-            capture_date_for_filename = patient_encounter.capture_date
-
-            # Skip if reports already exist for this encounter
-            already_dr = db_session.query(DiabeticRetinopathyReport).filter_by(patient_encounter_id=patient_encounter.id).first()
-            already_gl = db_session.query(GlaucomaReport).filter_by(patient_encounter_id=patient_encounter.id).first()
-            if already_dr or already_gl:
-                log_error(pdf_path.name, f"Reports for patient ID  {extracted_patient_id}  already exist. Skipping OCR")
-                # Optionally mark as processed to avoid repeated attempts
-                enc_file = db_session.query(EncounterFile).filter_by(patient_encounter_id=patient_encounter.id, filename=pdf_path.name).first()
-                if enc_file and not enc_file.ocr_processed:
-                    enc_file.ocr_processed = True
-                    db_session.add(enc_file)
-                    db_session.commit()
+            if patient_encounter.id in reported:
+                _skip_reported([(pdf_path, patient_encounter, encounter_file)], batch)
                 continue
 
-            # Check if this PDF has already been OCR processed for reports
-            # We can check if any DR or Glaucoma reports already exist for this encounter
-            existing_dr_report = db_session.query(DiabeticRetinopathyReport).filter_by(patient_encounter_id=patient_encounter.id).first()
-            existing_gl_report = db_session.query(GlaucomaReport).filter_by(patient_encounter_id=patient_encounter.id).first()
-
-            if existing_dr_report or existing_gl_report:
-                print(f"Reports for patient ID '{extracted_patient_id}' from '{pdf_path.name}' already exist. Skipping OCR.")
-                log_error(pdf_path.name, f"Reports for patient ID  {extracted_patient_id}  already exist. Skipping OCR")
-                
-                # Optionally, update the EncounterFile's ocr_processed flag if not already set
-                encounter_file = db_session.query(EncounterFile).filter_by(
-                    patient_encounter_id=patient_encounter.id, filename=pdf_path.name
-                ).first()
-                if encounter_file and not encounter_file.ocr_processed:
-                    encounter_file.ocr_processed = True
-                    db_session.add(encounter_file)
-                    db_session.commit()
-                    print(f"Updated ocr_processed flag for '{pdf_path.name}'.")
+            base_name = report_base_name(patient_encounter)
+            # Don't hold uncommitted writes (the SQLite write lock) across a slow OCR run
+            batch.flush()
+            # Perform OCR extraction and split report pages; a failure here only fails this PDF
+            try:
+                result = _analyze_isolated(pdf_path, base_name, page_hints)
+            except Exception as e:
+                _record_failure(summary["failed"], pdf_path, f"OCR failed: {e}")
                 continue
-
-
-            # Perform OCR extraction
-            (pageNumberDiabeticReport, pageNumberGlaucomaReport,
-             text_diabetic_result, text_diabetic_qual_result,
-             text_glaucoma_result, vcdr_rt, vcdr_lt, text_gl_qual_result) = \
-                find_report_pages_by_coords_with_grid(str(pdf_path)) # find_report_pages_by_coords_with_grid expects string path
-
-            # Open the PDF for splitting if any report page is found
-            pdf_document = None
-            if pageNumberDiabeticReport is not None or pageNumberGlaucomaReport is not None:
-                try:
-                    pdf_document = fitz.open(str(pdf_path))
-                except Exception as e:
-                    msg = f"Error opening PDF for splitting: {e}"
-                    print(f"Error opening PDF for splitting '{pdf_path.name}': {e}")
-                    log_error(pdf_path.name, msg)
-                    pdf_document = None  # Ensure it's None if opening failed
-
-            # Initialize filenames for split PDFs
-            dr_pdf_filename = None
-            gl_pdf_filename = None
-
-            # Process and store Diabetic Retinopathy Report if found
-            if pageNumberDiabeticReport is not None:
-                if pdf_document:
-                    try:
-                        # Pages are 0-indexed in PyMuPDF, so subtract 1 from pageNumberDiabeticReport
-                        output_dr_pdf = fitz.open() # Create new PDF
-                        output_dr_pdf.insert_pdf(pdf_document, from_page=pageNumberDiabeticReport - 1, to_page=pageNumberDiabeticReport - 1)
-                        
-                        dr_pdf_filename = f"{extracted_patient_id}_{patient_name_for_filename}_{capture_date_for_filename}_DR_Page{pageNumberDiabeticReport}.pdf"
-                        dr_pdf_path = DR_PDF_DIR / dr_pdf_filename
-                        output_dr_pdf.save(dr_pdf_path)
-                        output_dr_pdf.close()
-                        print(f"  Saved DR report page {pageNumberDiabeticReport} to '{dr_pdf_path.name}'.")
-                    except Exception as e:
-                        err = f"Error saving DR report page {pageNumberDiabeticReport}: {e}"
-                        print(f"  {err} for '{pdf_path.name}'")
-                        log_error(pdf_path.name, err)
-
-                new_dr_report = DiabeticRetinopathyReport(
-                    patient_encounter_id=patient_encounter.id,
-                    result=clean_ocr_text(text_diabetic_result), # Directly use OCR output
-                    qualitative_result=clean_ocr_text(text_diabetic_qual_result), # Store qualitative result
-                    report_file_name=dr_pdf_filename # Store the name of the split DR PDF
-                )
-                db_session.add(new_dr_report)
-                print(f"  Added Diabetic Retinopathy Report for {patient_encounter.name}.")
-
-            # Process and store Glaucoma Report if found
-            if pageNumberGlaucomaReport is not None:
-                if pdf_document:
-                    try:
-                        # Pages are 0-indexed in PyMuPDF, so subtract 1 from pageNumberGlaucomaReport
-                        output_gl_pdf = fitz.open() # Create new PDF
-                        output_gl_pdf.insert_pdf(pdf_document, from_page=pageNumberGlaucomaReport - 1, to_page=pageNumberGlaucomaReport - 1)
-                        
-                        gl_pdf_filename = f"{extracted_patient_id}_{patient_name_for_filename}_{capture_date_for_filename}_GL_Page{pageNumberGlaucomaReport}.pdf"
-                        gl_pdf_path = GLAUCOMA_PDF_DIR / gl_pdf_filename
-                        output_gl_pdf.save(gl_pdf_path)
-                        output_gl_pdf.close()
-                        print(f"  Saved Glaucoma report page {pageNumberGlaucomaReport} to '{gl_pdf_path.name}'.")
-                    except Exception as e:
-                        err = f"Error saving Glaucoma report page {pageNumberGlaucomaReport}: {e}"
-                        print(f"  {err} for '{pdf_path.name}'")
-                        log_error(pdf_path.name, err)
-
-                new_glaucoma_report = GlaucomaReport(
-                    patient_encounter_id=patient_encounter.id,
-                    vcdr_right=clean_ocr_text(vcdr_rt), # Directly use string OCR output
-                    vcdr_left=clean_ocr_text(vcdr_lt),  # Directly use string OCR output
-                    result=clean_ocr_text(text_glaucoma_result), # Directly use OCR output
-                    qualitative_result=clean_ocr_text(text_gl_qual_result), # Store qualitative result
-                    report_file_name=gl_pdf_filename # Store the name of the split Glaucoma PDF
-                )
-                db_session.add(new_glaucoma_report)
-                print(f"  Added Glaucoma Report for {patient_encounter.name}.")
-                if vcdr_rt is not None:
-                    print(f"    VCDR Right: {vcdr_rt}")
-                if vcdr_lt is not None:
-                    print(f"    VCDR Left: {vcdr_lt}")
-            
-            # Close the original PDF document after processing all relevant pages
-            if pdf_document:
-                pdf_document.close()
-
-            # Update the ocr_processed flag for the specific PDF file
-            # This is important to know which files have had their OCR extracted and stored
-            encounter_file = db_session.query(EncounterFile).filter_by(
-                patient_encounter_id=patient_encounter.id, filename=pdf_path.name
-            ).first()
-
-            if encounter_file:
-                encounter_file.ocr_processed = True
-                db_session.add(encounter_file)
-                msg = f"Marked '{pdf_path.name}' as OCR processed in EncounterFile."
-                print(f"  {msg}")
-                log_success(pdf_path.name, msg)
-                
-            else:
-                warn = f"Could not find EncounterFile entry for '{pdf_path.name}'."
-                print(f"  Warning: {warn}")
-                log_error(pdf_path.name, warn)
-
-            db_session.commit() # Commit changes for the current PDF
-
+            if not _apply_in_savepoint(db_session, patient_encounter, encounter_file, result, summary):
+                continue
+            batch.added()
+            if result.dr_page is not None or result.gl_page is not None:
+                reported.add(patient_encounter.id)
             print(f"Successfully processed OCR and split pages for '{pdf_path.name}'.")
-            log_success(pdf_path.name, "OCR and split pages completed")
             # Brief pause between PDFs to smooth IO/CPU
             time.sleep(1)
+        batch.flush()
 
     except Exception as e:
         # Capture whichever file was in scope, else mark as UNKNOWN
@@ -275,12 +630,20 @@ def process_all_pdfs_for_ocr(limit_filenames: set[str] | None = None):
         print(msg)
         db_session.rollback()  # Roll back all changes in case of an error
         log_error(file_name, msg)
+        summary["error"] = msg
 
     finally:
-        db_session.close() # Always close the session
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        _close_writer_session(db_session) # Always close the session
         msg = "PDF OCR processing workflow finished."
         print("\n" + msg)
         log_success("(workflow)", msg)
+    return summary
 
 if __name__ == '__main__':
-    process_all_pdfs_for_ocr()
+    parser = argparse.ArgumentParser(description="OCR unprocessed PDFs and split report pages")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Worker processes for rendering/OCR/splitting (default OCR_WORKERS={OCR_WORKERS})")
+    args = parser.parse_args()
+    process_all_pdfs_for_ocr(workers=args.workers)
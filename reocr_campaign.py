@@ -0,0 +1,441 @@
+# reocr_campaign.py
+# Re-OCR campaigns: re-extract a selected subset of PDFs with the current
+# extraction template into a shadow table (reocr_results), report field-level
+# diffs against the live DR/Glaucoma reports, and apply the changes only to
+# encounters a human has not verified yet.
+#
+# CLI:
+#   python reocr_campaign.py run --name vcdr-fix --missing vcdr --since 2025-01-01 --workers 4
+#   python reocr_campaign.py list
+#   python reocr_campaign.py diff 3 --csv diff.csv --json diff.json
+#   python reocr_campaign.py apply 3 [--dry-run]
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import fitz  # PyMuPDF
+from sqlalchemy import or_
+from sqlalchemy.orm import Session as DBSession
+
+from models import (
+    Session,
+    PDF_DIR,
+    DiabeticRetinopathyReport,
+    EncounterFile,
+    GlaucomaReport,
+    JobItem,
+    PatientEncounters,
+    ReocrCampaign,
+    ReocrResult,
+    User,
+    ZipFile,
+    user_lab_units,
+)
+from ocr_extraction import adopt_warm_state, template_version, warm_state
+from reports.page_cache import discard_page, report_cache_name
+from process_pdfs import (
+    DR_PDF_DIR,
+    GLAUCOMA_PDF_DIR,
+    OCR_COMMIT_BATCH,
+    OCR_SANDBOX,
+    OCR_WORKERS,
+    REPORT_PAGES_VIRTUAL,
+    _analyze_isolated,
+    _partial_name,
+    _split_page,
+    analyze_pdf,
+    clean_ocr_text,
+    report_base_name,
+)
+
+DR_FIELDS = {"dr_page": "page_number", "dr_result": "result", "dr_qual": "qualitative_result"}
+GL_FIELDS = {
+    "gl_page": "page_number", "gl_result": "result", "vcdr_right": "vcdr_right",
+    "vcdr_left": "vcdr_left", "gl_qual": "qualitative_result",
+}
+MISSING_CHOICES = ("dr", "glaucoma", "vcdr", "qual")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _blank(col):
+    return or_(col.is_(None), col == "")
+
+
+def select_files(db: DBSession, since: date | None = None, until: date | None = None,
+                 lab_unit_id: int | None = None, missing: str | None = None,
+                 filename_like: str | None = None, limit: int | None = None):
+    """(EncounterFile, PatientEncounters) rows for PDFs matching the campaign filters."""
+    q = (
+        db.query(EncounterFile, PatientEncounters)
+        .join(PatientEncounters, EncounterFile.patient_encounter_id == PatientEncounters.id)
+        .filter(EncounterFile.file_type == "pdf")
+    )
+    if since:
+        q = q.filter(PatientEncounters.capture_date_dt >= since)
+    if until:
+        q = q.filter(PatientEncounters.capture_date_dt <= until)
+    if filename_like:
+        q = q.filter(or_(EncounterFile.filename.like(filename_like),
+                         PatientEncounters.patient_id.like(filename_like)))
+    if lab_unit_id is not None:
+        # Encounters carry no lab; use the lab units of whoever uploaded the ZIP
+        uploaded_by_lab = (
+            db.query(ZipFile.id)
+            .join(JobItem, JobItem.filename == ZipFile.zip_filename)
+            .join(User, User.id == JobItem.uploader_user_id)
+            .join(user_lab_units, user_lab_units.c.user_id == User.id)
+            .filter(user_lab_units.c.lab_unit_id == lab_unit_id)
+        )
+        q = q.filter(PatientEncounters.zip_file_id.in_(uploaded_by_lab))
+    if missing == "dr":
+        q = q.filter(~PatientEncounters.dr_reports.any())
+    elif missing == "glaucoma":
+        q = q.filter(~PatientEncounters.glaucoma_reports.any())
+    elif missing == "vcdr":
+        q = q.filter(PatientEncounters.glaucoma_reports.any(
+            or_(_blank(GlaucomaReport.vcdr_right), _blank(GlaucomaReport.vcdr_left))))
+    elif missing == "qual":
+        q = q.filter(or_(
+            PatientEncounters.dr_reports.any(_blank(DiabeticRetinopathyReport.qualitative_result)),
+            PatientEncounters.glaucoma_reports.any(_blank(GlaucomaReport.qualitative_result)),
+        ))
+    q = q.order_by(EncounterFile.id)
+    if limit:
+        q = q.limit(limit)
+    return q.all()
+
+
+def _shadow_row(campaign_id: int, ef: EncounterFile, result) -> ReocrResult:
+    return ReocrResult(
+        campaign_id=campaign_id, encounter_file_id=ef.id, patient_encounter_id=ef.patient_encounter_id,
+        dr_page=result.dr_page, dr_result=clean_ocr_text(result.dr_result), dr_qual=clean_ocr_text(result.dr_qual),
+        gl_page=result.gl_page, gl_result=clean_ocr_text(result.gl_result),
+        vcdr_right=clean_ocr_text(result.vcdr_rt), vcdr_left=clean_ocr_text(result.vcdr_lt),
+        gl_qual=clean_ocr_text(result.gl_qual),
+    )
+
+
+def run_campaign(name: str, workers: int | None = None, created_by: str | None = None, **filters) -> int:
+    """Re-extract the selected PDFs into reocr_results (no split files, no live report changes)."""
+    workers = OCR_WORKERS if workers is None else max(1, int(workers))
+    db = Session()
+    pool = None
+    try:
+        rows = select_files(db, **filters)
+        campaign = ReocrCampaign(
+            name=name, template_version=template_version(), created_by=created_by,
+            filters=json.dumps({k: str(v) for k, v in filters.items() if v is not None}), total=len(rows),
+        )
+        db.add(campaign)
+        db.commit()
+        print(f"Campaign #{campaign.id} '{name}' (template {campaign.template_version}): {len(rows)} PDF(s)")
+
+        if OCR_SANDBOX:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=adopt_warm_state, initargs=(warm_state(),))
+        pending = {}
+        for ef, enc in rows:
+            pdf_path = PDF_DIR / (ef.filename or "")
+            if OCR_SANDBOX:
+                fut = pool.submit(_analyze_isolated, pdf_path, report_base_name(enc), None, False)
+            else:
+                fut = pool.submit(analyze_pdf, str(pdf_path), report_base_name(enc), None, False)
+            pending[fut] = ef
+
+        done = 0
+        for fut in as_completed(pending):
+            ef = pending[fut]
+            try:
+                row = _shadow_row(campaign.id, ef, fut.result())
+            except Exception as e:
+                row = ReocrResult(campaign_id=campaign.id, encounter_file_id=ef.id,
+                                  patient_encounter_id=ef.patient_encounter_id, error=str(e)[:1000])
+                campaign.failed += 1
+                print(f"  Re-OCR failed for '{ef.filename}': {e}")
+            db.add(row)
+            done += 1
+            if done % OCR_COMMIT_BATCH == 0:
+                db.commit()
+                print(f"  {done}/{len(rows)} re-extracted")
+
+        campaign.status = "done"
+        campaign.finished_at = _utcnow()
+        db.commit()
+        print(f"Campaign #{campaign.id} finished: {done - campaign.failed} ok, {campaign.failed} failed.")
+        return campaign.id
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+        db.close()
+
+
+def _current_reports(db: DBSession, encounter_ids: set[int]):
+    """First DR / Glaucoma report per encounter (the one the UI shows)."""
+    dr, gl = {}, {}
+    if encounter_ids:
+        for r in (db.query(DiabeticRetinopathyReport)
+                  .filter(DiabeticRetinopathyReport.patient_encounter_id.in_(encounter_ids))
+                  .order_by(DiabeticRetinopathyReport.id)):
+            dr.setdefault(r.patient_encounter_id, r)
+        for r in (db.query(GlaucomaReport)
+                  .filter(GlaucomaReport.patient_encounter_id.in_(encounter_ids))
+                  .order_by(GlaucomaReport.id)):
+            gl.setdefault(r.patient_encounter_id, r)
+    return dr, gl
+
+
+def _norm(value):
+    return None if value in (None, "") else str(value)
+
+
+def _deciding_results(results: list[ReocrResult], dr: dict, gl: dict) -> set[tuple[int, str]]:
+    """
+    An encounter with several PDFs gets one result per PDF, all proposing values for the same
+    report, so only one of them may be applied: per encounter and report, the result that found
+    the report, preferring the report's current source file, then the newest file.
+    Returns {(result_id, report kind)}.
+    """
+    by_encounter: dict[int, list[ReocrResult]] = {}
+    for r in results:
+        by_encounter.setdefault(r.patient_encounter_id, []).append(r)
+    chosen = set()
+    for enc_id, rs in by_encounter.items():
+        for kind, page_attr, current in (("dr", "dr_page", dr.get(enc_id)), ("glaucoma", "gl_page", gl.get(enc_id))):
+            source = current.source_file_id if current is not None else None
+            best = max(rs, key=lambda r: (getattr(r, page_attr) is not None, r.encounter_file_id == source,
+                                          r.encounter_file_id))
+            chosen.add((best.id, kind))
+    return chosen
+
+
+def diff_campaign(db: DBSession, campaign_id: int) -> list[dict]:
+    """One row per changed field: current vs proposed value, and whether apply may touch it."""
+    results = db.query(ReocrResult).filter_by(campaign_id=campaign_id, error=None).all()
+    encounters = {
+        e.id: e for e in db.query(PatientEncounters)
+        .filter(PatientEncounters.id.in_({r.patient_encounter_id for r in results}))
+    } if results else {}
+    files = {
+        f.id: f for f in db.query(EncounterFile)
+        .filter(EncounterFile.id.in_({r.encounter_file_id for r in results}))
+    } if results else {}
+    dr, gl = _current_reports(db, set(encounters))
+    chosen = _deciding_results(results, dr, gl)
+
+    rows = []
+    for r in results:
+        enc = encounters[r.patient_encounter_id]
+        for kind, fields, current, verified in (
+            ("dr", DR_FIELDS, dr.get(enc.id), enc.dr_verified_status == "verified"),
+            ("glaucoma", GL_FIELDS, gl.get(enc.id), enc.glaucoma_verified_status == "verified"),
+        ):
+            superseded = (r.id, kind) not in chosen
+            for field, attr in fields.items():
+                old = _norm(getattr(current, attr)) if current is not None else None
+                new = _norm(getattr(r, field))
+                if old == new:
+                    continue
+                rows.append({
+                    "campaign_id": campaign_id,
+                    "result_id": r.id,
+                    "encounter_id": enc.id,
+                    "patient_id": enc.patient_id,
+                    "filename": files[r.encounter_file_id].filename,
+                    "report": kind,
+                    "field": field,
+                    "current": old,
+                    "proposed": new,
+                    "verified": verified,
+                    # Another PDF of the encounter decides this report (_deciding_results)
+                    "superseded": superseded,
+                    # Never delete a report the re-extraction could not find again
+                    "applicable": not verified and not superseded and not r.applied and new is not None,
+                })
+    return rows
+
+
+def _resplit(enc: PatientEncounters, ef: EncounterFile, page: int, kind: str) -> tuple[str | None, Path | None]:
+    """
+    Write the split page for a moved report (unless report pages are virtual) under its partial
+    name (process_pdfs._partial_name), published by the caller once the move is committed.
+    Returns (split file name or None if it could not be written, partial file or None).
+    """
+    suffix, out_dir, label = ("DR", DR_PDF_DIR, "DR") if kind == "dr" else ("GL", GLAUCOMA_PDF_DIR, "Glaucoma")
+    fname = f"{report_base_name(enc)}_{suffix}_Page{page}.pdf"
+    if REPORT_PAGES_VIRTUAL:
+        return fname, None
+    partial = _partial_name(fname, ef.filename)
+    with fitz.open(str(PDF_DIR / ef.filename)) as doc:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if not _split_page(doc, page, out_dir, partial, ef.filename, label):
+            return None, None
+    return fname, out_dir / partial
+
+
+def _discard_moved_pages(db: DBSession, moved: list[tuple]) -> None:
+    """
+    After the commit that moved reports to another page or source file: evict their cached
+    pages and remove the old split files, which would otherwise be served or orphaned.
+    """
+    for model, kind, report_uuid, out_dir, old_name, new_name in moved:
+        if report_uuid:
+            discard_page(report_cache_name(kind, report_uuid))
+        if not old_name or (old_name == new_name and not REPORT_PAGES_VIRTUAL):
+            continue  # nothing written before, or already replaced by the new split
+        # With virtual pages a split left under the same name still holds the old page
+        if old_name == new_name or db.query(model.id).filter(model.report_file_name == old_name).first() is None:
+            try:
+                (out_dir / Path(old_name).name).unlink(missing_ok=True)
+            except OSError:
+                pass
+
+
+def apply_campaign(campaign_id: int, dry_run: bool = False) -> dict:
+    """Copy applicable proposed values into the live reports; verified encounters are never touched."""
+    db = Session()
+    try:
+        campaign = db.get(ReocrCampaign, campaign_id)
+        if campaign is None:
+            raise ValueError(f"Campaign #{campaign_id} not found")
+        diff = diff_campaign(db, campaign_id)
+        changes = [c for c in diff if c["applicable"]]
+        summary = {"fields": len(changes), "reports": 0,
+                   "skipped_verified_fields": sum(1 for c in diff if c["verified"]),
+                   "superseded_fields": sum(1 for c in diff if c["superseded"] and not c["verified"])}
+        if dry_run:
+            summary["reports"] = len({(c["result_id"], c["report"]) for c in changes})
+            return summary
+
+        by_report: dict[tuple[int, str], list[dict]] = {}
+        for c in changes:
+            by_report.setdefault((c["result_id"], c["report"]), []).append(c)
+        dr, gl = _current_reports(db, {c["encounter_id"] for c in changes})
+        moved: list[tuple] = []  # cleaned up by _discard_moved_pages() once committed
+        written: list[tuple[Path, Path]] = []  # (partial, final) split files, renamed once committed
+        for (result_id, kind), fields in by_report.items():
+            r = db.get(ReocrResult, result_id)
+            enc = db.get(PatientEncounters, r.patient_encounter_id)
+            ef = db.get(EncounterFile, r.encounter_file_id)
+            if kind == "dr":
+                report = dr.get(enc.id) or DiabeticRetinopathyReport(patient_encounter_id=enc.id, result="")
+                mapping, page = DR_FIELDS, r.dr_page
+            else:
+                report = gl.get(enc.id) or GlaucomaReport(patient_encounter_id=enc.id, result="")
+                mapping, page = GL_FIELDS, r.gl_page
+            for c in fields:
+                setattr(report, mapping[c["field"]], getattr(r, c["field"]))
+            page_moved = any(c["field"].endswith("_page") for c in fields)
+            if page and (page_moved or report.source_file_id != ef.id):
+                old_name = report.report_file_name
+                report.report_file_name, partial = _resplit(enc, ef, page, kind)
+                if partial is not None:
+                    written.append((partial, partial.with_name(report.report_file_name)))
+                report.source_file_id = ef.id
+                if kind == "dr":
+                    moved.append((DiabeticRetinopathyReport, "dr", report.uuid, DR_PDF_DIR,
+                                  old_name, report.report_file_name))
+                else:
+                    moved.append((GlaucomaReport, "gl", report.uuid, GLAUCOMA_PDF_DIR,
+                                  old_name, report.report_file_name))
+            db.add(report)
+            summary["reports"] += 1
+        for r in db.query(ReocrResult).filter(ReocrResult.id.in_({rid for rid, _k in by_report})):
+            r.applied = True
+        campaign.status = "applied"
+        campaign.applied_at = _utcnow()
+        db.commit()
+        for partial, final in written:
+            os.replace(partial, final)
+        _discard_moved_pages(db, moved)
+        return summary
+    except Exception:
+        db.rollback()
+        for partial, _final in written:
+            partial.unlink(missing_ok=True)
+        raise
+    finally:
+        db.close()
+
+
+def _write_diff(rows: list[dict], csv_path: str | None, json_path: str | None) -> None:
+    if csv_path:
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            fields = list(rows[0].keys()) if rows else ["campaign_id"]
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(rows)
+        print(f"Wrote {len(rows)} diff row(s) to {csv_path}")
+    if json_path:
+        Path(json_path).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print(f"Wrote {len(rows)} diff row(s) to {json_path}")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Re-OCR campaigns with shadow results, diffs and safe apply")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Re-extract a subset of PDFs into the shadow table")
+    run.add_argument("--name", required=True)
+    run.add_argument("--since", type=date.fromisoformat, help="capture date >= YYYY-MM-DD")
+    run.add_argument("--until", type=date.fromisoformat, help="capture date <= YYYY-MM-DD")
+    run.add_argument("--lab", type=int, dest="lab_unit_id", help="lab unit id of the ZIP uploader")
+    run.add_argument("--missing", choices=MISSING_CHOICES, help="only encounters missing this report/field")
+    run.add_argument("--like", dest="filename_like", help="SQL LIKE pattern on PDF filename or patient id")
+    run.add_argument("--limit", type=int)
+    run.add_argument("--workers", type=int, default=None)
+    run.add_argument("--by", dest="created_by", help="who started the campaign (recorded)")
+
+    sub.add_parser("list", help="List campaigns")
+
+    diff = sub.add_parser("diff", help="Field-level diff of a campaign against the live reports")
+    diff.add_argument("campaign_id", type=int)
+    diff.add_argument("--csv")
+    diff.add_argument("--json")
+
+    apply = sub.add_parser("apply", help="Apply a campaign to unverified encounters")
+    apply.add_argument("campaign_id", type=int)
+    apply.add_argument("--dry-run", action="store_true")
+
+    args = ap.parse_args(argv)
+    if args.command == "run":
+        opts = vars(args).copy()
+        opts.pop("command")
+        run_campaign(opts.pop("name"), **opts)
+    elif args.command == "list":
+        db = Session()
+        try:
+            for c in db.query(ReocrCampaign).order_by(ReocrCampaign.id.desc()):
+                print(f"#{c.id}  {c.name}  template={c.template_version}  status={c.status}  "
+                      f"total={c.total} failed={c.failed}  created={c.created_at:%Y-%m-%d %H:%M}  filters={c.filters}")
+        finally:
+            db.close()
+    elif args.command == "diff":
+        db = Session()
+        try:
+            rows = diff_campaign(db, args.campaign_id)
+        finally:
+            db.close()
+        for r in rows:
+            flag = "verified" if r["verified"] else ("apply" if r["applicable"] else
+                                                     "superseded" if r["superseded"] else "skip")
+            print(f"[{flag:8}] enc {r['encounter_id']} {r['report']}.{r['field']}: {r['current']!r} -> {r['proposed']!r}")
+        print(f"{len(rows)} changed field(s), {sum(r['applicable'] for r in rows)} applicable.")
+        _write_diff(rows, args.csv, args.json)
+    elif args.command == "apply":
+        print(apply_campaign(args.campaign_id, dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+# report_page_stats.py
+# Learned positions of DR / Glaucoma report pages inside exported PDFs.
+# PDFs with the same page count almost always come from the same camera/template
+# export, so the page count is used as the template key.
+
+from sqlalchemy.orm import Session as DBSession
+
+from models import ReportPageStat
+
+REPORT_TYPE_DR = "dr"
+REPORT_TYPE_GLAUCOMA = "glaucoma"
+
+
+def load_page_hints(db: DBSession) -> dict[int, list[int]]:
+    """
+    Returns {page_count: [page_number, ...]} with the most frequently seen
+    report pages first. Both report types are merged because every scanned
+    page is checked for both headers anyway.
+    """
+    totals: dict[int, dict[int, int]] = {}
+    for page_count, page_number, hits in db.query(
+        ReportPageStat.page_count, ReportPageStat.page_number, ReportPageStat.hits
+    ):
+        per_page = totals.setdefault(page_count, {})
+        per_page[page_number] = per_page.get(page_number, 0) + hits
+    return {
+        page_count: sorted(per_page, key=lambda p: (-per_page[p], p))
+        for page_count, per_page in totals.items()
+    }
+
+
+def record_report_pages(db: DBSession, page_count: int | None, dr_page: int | None, gl_page: int | None) -> None:
+    """Increment the hit counters for the pages where reports were found (caller commits)."""
+    if not page_count:
+        return
+    for report_type, page_number in ((REPORT_TYPE_DR, dr_page), (REPORT_TYPE_GLAUCOMA, gl_page)):
+        if page_number is None:
+            continue
+        row = (
+            db.query(ReportPageStat)
+            .filter_by(page_count=page_count, report_type=report_type, page_number=page_number)
+            .first()
+        )
+        if row is None:
+            row = ReportPageStat(page_count=page_count, report_type=report_type, page_number=page_number, hits=0)
+            db.add(row)
+        row.hits = (row.hits or 0) + 1
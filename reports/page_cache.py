@@ -0,0 +1,102 @@
+# reports/page_cache.py
+# On-demand extraction of a single report page from its source PDF, with a
+# size-bounded LRU disk cache. Used when split report PDFs were not
+# materialized at ingest (REPORT_PAGES_VIRTUAL) or have gone missing.
+
+import os
+import threading
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from models import BASE_DIR, PDF_DIR
+
+CACHE_DIR = BASE_DIR / os.getenv("REPORT_PAGE_CACHE_DIR", "files/report_page_cache")
+CACHE_MAX_BYTES = int(os.getenv("REPORT_PAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+_lock = threading.Lock()
+
+
+def _evict(keep: Path) -> None:
+    """Drop least recently used pages (oldest mtime) until the cache fits CACHE_MAX_BYTES."""
+    entries = []
+    total = 0
+    for p in CACHE_DIR.glob("*.pdf"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+        total += st.st_size
+    entries.sort()
+    for _mtime, size, p in entries:
+        if total <= CACHE_MAX_BYTES:
+            break
+        if p == keep:
+            continue
+        try:
+            p.unlink()
+            total -= size
+        except OSError:
+            pass
+
+
+def report_cache_name(kind: str, report_uuid: str) -> str:
+    """Cache file name of a report's page; `kind` is "dr" or "gl"."""
+    return f"{kind}_{report_uuid}.pdf"
+
+
+def discard_page(cache_name: str) -> None:
+    """Drop a cached page, e.g. once its report points at another page or source file."""
+    with _lock:
+        try:
+            (CACHE_DIR / os.path.basename(cache_name)).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def page_available(split_path: Path | None, source_filename: str | None, page_number: int | None) -> bool:
+    """
+    Whether a report page can be served: its split file exists, or its source PDF does and the
+    page can be extracted from it on demand (the source is only checked on disk, not opened).
+    """
+    if split_path is not None and split_path.is_file():
+        return True
+    return bool(source_filename and page_number) and (PDF_DIR / os.path.basename(source_filename)).is_file()
+
+
+def get_page_pdf(source_filename: str, page_number: int, cache_name: str) -> Path | None:
+    """
+    Return a path to a one-page PDF holding `page_number` (1-based) of PDF_DIR/source_filename,
+    extracting it into the cache as `cache_name` on a miss. Returns None if the source is unusable.
+    """
+    cached = CACHE_DIR / os.path.basename(cache_name)
+    if cached.is_file():
+        try:
+            os.utime(cached)  # mark as recently used
+        except OSError:
+            pass
+        return cached
+
+    source = PDF_DIR / os.path.basename(source_filename or "")
+    if not source.is_file():
+        return None
+    try:
+        with fitz.open(str(source)) as src:
+            if not 1 <= page_number <= len(src):
+                return None
+            out = fitz.open()
+            out.insert_pdf(src, from_page=page_number - 1, to_page=page_number - 1)
+            data = out.tobytes(garbage=4, deflate=True)
+            out.close()
+    except Exception as e:
+        print(f"Error extracting page {page_number} of '{source.name}': {e}")
+        return None
+
+    with _lock:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, cached)  # atomic: concurrent readers never see a partial file
+        _evict(keep=cached)
+    return cached
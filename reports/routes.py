@@ -1,7 +1,7 @@
 # reports/routes.py
 import os
 from pathlib import Path
-from flask import abort, send_from_directory, redirect, url_for
+from flask import abort, render_template, request, send_from_directory, redirect, url_for
 from werkzeug.utils import secure_filename
 
 from auth.roles import roles_required
@@ -11,70 +11,74 @@ from . import bp
 # (these were moved to .env in your earlier steps)
 from process_pdfs import DR_PDF_DIR, GLAUCOMA_PDF_DIR  # Path objects
 from models import Session, DiabeticRetinopathyReport, GlaucomaReport
+from .page_cache import get_page_pdf, report_cache_name
+from text_index import search as search_page_text
 
-def _safe_file(base_dir: Path, filename: str) -> tuple[str, str]:
+SEARCH_PAGE_SIZE = 50
+
+def _send_pdf(directory: str, fname: str):
+    # Serve inline (not attachment), browser will open in a new tab when link has target=_blank
+    return send_from_directory(directory=directory, path=fname, mimetype="application/pdf", as_attachment=False)
+
+def _find_report(model, **filters):
+    """Returns (report_file_name, source_filename, page_number, uuid) or None."""
+    db = Session()
+    try:
+        rep = db.query(model).filter_by(**filters).first()
+        if not rep:
+            return None
+        source = rep.source_file.filename if rep.source_file else None
+        return rep.report_file_name, source, rep.page_number, rep.uuid
+    finally:
+        db.close()
+
+def _serve_report(kind: str, base_dir: Path, found):
     """
-    Prevent path traversal & ensure file exists inside base_dir.
-    Returns (directory_str, filename_str) for send_from_directory.
+    Serve the materialized split PDF if present, otherwise extract the page from the
+    source PDF on demand (virtual report pages, see reports/page_cache.py).
     """
-    # Strip any path parts the client may try to sneak in
-    fname = secure_filename(os.path.basename(filename))
-    full = base_dir / fname
-    if not full.exists() or not full.is_file():
+    if not found:
+        abort(404)
+    report_file_name, source, page_number, uuid = found
+    if report_file_name:
+        fname = secure_filename(os.path.basename(report_file_name))
+        if fname and (base_dir / fname).is_file():
+            return _send_pdf(str(base_dir), fname)
+    if not source or not page_number:
         abort(404)
-    return (str(base_dir), fname)
+    cached = get_page_pdf(source, page_number, report_cache_name(kind, uuid))
+    if cached is None:
+        abort(404)
+    return _send_pdf(str(cached.parent), cached.name)
 
 @bp.route("/dr/<path:filename>", methods=["GET"])
 @roles_required("admin")
 def serve_dr_pdf(filename: str):
-    directory, fname = _safe_file(DR_PDF_DIR, filename)
-    # Serve inline (not attachment), browser will open in a new tab when link has target=_blank
-    return send_from_directory(directory=directory, path=fname, mimetype="application/pdf", as_attachment=False)
+    fname = secure_filename(os.path.basename(filename))
+    if fname and (DR_PDF_DIR / fname).is_file():
+        return _send_pdf(str(DR_PDF_DIR), fname)
+    return _serve_report("dr", DR_PDF_DIR, _find_report(DiabeticRetinopathyReport, report_file_name=fname))
 
 @bp.route("/glaucoma/<path:filename>", methods=["GET"])
 @roles_required("admin")
 def serve_glaucoma_pdf(filename: str):
-    directory, fname = _safe_file(GLAUCOMA_PDF_DIR, filename)
-    return send_from_directory(directory=directory, path=fname, mimetype="application/pdf", as_attachment=False)
+    fname = secure_filename(os.path.basename(filename))
+    if fname and (GLAUCOMA_PDF_DIR / fname).is_file():
+        return _send_pdf(str(GLAUCOMA_PDF_DIR), fname)
+    return _serve_report("gl", GLAUCOMA_PDF_DIR, _find_report(GlaucomaReport, report_file_name=fname))
 
 # --- New: serve split report PDFs by report UUIDs ---
 
 @bp.route("/dr/by-uuid/<uuid>", methods=["GET"])
 @roles_required("admin")
 def serve_dr_pdf_by_uuid(uuid: str):
-    db = Session()
-    try:
-        rep = (
-            db.query(DiabeticRetinopathyReport)
-            .filter(DiabeticRetinopathyReport.uuid == uuid)
-            .first()
-        )
-    finally:
-        db.close()
-
-    if not rep or not rep.report_file_name:
-        abort(404)
-    directory, fname = _safe_file(DR_PDF_DIR, rep.report_file_name)
-    return send_from_directory(directory=directory, path=fname, mimetype="application/pdf", as_attachment=False)
+    return _serve_report("dr", DR_PDF_DIR, _find_report(DiabeticRetinopathyReport, uuid=uuid))
 
 
 @bp.route("/glaucoma/by-uuid/<uuid>", methods=["GET"])
 @roles_required("admin")
 def serve_glaucoma_pdf_by_uuid(uuid: str):
-    db = Session()
-    try:
-        rep = (
-            db.query(GlaucomaReport)
-            .filter(GlaucomaReport.uuid == uuid)
-            .first()
-        )
-    finally:
-        db.close()
-
-    if not rep or not rep.report_file_name:
-        abort(404)
-    directory, fname = _safe_file(GLAUCOMA_PDF_DIR, rep.report_file_name)
-    return send_from_directory(directory=directory, path=fname, mimetype="application/pdf", as_attachment=False)
+    return _serve_report("gl", GLAUCOMA_PDF_DIR, _find_report(GlaucomaReport, uuid=uuid))
 
 
 @bp.route("/glaucoma_results", methods=["GET"])
@@ -82,4 +86,23 @@ def serve_glaucoma_pdf_by_uuid(uuid: str):
 def glaucoma_results_redirect():
     # Redirect old path to new blueprint path
     return redirect(url_for("glaucoma.glaucoma_results"), code=302)
- 
+
+
+@bp.route("/search", methods=["GET"])
+@roles_required("admin")
+def search_report_text():
+    """Ranked full-text search over indexed PDF page text (see text_index.py)."""
+    q = (request.args.get("q") or "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    hits = []
+    if q:
+        db = Session()
+        try:
+            # Fetch one extra row to know whether a next page exists
+            hits = search_page_text(db, q, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE)
+        finally:
+            db.close()
+    has_next = len(hits) > SEARCH_PAGE_SIZE
+    return render_template(
+        "reports/search.html", q=q, hits=hits[:SEARCH_PAGE_SIZE], page=page, has_next=has_next,
+    )
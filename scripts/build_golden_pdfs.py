@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Write the synthetic golden set used by scripts/ocr_benchmark.py: a few PDFs with
+the report headers and fields typed into the regions ocr_extraction reads, and
+the matching expected.json. No patient data, so the set can live in the repo.
+
+Real anonymized PDFs can be added to the same folder with their own entries in
+expected.json; this script only rewrites the files it owns.
+
+Usage:
+  python scripts/build_golden_pdfs.py              # writes tests/golden
+  python scripts/build_golden_pdfs.py --out /tmp/golden
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path as _Path
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+import fitz  # noqa: E402
+from ocr_extraction import (  # noqa: E402
+    BASE_DPI,
+    DIABETIC_QUAL_COORDS,
+    DIABETIC_REPORT_COORDS,
+    DIABETIC_RESULT_COORDS,
+    GLAUCOMA_QUAL_COORDS,
+    GLAUCOMA_REPORT_COORDS,
+    GLAUCOMA_RESULT_COORDS,
+    GLAUCOMA_VCDR_LT_COORDS,
+    GLAUCOMA_VCDR_RT_COORDS,
+)
+
+DEFAULT_OUT = _ROOT / "tests" / "golden"
+FONT_SIZE = 12
+
+# Page kinds: region -> text typed into it
+COVER = {(0, 1000, 2000, 1100): "Fundus screening summary"}
+DR = {
+    DIABETIC_REPORT_COORDS: "Diabetic Retinopathy Report",
+    DIABETIC_RESULT_COORDS: "{dr_result}",
+    DIABETIC_QUAL_COORDS: "{dr_qual}",
+}
+GLAUCOMA = {
+    GLAUCOMA_REPORT_COORDS: "Glaucoma Screening Report",
+    GLAUCOMA_VCDR_RT_COORDS: "{vcdr_right}",
+    GLAUCOMA_VCDR_LT_COORDS: "{vcdr_left}",
+    GLAUCOMA_RESULT_COORDS: "{gl_result}",
+    GLAUCOMA_QUAL_COORDS: "{gl_qual}",
+}
+
+# file -> (pages, expected values); None means the report must not be found
+GOLDEN = {
+    "dr_and_glaucoma.pdf": ((COVER, DR, GLAUCOMA), {
+        "dr_page": 2, "dr_result": "No Diabetic Retinopathy", "dr_qual": "Image quality good",
+        "gl_page": 3, "gl_result": "Non Referable Glaucoma", "vcdr_right": "VCDR RE 0.4",
+        "vcdr_left": "VCDR LE 0.5", "gl_qual": "Image quality good",
+    }),
+    "dr_only.pdf": ((DR, COVER), {
+        "dr_page": 1, "dr_result": "Moderate NPDR", "dr_qual": "Image quality adequate", "gl_page": None,
+    }),
+    "glaucoma_only.pdf": ((COVER, COVER, GLAUCOMA), {
+        "dr_page": None, "gl_page": 3, "gl_result": "Referable Glaucoma", "vcdr_right": "VCDR RE 0.7",
+        "vcdr_left": "VCDR LE 0.6", "gl_qual": "Image quality poor",
+    }),
+    "no_reports.pdf": ((COVER, COVER), {"dr_page": None, "gl_page": None}),
+}
+
+
+def _write_pdf(path: _Path, pages: tuple[dict, ...], values: dict) -> None:
+    scale = 72 / BASE_DPI
+    doc = fitz.open()
+    for regions in pages:
+        page = doc.new_page(width=595, height=842)  # A4; region coords are pixels at BASE_DPI
+        for (x0, y0, _x1, y1), text in regions.items():
+            baseline = ((y0 + y1) / 2) * scale + FONT_SIZE / 3
+            page.insert_text((x0 * scale + 6, baseline), text.format(**values), fontsize=FONT_SIZE)
+    doc.save(str(path), garbage=4, deflate=True)
+    doc.close()
+
+
+def build(out_dir: _Path) -> list[str]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    expected_path = out_dir / "expected.json"
+    expected = json.loads(expected_path.read_text(encoding="utf-8")) if expected_path.exists() else {}
+    for name, (pages, values) in GOLDEN.items():
+        _write_pdf(out_dir / name, pages, {k: v or "" for k, v in values.items()})
+        expected[name] = values
+    expected_path.write_text(json.dumps(expected, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    return sorted(GOLDEN)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Write the synthetic golden PDFs for the OCR benchmark")
+    ap.add_argument("--out", default=str(DEFAULT_OUT), help=f"Golden folder (default {DEFAULT_OUT})")
+    args = ap.parse_args()
+    names = build(_Path(args.out))
+    print(f"Wrote {len(names)} golden PDF(s) and expected.json to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Seed or inspect the header-band reference templates used by page_classifier.
+
+Templates are also learned automatically whenever header OCR confirms a page
+that no template matched; use this script to seed them from a known PDF.
+
+Usage:
+  python scripts/build_ocr_templates.py --pdf files/pdfs/X.pdf --page 2 --type dr
+  python scripts/build_ocr_templates.py --pdf files/pdfs/X.pdf --page 3 --type glaucoma
+  python scripts/build_ocr_templates.py --classify files/pdfs/Y.pdf
+  python scripts/build_ocr_templates.py --list
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+import fitz  # noqa: E402
+from page_classifier import PAGE_TYPES, TEMPLATE_DIR, TemplateClassifier, header_vector  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Seed/inspect report header templates")
+    ap.add_argument('--pdf', help='PDF to take a template page from (or to classify)')
+    ap.add_argument('--page', type=int, help='1-based page number used as template')
+    ap.add_argument('--type', choices=PAGE_TYPES, help='Page type of the template page')
+    ap.add_argument('--classify', metavar='PDF', help='Print the template classification of every page')
+    ap.add_argument('--list', action='store_true', help='List stored templates')
+    args = ap.parse_args()
+
+    clf = TemplateClassifier()
+
+    if args.list:
+        print(f"Template dir: {TEMPLATE_DIR}")
+        for t in PAGE_TYPES:
+            print(f"- {t}: {clf.count(t)} template(s)")
+        return
+
+    if args.classify:
+        with fitz.open(args.classify) as doc:
+            for i, page in enumerate(doc, start=1):
+                page_type, score = clf.classify(header_vector(page))
+                print(f"page {i}: {page_type or '-'} (best score {score:.3f})")
+        return
+
+    if not (args.pdf and args.page and args.type):
+        ap.error("--pdf, --page and --type are required to add a template")
+    with fitz.open(args.pdf) as doc:
+        vec = header_vector(doc.load_page(args.page - 1))
+    if clf.learn(args.type, vec):
+        print("Template added.")
+    else:
+        print("Not added: an equivalent template exists or the per-type cap is reached.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Create the job_archive table: one summary row per finished job whose jobs /
+job_items rows were removed by the retention policy (job_retention.py).
+
+Usage:
+  python scripts/migrate_job_archive.py
+  python scripts/migrate_job_archive.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from sqlalchemy import inspect  # noqa: E402
+from models import engine, JobArchive  # noqa: E402
+
+
+def migrate(dry_run: bool = False) -> None:
+    table = JobArchive.__table__
+    if inspect(engine).has_table(table.name):
+        print(f"{table.name} already exists; nothing to do.")
+        return
+    print(f"- Will create table {table.name} with indexes: {', '.join(sorted(ix.name for ix in table.indexes))}")
+    if not dry_run:
+        table.create(engine, checkfirst=True)
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Create the job_archive table for job retention")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Add indexes on job_items.finished_at and job_items.ocr_finished_at, used to
+measure recent ingest / OCR throughput for upload admission control
+(job_admission.queue_load).
+
+Usage:
+  python scripts/migrate_job_item_finished_indexes.py
+  python scripts/migrate_job_item_finished_indexes.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+INDEXES = (
+    ("ix_job_items_finished_at", "finished_at"),
+    ("ix_job_items_ocr_finished_at", "ocr_finished_at"),
+)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Ensuring finish-time indexes on job_items ...")
+        for name, cols in INDEXES:
+            sql = f"CREATE INDEX IF NOT EXISTS {name} ON job_items ({cols})"
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+        if not dry_run:
+            conn.exec_driver_sql("ANALYZE job_items")
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add finish-time indexes to job_items")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Add composite indexes to job_items: (job_id, state), (job_id, ocr_state) for
+per-job error/progress checks, and (job_id, filename) for item lookups by
+upload name.
+
+Usage:
+  python scripts/migrate_job_item_indexes.py
+  python scripts/migrate_job_item_indexes.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+INDEXES = (
+    ("ix_job_items_job_state", "job_id, state"),
+    ("ix_job_items_job_ocr_state", "job_id, ocr_state"),
+    ("ix_job_items_job_filename", "job_id, filename"),
+)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Ensuring composite indexes on job_items ...")
+        for name, cols in INDEXES:
+            sql = f"CREATE INDEX IF NOT EXISTS {name} ON job_items ({cols})"
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+        if not dry_run:
+            conn.exec_driver_sql("ANALYZE job_items")
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add composite indexes to job_items")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Add OCR stage columns to job_items (ingest and OCR run on separate queues):
+ - ocr_state (TEXT), ocr_detail (TEXT), ocr_started_at (DATETIME), ocr_finished_at (DATETIME)
+
+Items finished before the split (state 'ok' = ingest + OCR done inline) are backfilled
+with ocr_state 'ok'.
+
+Usage:
+  python scripts/migrate_job_item_ocr_stage.py
+  python scripts/migrate_job_item_ocr_stage.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+COLUMNS = (
+    ("ocr_state", "VARCHAR(20)"),
+    ("ocr_detail", "TEXT"),
+    ("ocr_started_at", "DATETIME"),
+    ("ocr_finished_at", "DATETIME"),
+)
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info('{table}')").fetchall()
+    return any(r[1] == column for r in rows)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Inspecting job_items for OCR stage columns ...")
+        ops = [
+            f"ALTER TABLE job_items ADD COLUMN {name} {ddl}"
+            for name, ddl in COLUMNS
+            if not column_exists(conn, "job_items", name)
+        ]
+        if not ops:
+            print("- All columns already present.")
+        for sql in ops:
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+
+        if dry_run and ops:
+            print("- Backfill of ocr_state runs after the columns are added.")
+        else:
+            sql = "UPDATE job_items SET ocr_state = 'ok', ocr_finished_at = finished_at WHERE state = 'ok' AND ocr_state IS NULL"
+            if dry_run:
+                n = conn.exec_driver_sql(
+                    "SELECT COUNT(*) FROM job_items WHERE state = 'ok' AND ocr_state IS NULL"
+                ).scalar()
+                print(f"- Backfill: {n} finished item(s) would get ocr_state='ok'.")
+            else:
+                n = conn.exec_driver_sql(sql).rowcount
+                print(f"- Backfill: {n} finished item(s) set to ocr_state='ok'.")
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add OCR stage columns to job_items")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
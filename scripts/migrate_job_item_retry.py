@@ -0,0 +1,61 @@
+"""
+Add retry bookkeeping to job_items: `attempts` / `ocr_attempts` (runs of each
+stage) and `retry_at` (backoff deadline), used by automatic retries of transient
+failures and the "dead" state (see docs/job_queue.md).
+
+Usage:
+  python scripts/migrate_job_item_retry.py
+  python scripts/migrate_job_item_retry.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+COLUMNS = (
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("ocr_attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("retry_at", "DATETIME"),
+)
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info('{table}')").fetchall()
+    return any(r[1] == column for r in rows)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Inspecting job_items for retry columns ...")
+        ops = [
+            f"ALTER TABLE job_items ADD COLUMN {name} {ddl}"
+            for name, ddl in COLUMNS
+            if not column_exists(conn, "job_items", name)
+        ]
+        ops.append("CREATE INDEX IF NOT EXISTS ix_job_items_retry_at ON job_items (retry_at)")
+        for sql in ops:
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add retry columns to job_items")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
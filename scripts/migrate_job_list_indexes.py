@@ -0,0 +1,53 @@
+"""
+Add composite indexes to jobs for the paginated jobs list (/jobs): newest first
+with keyset pagination on (created_at, id), optionally filtered by status or
+uploader.
+
+Usage:
+  python scripts/migrate_job_list_indexes.py
+  python scripts/migrate_job_list_indexes.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+INDEXES = (
+    ("ix_jobs_created_id", "created_at, id"),
+    ("ix_jobs_status_created", "status, created_at"),
+    ("ix_jobs_uploader_created", "uploader_username, created_at"),
+)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Ensuring jobs list indexes on jobs ...")
+        for name, cols in INDEXES:
+            sql = f"CREATE INDEX IF NOT EXISTS {name} ON jobs ({cols})"
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+        if not dry_run:
+            conn.exec_driver_sql("ANALYZE jobs")
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add jobs list indexes to jobs")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Add durable-queue columns to job_items (job_queue.py):
+ - ocr_pdfs (TEXT)             PDFs produced by ingest, JSON list, read by the OCR stage
+ - lease_owner (TEXT)          worker holding the item's current stage
+ - lease_expires_at (DATETIME) indexed; expired leases are requeued
+
+Items left 'processing' by the old in-process executor have no lease and are requeued
+by the dispatcher on its first poll.
+
+Usage:
+  python scripts/migrate_job_queue_lease.py
+  python scripts/migrate_job_queue_lease.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+COLUMNS = (
+    ("ocr_pdfs", "TEXT"),
+    ("lease_owner", "VARCHAR(100)"),
+    ("lease_expires_at", "DATETIME"),
+)
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info('{table}')").fetchall()
+    return any(r[1] == column for r in rows)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Inspecting job_items for queue lease columns ...")
+        ops = [
+            f"ALTER TABLE job_items ADD COLUMN {name} {ddl}"
+            for name, ddl in COLUMNS
+            if not column_exists(conn, "job_items", name)
+        ]
+        ops.append("CREATE INDEX IF NOT EXISTS ix_job_items_lease_expires_at ON job_items (lease_expires_at)")
+        for sql in ops:
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add durable queue lease columns to job_items")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Add `version` to jobs: a change counter bumped on every job / item update
+(job_events.py), used as the ETag of the status endpoints and by the SSE stream.
+Existing jobs start at 0.
+
+Usage:
+  python scripts/migrate_job_version.py
+  python scripts/migrate_job_version.py --dry-run
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path as _Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info('{table}')").fetchall()
+    return any(r[1] == column for r in rows)
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        print("Inspecting jobs for version column ...")
+        ops: list[str] = []
+        if not column_exists(conn, "jobs", "version"):
+            ops.append("ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        else:
+            print("- Column 'version' already exists on jobs.")
+        for sql in ops:
+            print(f"- Will execute: {sql}")
+            if not dry_run:
+                conn.exec_driver_sql(sql)
+    print("Done." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add version to jobs")
+    ap.add_argument('--dry-run', action='store_true')
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Add `source_file_id` and `page_number` to diabetic_retinopathy_reports and
+glaucoma_reports (virtual report pages served from the source PDF), and
+backfill them for existing reports.
+
+Backfill:
+  - page_number is parsed from report_file_name (..._DR_Page<N>.pdf / ..._GL_Page<N>.pdf)
+  - source_file_id is set when the encounter has exactly one PDF in encounter_files
+
+Usage:
+  python scripts/migrate_report_source_page.py
+  python scripts/migrate_report_source_page.py --dry-run
+
+Notes:
+  - Uses the SQLAlchemy engine configured in models.py
+  - SQLite compatible; uses PRAGMA to inspect schema
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+from pathlib import Path as _Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Ensure project root on path
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from models import engine  # noqa: E402
+
+TABLES = ("diabetic_retinopathy_reports", "glaucoma_reports")
+PAGE_RE = re.compile(r"_(?:DR|GL)_Page(\d+)\.pdf$", re.IGNORECASE)
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    rows = conn.exec_driver_sql(f"PRAGMA table_info('{table}')").fetchall()
+    cols = [r[1] for r in rows]
+    return column in cols
+
+
+def migrate(dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        for table in TABLES:
+            print(f"Inspecting schema for {table} ...")
+            has_source = column_exists(conn, table, "source_file_id")
+            has_page = column_exists(conn, table, "page_number")
+            if has_source:
+                print(f"- Column 'source_file_id' already exists on {table}.")
+            else:
+                print("- Column 'source_file_id' is missing and will be added (INTEGER, NULL, indexed).")
+                if not dry_run:
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table} ADD COLUMN source_file_id INTEGER REFERENCES encounter_files(id)"
+                    )
+                    conn.exec_driver_sql(
+                        f"CREATE INDEX IF NOT EXISTS ix_{table}_source_file_id ON {table} (source_file_id)"
+                    )
+            if has_page:
+                print(f"- Column 'page_number' already exists on {table}.")
+            else:
+                print("- Column 'page_number' is missing and will be added (INTEGER, NULL).")
+                if not dry_run:
+                    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN page_number INTEGER")
+
+            if dry_run and not (has_source and has_page):
+                continue  # columns do not exist yet; nothing to inspect for backfill
+
+            # Backfill rows that are missing either value
+            rows = conn.exec_driver_sql(
+                f"SELECT id, patient_encounter_id, report_file_name FROM {table} "
+                f"WHERE source_file_id IS NULL OR page_number IS NULL"
+            ).fetchall()
+            updated = 0
+            for rid, encounter_id, report_file_name in rows:
+                m = PAGE_RE.search(report_file_name or "")
+                page = int(m.group(1)) if m else None
+                pdfs = conn.exec_driver_sql(
+                    "SELECT id FROM encounter_files WHERE patient_encounter_id = ? AND lower(file_type) = 'pdf'",
+                    (encounter_id,),
+                ).fetchall()
+                source_id = pdfs[0][0] if len(pdfs) == 1 else None
+                if page is None and source_id is None:
+                    continue
+                updated += 1
+                if not dry_run:
+                    conn.exec_driver_sql(
+                        f"UPDATE {table} SET page_number = COALESCE(page_number, ?), "
+                        f"source_file_id = COALESCE(source_file_id, ?) WHERE id = ?",
+                        (page, source_id, rid),
+                    )
+            print(f"- Backfill: {updated} of {len(rows)} row(s) {'would be updated' if dry_run else 'updated'}.")
+
+    print("Migration complete." if not dry_run else "Dry run complete (no changes applied).")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Add source_file_id/page_number to report tables and backfill")
+    ap.add_argument("--dry-run", action="store_true", help="Do not apply changes; only report")
+    args = ap.parse_args()
+    migrate(dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
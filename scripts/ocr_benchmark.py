@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+OCR accuracy / throughput benchmark over a folder of golden (anonymized) PDFs.
+
+Golden folder layout:
+  <dir>/*.pdf
+  <dir>/expected.json   {"<file>.pdf": {"dr_page": 1, "dr_result": "...", "dr_qual": "...",
+                                        "gl_page": 2, "gl_result": "...", "vcdr_right": "0.5",
+                                        "vcdr_left": "0.4", "gl_qual": "..."}, ...}
+  Only the fields present for a file are scored; values are compared after
+  whitespace normalization (the same clean-up applied before DB writes).
+  tests/golden is a small synthetic set (scripts/build_golden_pdfs.py); see its README.
+
+The engine is any callable with the signature of
+ocr_extraction.find_report_pages_by_coords_with_grid(pdf_path, stats=dict) returning the
+8-tuple (dr_page, gl_page, dr_result, dr_qual, gl_result, vcdr_rt, vcdr_lt, gl_qual).
+If it fills stats["pages_rendered"] / stats["engine_calls"] those are reported too.
+
+Usage:
+  python scripts/ocr_benchmark.py tests/golden --out bench.json
+  python scripts/ocr_benchmark.py tests/golden --engine mypkg.ocr2:extract --out bench2.json --baseline bench.json
+  python scripts/ocr_benchmark.py tests/golden --use-cache --use-templates
+
+Notes:
+  - Runs fully offline (local Tesseract only).
+  - By default the OCR cache and the template classifier are disabled so runs are comparable;
+    --use-templates works on a temporary copy of OCR_TEMPLATE_DIR, so learned templates are not kept.
+  - Exit code 1 when --baseline is given and any field's match rate dropped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path as _Path
+
+try:
+    import resource  # POSIX only
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Ensure project root on path
+_ROOT = _Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+FIELDS = ("dr_page", "gl_page", "dr_result", "dr_qual", "gl_result", "vcdr_right", "vcdr_left", "gl_qual")
+DEFAULT_ENGINE = "ocr_extraction:find_report_pages_by_coords_with_grid"
+
+
+def load_engine(spec: str):
+    module_name, _, func_name = spec.partition(":")
+    if not func_name:
+        raise SystemExit(f"--engine must look like module:function, got {spec!r}")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _norm(value) -> str | None:
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _peak_rss_mb() -> dict | None:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS; children covers the tesseract processes
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def run_benchmark(golden_dir: _Path, engine, engine_name: str = "") -> dict:
+    golden_dir = _Path(golden_dir)
+    expected = json.loads((golden_dir / "expected.json").read_text(encoding="utf-8"))
+    per_field = {f: {"checked": 0, "matched": 0} for f in FIELDS}
+    files, seconds = [], []
+    pages_rendered = engine_calls = 0
+
+    for name in sorted(expected):
+        pdf = golden_dir / name
+        stats: dict = {}
+        start = time.perf_counter()
+        error = None
+        try:
+            values = engine(str(pdf), stats=stats)
+        except Exception as e:
+            values, error = (None,) * len(FIELDS), f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        seconds.append(elapsed)
+        pages_rendered += int(stats.get("pages_rendered") or 0)
+        engine_calls += int(stats.get("engine_calls") or 0)
+
+        got = dict(zip(FIELDS, values))
+        mismatches = {}
+        for field, want in expected[name].items():
+            if field not in per_field:
+                continue
+            per_field[field]["checked"] += 1
+            if _norm(got.get(field)) == _norm(want):
+                per_field[field]["matched"] += 1
+            else:
+                mismatches[field] = {"expected": want, "got": got.get(field)}
+        files.append({
+            "file": name,
+            "seconds": round(elapsed, 4),
+            "pages_rendered": stats.get("pages_rendered"),
+            "engine_calls": stats.get("engine_calls"),
+            "error": error,
+            "mismatches": mismatches,
+        })
+
+    checked = sum(v["checked"] for v in per_field.values())
+    matched = sum(v["matched"] for v in per_field.values())
+    for v in per_field.values():
+        v["match_rate"] = round(v["matched"] / v["checked"], 4) if v["checked"] else None
+    return {
+        "engine": engine_name,
+        "golden_dir": str(golden_dir),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "pdfs": len(files),
+        "errors": sum(1 for f in files if f["error"]),
+        "overall_match_rate": round(matched / checked, 4) if checked else None,
+        "fields": per_field,
+        "pages_rendered": pages_rendered,
+        "engine_calls": engine_calls,
+        "seconds_total": round(sum(seconds), 3),
+        "seconds_p50": round(_percentile(seconds, 50) or 0, 4),
+        "seconds_p95": round(_percentile(seconds, 95) or 0, 4),
+        "peak_rss_mb": _peak_rss_mb(),
+        "files": files,
+    }
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """Human-readable deltas; lines starting with 'REGRESSION' mark a lower match rate."""
+    lines = []
+    for field, cur in report["fields"].items():
+        old = (baseline.get("fields") or {}).get(field, {}).get("match_rate")
+        new = cur.get("match_rate")
+        if old is None or new is None:
+            continue
+        tag = "REGRESSION" if new < old else "ok"
+        lines.append(f"{tag:10} {field:11} {old:.3f} -> {new:.3f}")
+    for key in ("seconds_p50", "seconds_p95", "pages_rendered", "engine_calls"):
+        if baseline.get(key) is not None:
+            lines.append(f"{'info':10} {key:11} {baseline[key]} -> {report[key]}")
+    return lines
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="OCR accuracy/throughput benchmark over golden PDFs")
+    ap.add_argument("golden_dir", help="Folder with *.pdf and expected.json")
+    ap.add_argument("--engine", default=DEFAULT_ENGINE, help="module:function to benchmark")
+    ap.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    ap.add_argument("--baseline", help="Earlier JSON report to compare against")
+    ap.add_argument("--use-cache", action="store_true", help="Allow OCR cache hits (off by default)")
+    ap.add_argument("--use-templates", action="store_true",
+                    help="Use a temporary copy of the header templates (off by default)")
+    args = ap.parse_args()
+
+    # Must be set before the engine imports ocr_extraction / page_classifier / ocr_cache
+    if not args.use_cache:
+        os.environ["OCR_CACHE"] = "false"
+    tmp_templates = None
+    if args.use_templates:
+        tmp_templates = tempfile.mkdtemp(prefix="ocr_templates_")
+        src = _ROOT / os.getenv("OCR_TEMPLATE_DIR", "files/ocr_templates")
+        if src.exists():
+            shutil.copytree(src, tmp_templates, dirs_exist_ok=True)
+        os.environ["OCR_TEMPLATE_DIR"] = tmp_templates
+    else:
+        os.environ["OCR_TEMPLATE_CLASSIFIER"] = "false"
+
+    try:
+        # Engine progress output goes to stderr so stdout stays machine-readable
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_benchmark(_Path(args.golden_dir), load_engine(args.engine), args.engine)
+    finally:
+        if tmp_templates:
+            shutil.rmtree(tmp_templates, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        _Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+    print(f"\n{report['pdfs']} PDF(s), {report['errors']} error(s), overall match {report['overall_match_rate']}, "
+          f"p50 {report['seconds_p50']}s, p95 {report['seconds_p95']}s, "
+          f"renders {report['pages_rendered']}, engine calls {report['engine_calls']}, peak RSS {report['peak_rss_mb']}",
+          file=sys.stderr)
+    for field, v in report["fields"].items():
+        if v["checked"]:
+            print(f"  {field:11} {v['matched']}/{v['checked']}  ({v['match_rate']:.3f})", file=sys.stderr)
+
+    if args.baseline:
+        lines = compare(report, json.loads(_Path(args.baseline).read_text(encoding="utf-8")))
+        print("\n".join(lines), file=sys.stderr)
+        if any(line.startswith("REGRESSION") for line in lines):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
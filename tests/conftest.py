@@ -1,6 +1,13 @@
 import pytest
 import os
+import sys
 import tempfile
+
+# Never let tests touch the real database (models.py defaults to <repo>/zip_processing.db).
+# The engine is created when models is first imported, so this has to come before that import.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fundus_tests_'), 'test.db')
+
+import models
 from app import create_app
 from models import Base, engine, Session, User, Role
 from sqlalchemy import create_engine, select
@@ -33,6 +40,29 @@ def app():
     os.unlink(db_path)
 
 
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """
+    A fresh SQLite database under tmp_path with all tables: models.engine, every module that
+    imported it, and the shared Session are pointed at it for the test. Yields the engine.
+    """
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    test_engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(test_engine)
+    monkeypatch.setenv('DATABASE_URL', url)
+    monkeypatch.setattr(models, 'DATABASE_URL', url)
+    original = models.engine
+    for module in list(sys.modules.values()):
+        if getattr(module, 'engine', None) is original:
+            monkeypatch.setattr(module, 'engine', test_engine)
+    Session.configure(bind=test_engine)
+    try:
+        yield test_engine
+    finally:
+        Session.configure(bind=original)
+        test_engine.dispose()
+
+
 @pytest.fixture
 def client(app):
     """Create a test client for the app."""
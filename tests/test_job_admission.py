@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import flask_login
+import pytest
+
+import job_admission
+from job_admission import check_admission, queue_load, release_deferred_jobs
+from job_queue import STAGE_INGEST, claim_items
+from job_store import DEFERRED, db_create_job, db_get_job_payload
+from models import Job, JobItem, Session
+
+
+@pytest.fixture(autouse=True)
+def _limits(tmp_db, monkeypatch):
+    monkeypatch.setattr(job_admission, "_cached", None)
+    monkeypatch.setattr(job_admission, "QUEUE_LOAD_CACHE_SECONDS", 0)
+    monkeypatch.setattr(job_admission, "UPLOAD_MAX_QUEUED_ITEMS", 3)
+    monkeypatch.setattr(job_admission, "UPLOAD_MAX_DRAIN_SECONDS", 0)
+    monkeypatch.setattr(job_admission, "UPLOAD_BACKPRESSURE", "defer")
+
+
+def _finished_recently(n: int) -> None:
+    """n ZIPs ingested (no OCR) a minute ago, as recent throughput."""
+    token = db_create_job([f"old{i}.zip" for i in range(n)], [])
+    with Session() as db:
+        db.query(JobItem).update({"state": "ingested", "ocr_state": "skipped",
+                                  "finished_at": datetime.utcnow() - timedelta(minutes=1)})
+        db.query(Job).filter_by(token=token).update({"status": "done"})
+        db.commit()
+
+
+class TestAdmission:
+    """Test cases for queue load, deferral and 429 decisions for uploads."""
+
+    def test_load_counts_backlog_and_throughput(self):
+        _finished_recently(6)
+        db_create_job(["a.zip", "b.zip"], [])
+        load = queue_load()
+        assert (load.ingest_backlog, load.ocr_backlog, load.deferred_jobs) == (2, 0, 0)
+        # 6 per 30 min window
+        assert load.ingest_per_hour == pytest.approx(12)
+        assert load.drain_seconds == pytest.approx(2 / 12 * 3600)
+
+    def test_over_limit_is_deferred_and_released_when_the_backlog_drops(self):
+        assert check_admission(5).action == "queue"  # an empty queue takes anything
+        db_create_job(["a.zip", "b.zip", "c.zip"], [])
+        admission = check_admission(1)
+        assert admission.action == "defer" and "4 ZIPs queued" in admission.reason
+        assert check_admission(1, "urgent").action == "queue"
+
+        late = db_create_job(["d.zip"], [], status=DEFERRED)
+        assert claim_items(STAGE_INGEST, 10, owner="w", per_job=10)[0].filename == "a.zip"
+        assert release_deferred_jobs() == 0
+
+        with Session() as db:
+            db.query(JobItem).filter(JobItem.filename != "d.zip").update(
+                {"state": "ingested", "ocr_state": "skipped", "lease_owner": None})
+            db.commit()
+        assert release_deferred_jobs() == 1
+        assert db_get_job_payload(late)["status"] == "queued"
+
+    def test_reject_mode_sets_retry_after(self, monkeypatch):
+        monkeypatch.setattr(job_admission, "UPLOAD_BACKPRESSURE", "reject")
+        _finished_recently(30)  # 60 per hour
+        db_create_job([f"{n}.zip" for n in "abcde"], [])
+        admission = check_admission(2)
+        assert admission.action == "reject"
+        # 4 over the limit at 60 per hour: 4 minutes
+        assert admission.retry_after == 240
+
+    def test_unknown_throughput_only_applies_the_depth_limit(self, monkeypatch):
+        monkeypatch.setattr(job_admission, "UPLOAD_MAX_DRAIN_SECONDS", 60)
+        db_create_job(["a.zip"], [])
+        load = queue_load()
+        assert load.drain_seconds is None
+        assert check_admission(1).action == "queue"
+
+    def test_only_admins_upload_urgent(self, monkeypatch):
+        from uploads.routes import _upload_priorities
+
+        class _User:
+            def __init__(self, *roles):
+                self.roles = roles
+
+            def has_role(self, *names):
+                return any(name in self.roles for name in names)
+
+        monkeypatch.setattr(flask_login.utils, "_get_user", lambda: _User("fileUploader"))
+        assert _upload_priorities() == ("normal", "backfill")
+        monkeypatch.setattr(flask_login.utils, "_get_user", lambda: _User("admin"))
+        assert _upload_priorities() == ("urgent", "normal", "backfill")
@@ -0,0 +1,74 @@
+import json
+import threading
+
+import pytest
+
+import job_events
+from job_events import job_generation, notify_job_changed, wait_for_job_change
+from job_queue import STAGE_INGEST, claim_items, finish_item
+from job_store import db_create_job, db_finalize_job, db_get_job_payload, db_get_job_version
+from jobs.routes import _job_event_stream
+
+
+pytestmark = pytest.mark.usefixtures("tmp_db")
+
+
+def _event(chunk: str) -> tuple[str, dict]:
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+
+class TestJobEvents:
+    """Test cases for job change versions and the status event stream."""
+
+    def test_every_change_bumps_version_and_wakes_waiters(self):
+        token = db_create_job(["a.zip"], [])
+        job_id = db_get_job_payload(token)["id"]
+        assert db_get_job_version(token) == 0
+        seen = job_generation(job_id)
+
+        woke = []
+        waiter = threading.Thread(target=lambda: woke.append(wait_for_job_change(job_id, seen, timeout=5)))
+        waiter.start()
+        (claimed,) = claim_items(STAGE_INGEST, 1, owner="w")
+        waiter.join(2)
+        assert woke and woke[0] != seen
+        assert db_get_job_version(token) == 1
+
+        finish_item(claimed, STAGE_INGEST, "ingested", ocr_state="skipped")
+        assert db_get_job_version(token) == 2
+        assert db_get_job_version("no-such-token") is None
+
+    def test_only_recently_changed_jobs_are_tracked(self, monkeypatch):
+        monkeypatch.setattr(job_events, "MAX_TRACKED_JOBS", 3)
+        monkeypatch.setattr(job_events, "_generations", {})
+        notify_job_changed(1)
+        seen = job_generation(1)
+        notify_job_changed(2, 3, 4)
+        assert sorted(job_events._generations) == [2, 3, 4]
+        # Job 1 was forgotten: its stream wakes at once and re-checks the version
+        assert wait_for_job_change(1, seen, timeout=0) != seen
+        notify_job_changed(1)
+        assert job_generation(1) not in (0, seen)
+
+    def test_stream_sends_snapshot_then_only_changed_items(self):
+        token = db_create_job(["a.zip", "b.zip"], [])
+        a, b = claim_items(STAGE_INGEST, 10, owner="w")
+        stream = _job_event_stream(token)
+        assert next(stream).startswith("retry:")
+
+        event, data = _event(next(stream))
+        assert event == "job" and data["job"]["status"] == "processing"
+        assert sorted(it["filename"] for it in data["items"]) == ["a.zip", "b.zip"]
+
+        finish_item(a, STAGE_INGEST, "error", "bad zip")
+        event, data = _event(next(stream))
+        assert [(it["filename"], it["state"]) for it in data["items"]] == [("a.zip", "error")]
+
+        finish_item(b, STAGE_INGEST, "ingested", ocr_state="skipped")
+        assert db_finalize_job(token) == "error"
+        event, data = _event(next(stream))
+        assert data["job"]["status"] == "error"
+        assert next(stream).startswith("event: end")
+        with pytest.raises(StopIteration):
+            next(stream)
@@ -0,0 +1,249 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+from job_queue import (
+    JOB_MAX_ATTEMPTS, STAGE_INGEST, STAGE_OCR, CancelCheck, ClaimedItem, cancel_job, claim_items, fail_item,
+    finish_item, heartbeat, is_transient_error, queue_wait_stats, requeue_expired, retry_failed_items,
+    set_job_priority,
+)
+from pdf_sandbox import PdfTimeoutError
+from job_store import db_create_job, db_finalize_job, db_get_job_payload
+from models import Job, JobItem, Session
+
+
+pytestmark = pytest.mark.usefixtures("tmp_db")
+
+
+class TestJobQueue:
+    """Test cases for the durable DB-backed job queue."""
+
+    def test_claim_is_exclusive_and_capped_per_job(self):
+        token = db_create_job(["a.zip", "b.zip"], [])
+        first = claim_items(STAGE_INGEST, 5, owner="w1", per_job=1)
+        assert [c.filename for c in first] == ["a.zip"]
+        # b.zip waits for a free slot of its job; a.zip is no longer claimable
+        assert claim_items(STAGE_INGEST, 5, owner="w2", per_job=1) == []
+        assert db_get_job_payload(token)["status"] == "processing"
+
+        assert finish_item(first[0], STAGE_INGEST, "ingested", ocr_state="queued", ocr_pdfs='["a.pdf"]')
+        assert [c.filename for c in claim_items(STAGE_INGEST, 5, owner="w2", per_job=1)] == ["b.zip"]
+        ocr = claim_items(STAGE_OCR, 5, owner="w3")
+        assert [(c.filename, c.ocr_pdfs) for c in ocr] == [("a.zip", '["a.pdf"]')]
+
+    def test_expired_lease_is_requeued_and_old_owner_loses_it(self):
+        db_create_job(["a.zip"], [])
+        (claimed,) = claim_items(STAGE_INGEST, 1, owner="crashed")
+        with Session() as db:
+            db.query(JobItem).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+            db.commit()
+        assert requeue_expired() == 1
+
+        (again,) = claim_items(STAGE_INGEST, 1, owner="w2")
+        assert again.id == claimed.id
+        assert not heartbeat(claimed.id, "crashed")
+        assert heartbeat(again.id, "w2")
+        assert not finish_item(claimed, STAGE_INGEST, "error", "stale worker")
+        assert finish_item(again, STAGE_INGEST, "ingested", ocr_state="skipped")
+        with Session() as db:
+            item = db.query(JobItem).one()
+            assert (item.state, item.lease_owner, item.lease_expires_at) == ("ingested", None, None)
+
+    def test_items_of_one_job_run_in_parallel_and_finalize_once(self):
+        token = db_create_job([f"{n}.zip" for n in "abcde"], [])
+        first = claim_items(STAGE_INGEST, 10, owner="w", per_job=3)
+        assert [c.filename for c in first] == ["a.zip", "b.zip", "c.zip"]
+        assert claim_items(STAGE_INGEST, 10, owner="w", per_job=3) == []
+        assert finish_item(first[0], STAGE_INGEST, "ingested", ocr_state="skipped")
+        assert [c.filename for c in claim_items(STAGE_INGEST, 10, owner="w", per_job=3)] == ["d.zip"]
+        rest = claim_items(STAGE_INGEST, 10, owner="w", per_job=5)
+        assert [c.filename for c in rest] == ["e.zip"]
+
+        with Session() as db:
+            claimed = [ClaimedItem(it.id, token, it.filename, None, "w", it.job_id)
+                       for it in db.query(JobItem).filter(JobItem.state == "processing")]
+        assert len(claimed) == 4
+
+        def finish(c):
+            state = "error" if c.filename == "c.zip" else "ingested"
+            finish_item(c, STAGE_INGEST, state, ocr_state=None if state == "error" else "skipped")
+            return db_finalize_job(token)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(finish, claimed))
+        assert "error" in results and set(results) <= {None, "error"}
+        payload = db_get_job_payload(token)
+        assert payload["status"] == "error" and payload["stages"]["ingest"]["error"] == 1
+
+
+class TestFairScheduling:
+    """Test cases for priorities and weighted fair dispatch across uploaders."""
+
+    def test_bulk_uploader_does_not_starve_others(self):
+        bulk = [db_create_job([f"bulk{i}.zip"], [], uploader_user_id=1) for i in range(6)]
+        db_create_job(["clinic.zip"], [], uploader_user_id=2)
+        claimed = claim_items(STAGE_INGEST, 2, owner="w")
+        assert sorted(c.filename for c in claimed) == ["bulk0.zip", "clinic.zip"]
+        assert len(bulk) == 6
+
+    def test_urgent_goes_first_and_priority_can_change(self):
+        for i in range(3):
+            db_create_job([f"n{i}.zip"], [], uploader_user_id=1)
+        late = db_create_job(["late.zip"], [], uploader_user_id=3)
+        db_create_job(["u.zip"], [], uploader_user_id=2, priority="urgent")
+        assert set_job_priority(late, "backfill")
+
+        (first,) = claim_items(STAGE_INGEST, 1, owner="w")
+        assert first.filename == "u.zip"
+        # normal (weight 2) from an idle uploader beats backfill (weight 1)
+        (second,) = claim_items(STAGE_INGEST, 1, owner="w")
+        assert second.filename == "n0.zip"
+
+    def test_finished_job_cannot_be_reprioritized(self):
+        token = db_create_job(["a.zip"], [])
+        with Session() as db:
+            db.query(Job).update({"status": "done"})
+            db.commit()
+        assert not set_job_priority(token, "urgent")
+        with pytest.raises(ValueError):
+            set_job_priority(token, "asap")
+
+    def test_queue_wait_stats(self):
+        db_create_job(["a.zip"], [], priority="urgent")
+        db_create_job(["b.zip"], [])
+        claim_items(STAGE_INGEST, 1, owner="w")
+        stats = queue_wait_stats(max_age=0)
+        assert stats["urgent"]["started"] == 1 and stats["urgent"]["wait_avg_s"] >= 0
+        assert stats["normal"]["queued"] == 1 and stats["normal"]["oldest_queued_s"] >= 0
+        assert stats["backfill"]["started"] == 0
+
+    def test_queue_wait_stats_are_aggregated_and_cached(self):
+        token = db_create_job([f"{n}.zip" for n in range(10)], [])
+        created = datetime.utcnow() - timedelta(hours=1)
+        with Session() as db:
+            db.query(Job).filter_by(token=token).update({"created_at": created})
+            for n, item in enumerate(db.query(JobItem).order_by(JobItem.id), start=1):
+                item.started_at = created + timedelta(seconds=10 * n)  # waits 10, 20, ... 100 s
+                item.finished_at = item.started_at + timedelta(seconds=1)
+                item.ocr_started_at = item.finished_at + timedelta(seconds=2 * n)  # 2, 4, ... 20 s
+                item.state = "ingested"
+            db.commit()
+
+        normal = queue_wait_stats(max_age=0)["normal"]
+        assert (normal["started"], normal["wait_avg_s"], normal["wait_p95_s"]) == (10, 55.0, 100.0)
+        assert (normal["ocr_wait_avg_s"], normal["ocr_wait_p95_s"]) == (11.0, 20.0)
+        assert normal["queued"] == 0
+
+        db_create_job(["late.zip"], [])
+        assert queue_wait_stats()["normal"]["queued"] == 0  # measured at most every QUEUE_STATS_CACHE_SECONDS
+        assert queue_wait_stats(max_age=0)["normal"]["queued"] == 1
+
+
+class TestRetries:
+    """Test cases for automatic retries with backoff and the dead state."""
+
+    @staticmethod
+    def _make_due():
+        with Session() as db:
+            db.query(JobItem).update({"retry_at": datetime.utcnow() - timedelta(seconds=1)})
+            db.commit()
+
+    def test_transient_errors_are_classified(self):
+        assert is_transient_error(PermissionError(13, "Permission denied"))
+        assert is_transient_error(PdfTimeoutError("OCR took too long"))
+        assert is_transient_error("OperationalError: database is locked")
+        assert not is_transient_error(ValueError("Bad ZIP file"))
+        assert not is_transient_error("Refused: ZIP contains path traversal")
+        assert not is_transient_error(None)
+
+    def test_transient_failure_backs_off_then_goes_dead(self):
+        token = db_create_job(["a.zip"], [])
+        for attempt in range(1, JOB_MAX_ATTEMPTS):
+            (claimed,) = claim_items(STAGE_INGEST, 1, owner="w")
+            assert fail_item(claimed, STAGE_INGEST, "file locked", transient=True) == "queued"
+            # not claimable before its retry_at
+            assert claim_items(STAGE_INGEST, 1, owner="w") == []
+            with Session() as db:
+                item = db.query(JobItem).one()
+                assert item.attempts == attempt and item.retry_at > datetime.utcnow()
+                assert item.finished_at is None
+            self._make_due()
+
+        (claimed,) = claim_items(STAGE_INGEST, 1, owner="w")
+        assert fail_item(claimed, STAGE_INGEST, "file locked", transient=True) == "dead"
+        assert db_finalize_job(token) == "error"
+        item = db_get_job_payload(token)["items"][0]
+        assert item["state"] == "dead" and item["attempts"] == JOB_MAX_ATTEMPTS
+
+    def test_permanent_failure_is_not_retried(self):
+        db_create_job(["a.zip"], [])
+        (claimed,) = claim_items(STAGE_INGEST, 1, owner="w")
+        assert fail_item(claimed, STAGE_INGEST, "Bad ZIP file", transient=False) == "error"
+        assert claim_items(STAGE_INGEST, 1, owner="w") == []
+
+    def test_worker_lost_too_often_goes_dead(self):
+        db_create_job(["a.zip"], [])
+        with Session() as db:
+            db.query(JobItem).update({"state": "processing", "attempts": JOB_MAX_ATTEMPTS,
+                                      "lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+            db.commit()
+        assert requeue_expired() == 1
+        with Session() as db:
+            assert db.query(JobItem).one().state == "dead"
+
+    def test_manual_retry_reopens_failed_job(self):
+        token = db_create_job(["a.zip", "b.zip"], [])
+        first, second = claim_items(STAGE_INGEST, 2, owner="w")
+        fail_item(first, STAGE_INGEST, "Bad ZIP file", transient=False)
+        finish_item(second, STAGE_INGEST, "ingested", ocr_state="skipped")
+        assert db_finalize_job(token) == "error"
+
+        assert retry_failed_items([token]) == 1
+        payload = db_get_job_payload(token)
+        assert payload["status"] == "processing"
+        (again,) = claim_items(STAGE_INGEST, 2, owner="w")
+        assert again.filename == first.filename
+        with Session() as db:
+            assert db.get(JobItem, again.id).attempts == 1
+
+
+class TestCancellation:
+    """Test cases for cancelling queued and running jobs."""
+
+    def test_cancel_drops_queued_items_and_flags_running_ones(self):
+        token = db_create_job(["a.zip", "b.zip", "c.zip"], [])
+        (running,) = claim_items(STAGE_INGEST, 1, owner="w")
+        should_stop = CancelCheck(token, interval=60)
+        assert not should_stop()
+
+        assert sorted(cancel_job(token)) == ["b.zip", "c.zip"]
+        assert cancel_job(token) is None
+        assert db_get_job_payload(token)["status"] == "cancelled"
+        assert claim_items(STAGE_INGEST, 5, owner="w") == []
+        # throttled until forced or the interval passes
+        assert not should_stop() and should_stop(force=True) and should_stop()
+
+        assert finish_item(running, STAGE_INGEST, "cancelled", "Cancelled after extracting 1 file(s)")
+        assert db_finalize_job(token) == "cancelled"
+        stages = db_get_job_payload(token)["stages"]
+        assert stages["ingest"] == {"cancelled": 3}
+        assert not set_job_priority(token, "urgent")
+
+    def test_ocr_queued_after_cancel_is_never_claimed(self):
+        token = db_create_job(["a.zip"], [])
+        (running,) = claim_items(STAGE_INGEST, 1, owner="w")
+        assert cancel_job(token) == []
+        finish_item(running, STAGE_INGEST, "ingested", ocr_state="queued", ocr_pdfs='["a.pdf"]')
+        assert claim_items(STAGE_OCR, 5, owner="w") == []
+
+    def test_lost_worker_of_cancelled_job_is_not_requeued(self):
+        token = db_create_job(["a.zip"], [])
+        claim_items(STAGE_INGEST, 1, owner="crashed")
+        cancel_job(token)
+        with Session() as db:
+            db.query(JobItem).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+            db.commit()
+        assert requeue_expired() == 1
+        assert db_finalize_job(token) == "cancelled"
+        assert retry_failed_items([token]) == 0
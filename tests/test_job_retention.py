@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import job_retention
+from job_retention import db_get_archived_job, purge_expired_jobs
+from job_store import db_create_job, db_get_job_payload
+from models import Job, JobArchive, JobItem, Session
+
+
+@pytest.fixture(autouse=True)
+def _no_pause(tmp_db, monkeypatch):
+    monkeypatch.setattr(job_retention, "JOB_RETENTION_PAUSE_SECONDS", 0)
+
+
+def _finished_job(filenames: list[str], days_ago: int, status: str = "done", **item_values) -> str:
+    token = db_create_job(filenames, [], uploader_username="alice")
+    when = datetime.utcnow() - timedelta(days=days_ago)
+    with Session() as db:
+        job_id = db.query(Job.id).filter_by(token=token).scalar()
+        values = {"state": "ingested", "ocr_state": "ok", "started_at": when, "finished_at": when,
+                  "ocr_finished_at": when}
+        db.query(JobItem).filter_by(job_id=job_id).update({**values, **item_values})
+        db.query(Job).filter_by(id=job_id).update({"status": status, "updated_at": when, "created_at": when})
+        db.commit()
+    return token
+
+
+class TestRetention:
+    """Test cases for archiving and batch-deleting finished jobs past the retention period."""
+
+    def test_old_finished_jobs_are_archived_and_deleted_in_batches(self):
+        old = _finished_job([f"{n}.zip" for n in range(5)], days_ago=100)
+        failed = _finished_job(["bad.zip", "good.zip"], days_ago=100, status="error")
+        with Session() as db:
+            db.query(JobItem).filter_by(filename="bad.zip").update(
+                {"state": "dead", "ocr_state": None, "detail": "x" * 1000})
+            db.commit()
+        recent = _finished_job(["new.zip"], days_ago=5)
+
+        summary = purge_expired_jobs(days=90, batch=2)
+        assert summary == {"archived": 2, "items_deleted": 7, "jobs_deleted": 2, "skipped": False}
+        assert db_get_job_payload(old) is None
+        assert db_get_job_payload(recent)["status"] == "done"
+
+        archived = db_get_archived_job(old)
+        assert (archived["items"], archived["failed"], archived["uploader_username"]) == (5, 0, "alice")
+        assert archived["stages"] == {"ingest": {"ingested": 5}, "ocr": {"ok": 5}}
+        archived = db_get_archived_job(failed)
+        assert archived["status"] == "error" and archived["failed"] == 1
+        assert archived["failures"] == [
+            {"filename": "bad.zip", "stage": "ingest", "detail": "x" * job_retention.ARCHIVE_DETAIL_CHARS}]
+
+    def test_unfinished_and_dry_run_jobs_are_kept(self):
+        queued = db_create_job(["q.zip"], [])
+        with Session() as db:
+            db.query(Job).update({"updated_at": datetime.utcnow() - timedelta(days=100)})
+            db.commit()
+        # A cancelled job whose item is still stopping is not archived yet
+        stopping = _finished_job(["s.zip"], days_ago=100, status="cancelled", ocr_state="processing")
+        old = _finished_job(["a.zip", "b.zip"], days_ago=100)
+
+        assert purge_expired_jobs(days=90, dry_run=True) == {
+            "archived": 1, "items_deleted": 2, "jobs_deleted": 1, "skipped": False}
+        assert db_get_job_payload(old) is not None
+        assert purge_expired_jobs(days=0)["skipped"]
+
+        assert purge_expired_jobs(days=90)["jobs_deleted"] == 1
+        assert db_get_job_payload(queued) and db_get_job_payload(stopping)
+
+    def test_interrupted_run_resumes_and_changed_jobs_are_rearchived(self, monkeypatch):
+        old = _finished_job(["a.zip", "b.zip", "c.zip"], days_ago=100, status="error")
+        # Archived, then stopped before any delete
+        delete_items = job_retention._delete_items_batch
+        monkeypatch.setattr(job_retention, "_delete_items_batch", lambda batch: 0)
+        assert purge_expired_jobs(days=90)["archived"] == 1
+        monkeypatch.setattr(job_retention, "_delete_items_batch", delete_items)
+
+        # Retried since it was archived: not deleted, archived again once it is old enough
+        with Session() as db:
+            db.query(Job).filter_by(token=old).update({"status": "queued", "updated_at": datetime.utcnow()})
+            db.commit()
+        assert purge_expired_jobs(days=90)["jobs_deleted"] == 0
+        assert db_get_job_payload(old)["status"] == "queued"
+
+        # ... 95 days later: the retry finished a day after the old summary was taken
+        with Session() as db:
+            db.query(JobArchive).update({"archived_at": datetime.utcnow() - timedelta(days=96)})
+            db.query(Job).filter_by(token=old).update(
+                {"status": "done", "updated_at": datetime.utcnow() - timedelta(days=95)})
+            db.commit()
+        assert purge_expired_jobs(days=90)["jobs_deleted"] == 1
+        assert db_get_archived_job(old)["status"] == "done"
+        with Session() as db:
+            assert db.query(JobArchive).count() == 1
+
+    def test_direct_upload_jobs_are_purged(self):
+        # Direct uploads write their job and items in one request and finish as "completed"
+        when = datetime.utcnow() - timedelta(days=100)
+        with Session() as db:
+            for status in ("completed", "error"):
+                job = Job(token=f"direct-{status}", status=status, created_at=when, updated_at=when)
+                job.items = [JobItem(filename="eye.jpg", state="completed"), JobItem(filename="x.jpg", state=status)]
+                db.add(job)
+            db.commit()
+
+        assert purge_expired_jobs(days=90)["jobs_deleted"] == 2
+        archived = db_get_archived_job("direct-completed")
+        assert (archived["status"], archived["failed"]) == ("completed", 0)
+        assert archived["stages"]["ingest"] == {"completed": 2}
+        assert db_get_archived_job("direct-error")["failed"] == 1
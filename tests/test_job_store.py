@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import event
+
+from job_queue import STAGE_INGEST, STAGE_OCR, claim_items, finish_item
+from job_store import (
+    db_create_job, db_finalize_job, db_get_job_payload, db_get_job_version, db_list_jobs, decode_jobs_cursor,
+)
+from models import Job, JobItem, Session
+
+
+pytestmark = pytest.mark.usefixtures("tmp_db")
+
+
+class TestTwoStageJob:
+    """Test cases for jobs whose items are ingested and OCR'd on separate queues."""
+
+    def test_job_stays_open_until_ocr_finishes(self):
+        token = db_create_job(["a.zip", "b.zip"], [])
+        a, b = claim_items(STAGE_INGEST, 10, owner="w")
+        finish_item(a, STAGE_INGEST, "ingested", "Ingested 2 PDF(s); OCR queued", ocr_state="queued")
+        finish_item(b, STAGE_INGEST, "ingested", "Ingested (no PDFs to OCR)", ocr_state="skipped")
+        assert db_finalize_job(token) is None
+
+        (ocr,) = claim_items(STAGE_OCR, 10, owner="w")
+        assert db_finalize_job(token) is None
+        finish_item(ocr, STAGE_OCR, "ok", "OCR for 2 PDF(s)")
+        assert db_finalize_job(token) == "done"
+
+        payload = db_get_job_payload(token)
+        assert payload["status"] == "done"
+        assert payload["stages"] == {"ingest": {"ingested": 2}, "ocr": {"ok": 1, "skipped": 1}}
+        item = next(it for it in payload["items"] if it["filename"] == "a.zip")
+        assert item["ocr_started_at"] and item["ocr_finished_at"]
+
+    def test_ocr_or_ingest_failure_fails_job(self):
+        token = db_create_job(["a.zip", "b.zip"], [])
+        a, b = claim_items(STAGE_INGEST, 10, owner="w")
+        finish_item(a, STAGE_INGEST, "error", "bad zip")
+        finish_item(b, STAGE_INGEST, "ingested", ocr_state="queued")
+        assert db_finalize_job(token) is None
+        (ocr,) = claim_items(STAGE_OCR, 10, owner="w")
+        finish_item(ocr, STAGE_OCR, "error", "OCR failed for 1 of 1 PDF(s)")
+        assert db_finalize_job(token) == "error"
+
+
+class TestStateWrites:
+    """Test cases for the queue's item state writes."""
+
+    def test_claims_are_one_transaction_with_one_bump_per_job(self, tmp_db):
+        first = db_create_job(["a.zip", "b.zip", "c.zip"], [])
+        second = db_create_job(["d.zip"], [])
+        commits = []
+        event.listen(tmp_db, "commit", lambda conn: commits.append(conn))
+
+        assert len(claim_items(STAGE_INGEST, 10, owner="w")) == 4
+        assert len(commits) == 1
+        assert db_get_job_version(first) == 1 and db_get_job_version(second) == 1
+        assert db_get_job_payload(first)["status"] == "processing"
+
+    def test_finish_does_not_look_up_the_job(self, tmp_db):
+        token = db_create_job(["a.zip"], [])
+        (claimed,) = claim_items(STAGE_INGEST, 10, owner="w")
+        statements = []
+        event.listen(tmp_db, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        assert finish_item(claimed, STAGE_INGEST, "ingested", ocr_state="skipped")
+        assert [sql.split()[0] for sql in statements] == ["UPDATE", "UPDATE"]
+        assert db_get_job_version(token) == 2
+
+
+class TestJobsList:
+    """Test cases for the grouped, keyset-paginated jobs list."""
+
+    def test_totals_and_keyset_pages(self):
+        base = datetime(2026, 1, 1)
+        tokens = []
+        for i in range(5):
+            token = db_create_job([f"{i}a.zip", f"{i}b.zip"], [], uploader_username="alice" if i % 2 else "bob")
+            tokens.append(token)
+        with Session() as db:
+            for i, token in enumerate(tokens):
+                # jobs 2 and 3 share a created_at, so the cursor must tie-break on id
+                db.query(Job).filter_by(token=token).update({"created_at": base + timedelta(minutes=min(i, 1) + i // 2)})
+            db.commit()
+        with Session() as db:
+            finished = {"finished_at": datetime.utcnow()}
+            db.query(JobItem).filter_by(filename="4a.zip").update({"state": "error", "detail": "bad zip", **finished})
+            db.query(JobItem).filter_by(filename="4b.zip").update({"state": "ingested", "ocr_state": "skipped", **finished})
+            db.commit()
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = db_list_jobs(limit=2, before=decode_jobs_cursor(cursor))
+            seen.extend(r.token for r in rows)
+            if cursor is None:
+                break
+        assert sorted(seen) == sorted(tokens) and len(seen) == 5
+
+        rows, _ = db_list_jobs(limit=10)
+        newest = rows[0]
+        assert newest.token == tokens[4]
+        assert (newest.items, newest.errors, newest.finished) == (2, 1, 2)
+        assert newest.last_finished_at is not None
+
+        rows, _ = db_list_jobs(uploader="alice")
+        assert {r.token for r in rows} == {tokens[1], tokens[3]}
+        rows, _ = db_list_jobs(status="queued", created_from=base + timedelta(minutes=1))
+        assert tokens[0] not in {r.token for r in rows} and len(rows) == 4
@@ -0,0 +1,87 @@
+import importlib.util
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import fitz
+import pytest
+
+import ocr_extraction
+
+_spec = importlib.util.spec_from_file_location(
+    "ocr_benchmark", Path(__file__).resolve().parent.parent / "scripts" / "ocr_benchmark.py"
+)
+ocr_benchmark = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ocr_benchmark)
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+
+
+def _fake_engine(pdf_path, stats=None):
+    stats["pages_rendered"] = 2
+    stats["engine_calls"] = 5
+    if pdf_path.endswith("bad.pdf"):
+        raise RuntimeError("broken")
+    return (1, 2, "No  DR", None, "Referable Glaucoma", "0.5", "0.61", None)
+
+
+class TestOcrBenchmark:
+    """Test cases for the golden-PDF OCR benchmark."""
+
+    def _golden(self, tmp_path):
+        (tmp_path / "expected.json").write_text(json.dumps({
+            "a.pdf": {"dr_page": 1, "dr_result": "No DR", "vcdr_right": "0.5", "vcdr_left": "0.6"},
+            "bad.pdf": {"dr_page": 1},
+        }))
+        return tmp_path
+
+    def test_field_match_rates_and_counters(self, tmp_path):
+        report = ocr_benchmark.run_benchmark(self._golden(tmp_path), _fake_engine)
+        fields = report["fields"]
+        assert fields["dr_page"] == {"checked": 2, "matched": 1, "match_rate": 0.5}
+        assert fields["dr_result"]["match_rate"] == 1.0  # whitespace-normalized
+        assert fields["vcdr_left"]["match_rate"] == 0.0
+        assert fields["gl_qual"]["match_rate"] is None
+        assert (report["pdfs"], report["errors"]) == (2, 1)
+        assert (report["pages_rendered"], report["engine_calls"]) == (4, 10)
+        assert report["seconds_p95"] >= report["seconds_p50"] >= 0
+
+    def test_compare_flags_regressions(self):
+        old = {"fields": {"dr_page": {"match_rate": 1.0}, "vcdr_left": {"match_rate": 0.5}}}
+        new = {"fields": {"dr_page": {"match_rate": 0.9}, "vcdr_left": {"match_rate": 0.75}},
+               "seconds_p50": 1, "seconds_p95": 2, "pages_rendered": 3, "engine_calls": 4}
+        lines = ocr_benchmark.compare(new, old)
+        assert lines[0].startswith("REGRESSION") and "dr_page" in lines[0]
+        assert lines[1].startswith("ok")
+
+    def test_percentile(self):
+        assert ocr_benchmark._percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+        assert ocr_benchmark._percentile([], 95) is None
+
+
+def _text_layer_region(renderer, coords, dpi):
+    """Stands in for Tesseract: the golden PDFs carry their text in a text layer."""
+    scale = 72 / ocr_extraction.BASE_DPI
+    return renderer.page.get_text("text", clip=fitz.Rect(*(c * scale for c in coords))).strip(), 95.0
+
+
+class TestGoldenSet:
+    """Smoke test cases for the benchmark on the golden set in tests/golden."""
+
+    def test_extraction_scores_every_field(self, monkeypatch):
+        monkeypatch.setattr(ocr_extraction, "_read_region", _text_layer_region)
+        monkeypatch.setattr(ocr_extraction, "get_classifier", lambda: None)
+        monkeypatch.setattr(ocr_extraction, "get_ocr_cache", lambda: None)
+        report = ocr_benchmark.run_benchmark(GOLDEN_DIR, ocr_extraction.find_report_pages_by_coords_with_grid)
+        assert (report["pdfs"], report["errors"], report["overall_match_rate"]) == (4, 0, 1.0)
+        assert report["fields"]["vcdr_left"]["checked"] == 2
+
+    @pytest.mark.skipif(shutil.which("tesseract") is None, reason="Tesseract not installed")
+    def test_cli_runs_with_tesseract(self, tmp_path):
+        out = tmp_path / "bench.json"
+        script = Path(__file__).resolve().parent.parent / "scripts" / "ocr_benchmark.py"
+        subprocess.run([sys.executable, str(script), str(GOLDEN_DIR), "--out", str(out)], check=True, timeout=600)
+        report = json.loads(out.read_text())
+        assert (report["pdfs"], report["errors"]) == (4, 0)
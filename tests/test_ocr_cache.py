@@ -0,0 +1,62 @@
+import ocr_cache
+import ocr_extraction
+from ocr_cache import OcrCache
+from ocr_extraction import _read_region
+
+
+class _CountingRenderer:
+    def __init__(self, cache, cache_key):
+        self.cache = cache
+        self.cache_key = cache_key
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.engine_calls = 0
+        self.rendered = []
+
+    def at(self, dpi):
+        self.rendered.append(dpi)
+        return dpi
+
+
+class TestOcrCache:
+    """Test cases for the persistent OCR region cache."""
+
+    def test_put_then_get(self, tmp_path):
+        cache = OcrCache(tmp_path / "c.db")
+        assert cache.get("abc", 0, (0, 0, 10, 10), 150, "t-5") is None
+        cache.put("abc", 0, (0, 0, 10, 10), 150, "t-5", "Result: No DR", 91.5)
+        assert cache.get("abc", 0, (0, 0, 10, 10), 150, "t-5") == ("Result: No DR", 91.5)
+        # Any key component change is a miss
+        assert cache.get("abc", 0, (0, 0, 10, 10), 300, "t-5") is None
+        assert cache.get("abc", 0, (0, 0, 10, 10), 150, "t-4") is None
+        stats = cache.stats()
+        assert (stats["entries"], stats["session_hits"], stats["session_misses"]) == (1, 1, 3)
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = OcrCache(tmp_path / "c.db", max_entries=2)
+        for page in range(3):
+            cache.put("abc", page, (0, 0, 1, 1), 150, "t", f"p{page}", 90.0)
+        cache.get("abc", 0, (0, 0, 1, 1), 150, "t")  # page 0 becomes most recently used
+        assert cache.evict() == 1
+        assert cache.get("abc", 1, (0, 0, 1, 1), 150, "t") is None
+        assert cache.get("abc", 0, (0, 0, 1, 1), 150, "t") is not None
+
+    def test_cap_holds_across_short_lived_caches(self, tmp_path, monkeypatch):
+        # One OcrCache per sandboxed PDF, each writing only a few regions
+        monkeypatch.setattr(ocr_cache, "EVICT_EVERY", 10)
+        for pdf in range(30):
+            cache = OcrCache(tmp_path / "c.db", max_entries=20)
+            for page in range(3):
+                cache.put(f"pdf{pdf}", page, (0, 0, 1, 1), 150, "t", "x", 90.0)
+        assert OcrCache(tmp_path / "c.db").stats()["entries"] == 20
+
+    def test_cached_region_skips_render_and_ocr(self, tmp_path, monkeypatch):
+        calls = []
+        monkeypatch.setattr(ocr_extraction, "_ocr_region", lambda img, coords, dpi: calls.append(dpi) or ("VCDR 0.5", 88.0))
+        cache = OcrCache(tmp_path / "c.db")
+        first = _CountingRenderer(cache, ("abc", 1, "t"))
+        assert _read_region(first, (0, 0, 10, 10), 150) == ("VCDR 0.5", 88.0)
+        second = _CountingRenderer(cache, ("abc", 1, "t"))
+        assert _read_region(second, (0, 0, 10, 10), 150) == ("VCDR 0.5", 88.0)
+        assert calls == [150]
+        assert second.rendered == [] and second.cache_hits == 1
@@ -0,0 +1,125 @@
+import ocr_extraction
+from ocr_extraction import (
+    _accept_field,
+    _accept_header,
+    _accept_vcdr,
+    _ocr_region_adaptive,
+    _parse_dpi_tiers,
+    _page_scan_order,
+    _scale_coords,
+    template_version,
+)
+
+
+class _FakeRenderer:
+    def __init__(self):
+        self.rendered = []
+        self.engine_calls = 0
+
+    def at(self, dpi):
+        self.rendered.append(dpi)
+        return dpi
+
+
+class TestAdaptiveDpi:
+    """Test cases for adaptive DPI escalation in ocr_extraction."""
+
+    def test_scale_coords_from_base_dpi(self):
+        assert _scale_coords((0, 200, 1200, 400), 150) == (0, 100, 600, 200)
+        assert _scale_coords((0, 200, 1200, 400), 300) == (0, 200, 1200, 400)
+
+    def test_low_tier_accepted_when_confident(self, monkeypatch):
+        monkeypatch.setattr(ocr_extraction, "OCR_DPI_TIERS", (150, 300))
+        monkeypatch.setattr(ocr_extraction, "_ocr_region", lambda img, coords, dpi: ("Result: No DR", 91.0))
+        renderer = _FakeRenderer()
+        text, dpi, accepted = _ocr_region_adaptive(renderer, (0, 0, 10, 10), _accept_field)
+        assert (text, dpi, accepted) == ("Result: No DR", 150, True)
+        assert renderer.rendered == [150]
+
+    def test_escalates_on_low_confidence(self, monkeypatch):
+        monkeypatch.setattr(ocr_extraction, "OCR_DPI_TIERS", (150, 300))
+        reads = {150: ("VCDR - 0.5", 20.0), 300: ("VCDR - 0.5", 88.0)}
+        monkeypatch.setattr(ocr_extraction, "_ocr_region", lambda img, coords, dpi: reads[dpi])
+        renderer = _FakeRenderer()
+        text, dpi, accepted = _ocr_region_adaptive(renderer, (0, 0, 10, 10), _accept_vcdr)
+        assert (dpi, accepted) == (300, True)
+        assert renderer.rendered == [150, 300]
+
+    def test_highest_tier_returned_when_nothing_accepted(self, monkeypatch):
+        monkeypatch.setattr(ocr_extraction, "OCR_DPI_TIERS", (100, 200, 300))
+        monkeypatch.setattr(ocr_extraction, "_ocr_region", lambda img, coords, dpi: ("", -1.0))
+        text, dpi, accepted = _ocr_region_adaptive(_FakeRenderer(), (0, 0, 10, 10), _accept_field)
+        assert (text, dpi, accepted) == ("", 300, False)
+
+    def test_dpi_tiers_setting(self):
+        assert _parse_dpi_tiers("300, 150,150") == (150, 300)
+        assert _parse_dpi_tiers("200,abc,-5") == (200,)
+        for bad in (None, "", " , ", "high", "0"):
+            assert _parse_dpi_tiers(bad) == ocr_extraction.DEFAULT_DPI_TIERS
+
+    def test_header_check(self):
+        accept = _accept_header("diabetic")
+        assert accept("Diabetic Retinopathy Report", 10.0)
+        assert accept("Patient Summary", 95.0)
+        assert not accept("Dlabet1c", 30.0)
+
+    def test_vcdr_requires_number(self):
+        assert _accept_vcdr("VCDR - 0.62", 80.0)
+        assert not _accept_vcdr("VCDR - n/a", 80.0)
+
+
+class TestPageScanOrder:
+    """Test cases for hint-driven page scan order."""
+
+    def test_no_hints_scans_in_order(self):
+        assert _page_scan_order(4, None) == [0, 1, 2, 3]
+
+    def test_likely_pages_first_then_rest(self):
+        assert _page_scan_order(5, [4, 2]) == [3, 1, 0, 2, 4]
+
+    def test_out_of_range_and_duplicate_hints_ignored(self):
+        assert _page_scan_order(3, [3, 9, 3, 0]) == [2, 0, 1]
+
+
+class TestTemplateVersion:
+    """Test cases for the extraction template version used by re-OCR campaigns."""
+
+    def test_stable_for_same_template(self):
+        assert template_version() == template_version()
+
+    def test_changes_with_region_coords(self, monkeypatch):
+        before = template_version()
+        monkeypatch.setattr(ocr_extraction, "GLAUCOMA_VCDR_RT_COORDS", (0, 1310, 1000, 1510))
+        assert template_version() != before
+
+
+class _AlwaysDr:
+    def classify(self, vector):
+        return "dr", 0.99
+
+    def learn(self, page_type, vector):
+        raise AssertionError("template-classified pages are not learned")
+
+
+class TestTemplateClassifiedPages:
+    """Test cases for pages classified by a header template."""
+
+    def test_dr_page_is_still_checked_for_the_glaucoma_header(self, monkeypatch):
+        import fitz
+        doc = fitz.open()
+        doc.new_page()
+        read = []
+
+        def fake_ocr(renderer, coords, accept):
+            read.append(coords)
+            return ("Glaucoma Report" if coords == ocr_extraction.GLAUCOMA_REPORT_COORDS else "0.5", 150, True)
+
+        monkeypatch.setattr(ocr_extraction, "get_classifier", lambda: _AlwaysDr())
+        monkeypatch.setattr(ocr_extraction, "header_vector", lambda page: None)
+        monkeypatch.setattr(ocr_extraction, "get_ocr_cache", lambda: None)
+        monkeypatch.setattr(ocr_extraction, "_ocr_region_adaptive", fake_ocr)
+        stats = {}
+        result = ocr_extraction.find_report_pages_by_coords_with_grid(doc, stats=stats)
+        assert result[:2] == (1, 1)
+        assert ocr_extraction.DIABETIC_REPORT_COORDS not in read
+        assert stats["dpi"]["diabetic_header"] == "template" and stats["dpi"]["glaucoma_header"] == 150
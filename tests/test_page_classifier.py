@@ -0,0 +1,93 @@
+import pickle
+
+import fitz
+import numpy as np
+
+import page_classifier
+from page_classifier import (
+    PAGE_TYPE_DR,
+    PAGE_TYPE_GLAUCOMA,
+    PAGE_TYPE_OTHER,
+    TemplateClassifier,
+    header_vector,
+)
+
+
+def _page_with_header(doc, title, y):
+    # A4 page with a bold title inside the header band (y in PDF points)
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((20, y), title, fontsize=22)
+    page.insert_text((20, 400), "Patient details and screening images", fontsize=11)
+    return page
+
+
+class TestTemplateClassifier:
+    """Test cases for the header-band template classifier."""
+
+    def test_header_vector_is_normalized(self):
+        doc = fitz.open()
+        vec = header_vector(_page_with_header(doc, "Diabetic Retinopathy Report", 80))
+        assert vec.shape == (96 * 32,)
+        assert abs(float(vec.mean())) < 1e-4
+        assert abs(float(np.linalg.norm(vec)) - 1.0) < 1e-4
+
+    def test_learn_then_classify(self, tmp_path):
+        doc = fitz.open()
+        dr = header_vector(_page_with_header(doc, "Diabetic Retinopathy Report", 80))
+        gl = header_vector(_page_with_header(doc, "Glaucoma Screening Report", 130))
+        other = header_vector(_page_with_header(doc, "Fundus Images", 60))
+
+        clf = TemplateClassifier(tmp_path)
+        assert clf.classify(dr)[0] is None
+        assert clf.learn(PAGE_TYPE_DR, dr)
+        assert clf.learn(PAGE_TYPE_GLAUCOMA, gl)
+        assert clf.learn(PAGE_TYPE_OTHER, other)
+
+        assert clf.classify(dr)[0] == PAGE_TYPE_DR
+        assert clf.classify(gl)[0] == PAGE_TYPE_GLAUCOMA
+        assert clf.classify(other)[0] == PAGE_TYPE_OTHER
+
+    def test_templates_persist_and_duplicates_are_skipped(self, tmp_path):
+        doc = fitz.open()
+        dr = header_vector(_page_with_header(doc, "Diabetic Retinopathy Report", 80))
+        clf = TemplateClassifier(tmp_path)
+        assert clf.learn(PAGE_TYPE_DR, dr)
+        assert not clf.learn(PAGE_TYPE_DR, dr)
+        names = [p.name for p in tmp_path.glob("*.npy")]
+        assert len(names) == 1 and names[0].startswith("dr_")
+        assert not list(tmp_path.glob(".*.tmp"))
+
+        reloaded = TemplateClassifier(tmp_path)
+        assert reloaded.count(PAGE_TYPE_DR) == 1
+        assert reloaded.classify(dr)[0] == PAGE_TYPE_DR
+
+    def test_concurrent_learners_never_overwrite(self, tmp_path):
+        doc = fitz.open()
+        dr = header_vector(_page_with_header(doc, "Diabetic Retinopathy Report", 80))
+        gl = header_vector(_page_with_header(doc, "Glaucoma Screening Report", 130))
+        # Two processes, each with its own view of the folder
+        first, second = TemplateClassifier(tmp_path), TemplateClassifier(tmp_path)
+        assert first.learn(PAGE_TYPE_DR, dr)
+        assert second.learn(PAGE_TYPE_DR, gl)
+        assert TemplateClassifier(tmp_path).count(PAGE_TYPE_DR) == 2
+
+    def test_ambiguous_match_is_not_classified(self, tmp_path, monkeypatch):
+        doc = fitz.open()
+        dr = header_vector(_page_with_header(doc, "Diabetic Retinopathy Report", 80))
+        clf = TemplateClassifier(tmp_path)
+        clf.learn(PAGE_TYPE_DR, dr)
+        clf.learn(PAGE_TYPE_OTHER, dr * 0.999 + 0.001)  # near-identical header learned as another type
+        assert clf.classify(dr)[0] is None
+        monkeypatch.setattr(page_classifier, "MATCH_MARGIN", 0.0)
+        assert clf.classify(dr)[0] == PAGE_TYPE_DR
+
+    def test_refresh_picks_up_templates_learned_elsewhere(self, tmp_path):
+        doc = fitz.open()
+        dr = header_vector(_page_with_header(doc, "Diabetic Retinopathy Report", 80))
+        clf = TemplateClassifier(tmp_path)
+        handed_over = pickle.loads(pickle.dumps(clf))  # as passed to a sandboxed child
+        assert handed_over.learn(PAGE_TYPE_DR, dr)
+
+        assert clf.count(PAGE_TYPE_DR) == 0
+        clf.refresh()
+        assert clf.count(PAGE_TYPE_DR) == 1
@@ -0,0 +1,60 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import ocr_extraction
+import page_classifier
+from ocr_extraction import adopt_warm_state
+from page_classifier import PAGE_TYPE_DR, TemplateClassifier
+from pdf_sandbox import PdfCrashError, PdfSandboxError, PdfTimeoutError, run_sandboxed
+
+
+def _add(a, b):
+    return a + b
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def _boom():
+    raise ValueError("bad xref table")
+
+
+def _die():
+    os._exit(3)
+
+
+def _ocr_state():
+    return ocr_extraction._engine_version(), page_classifier.get_classifier().count(PAGE_TYPE_DR)
+
+
+class TestRunSandboxed:
+    """Test cases for per-PDF process isolation."""
+
+    def test_returns_result(self):
+        assert run_sandboxed(_add, 2, 3, timeout=30, mem_limit_mb=None) == 5
+
+    def test_timeout_kills_child(self):
+        start = time.monotonic()
+        with pytest.raises(PdfTimeoutError):
+            run_sandboxed(_sleep, 30, timeout=1, mem_limit_mb=None)
+        assert time.monotonic() - start < 15
+
+    def test_exception_reported(self):
+        with pytest.raises(PdfSandboxError, match="ValueError: bad xref table"):
+            run_sandboxed(_boom, timeout=30, mem_limit_mb=None)
+
+    def test_crash_reported(self):
+        with pytest.raises(PdfCrashError):
+            run_sandboxed(_die, timeout=30, mem_limit_mb=None)
+
+    def test_child_starts_from_the_parents_warm_ocr_state(self, tmp_path):
+        clf = TemplateClassifier(tmp_path)
+        clf.learn(PAGE_TYPE_DR, np.ones(8, dtype=np.float32))
+        state = {"engine": "tesseract-9.9", "classifier": clf}
+        (tmp_path / "dr_unreadable.npy").write_bytes(b"not a template")  # a reload in the child would fail
+        assert run_sandboxed(_ocr_state, timeout=60, mem_limit_mb=None,
+                             initializer=adopt_warm_state, initargs=(state,)) == ("tesseract-9.9", 1)
@@ -0,0 +1,274 @@
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, func, select
+
+import process_pdfs
+from models import DiabeticRetinopathyReport, EncounterFile, PatientEncounters, Session, ZipFile
+from process_pdfs import (
+    PdfResult,
+    _apply_in_savepoint,
+    _close_writer_session,
+    _CommitBatcher,
+    _discard_partial_splits,
+    _load_worklist,
+    _partial_name,
+    _writer_session,
+    process_all_pdfs_for_ocr,
+)
+
+
+class _FakeSession:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def in_transaction(self):
+        return False
+
+
+class TestCommitBatcher:
+    """Test cases for batched commits of OCR results."""
+
+    def test_commits_every_batch(self):
+        db = _FakeSession()
+        batch = _CommitBatcher(db, size=3, max_age=3600)
+        for _ in range(7):
+            batch.added()
+        assert db.commits == 2
+        batch.flush()
+        assert db.commits == 3
+        batch.flush()  # nothing pending
+        assert db.commits == 3
+
+    def test_stale_writes_are_committed_early(self):
+        db = _FakeSession()
+        batch = _CommitBatcher(db, size=100, max_age=0)
+        batch.added()
+        assert db.commits == 1
+        batch.flush_if_stale()
+        assert db.commits == 1
+
+
+@pytest.fixture
+def ocr_dirs(tmp_db, tmp_path, monkeypatch):
+    for name in ("PDF_DIR", "DR_PDF_DIR", "GLAUCOMA_PDF_DIR"):
+        (tmp_path / name).mkdir()
+        monkeypatch.setattr(process_pdfs, name, tmp_path / name)
+    monkeypatch.setattr(process_pdfs, "SUCCESS_LOG", tmp_path / "success.txt")
+    monkeypatch.setattr(process_pdfs, "ERROR_LOG", tmp_path / "error.txt")
+    monkeypatch.setattr(process_pdfs, "OCR_SANDBOX", True)  # thread pool: the fake analysis below is used
+    monkeypatch.setattr(process_pdfs.time, "sleep", lambda seconds: None)
+    return tmp_path
+
+
+def _encounter(ocr_dirs, patient_id: str, pdfs: list[str]) -> int:
+    with Session() as db:
+        enc = PatientEncounters(zip_file=ZipFile(zip_filename=f"{patient_id}.zip", md5_hash=patient_id),
+                                name="Test Patient", patient_id=patient_id, capture_date="2024-01-01")
+        for filename in pdfs:
+            (ocr_dirs / "PDF_DIR" / filename).write_bytes(b"%PDF-1.4")
+            enc.encounter_files.append(EncounterFile(filename=filename, file_type="pdf"))
+        db.add(enc)
+        db.commit()
+        return enc.id
+
+
+def _fake_analysis(reports: set[str], calls: list[str]):
+    """Stands in for _analyze_isolated: PDFs named in `reports` have a DR report on page 1."""
+    lock = threading.Lock()
+
+    def analyze(pdf_path, base_name, page_hints, split=True):
+        with lock:
+            calls.append(pdf_path.name)
+        if pdf_path.name not in reports:
+            return PdfResult(pdf_path.name, *([None] * 10), {})
+        return PdfResult(pdf_path.name, 1, None, "No DR", "Normal", None, None, None, None,
+                         f"{base_name}_DR_Page1.pdf", None, {})
+    return analyze
+
+
+class TestWorklist:
+    """Test cases for loading the OCR worklist and skipping encounters that have reports."""
+
+    def test_worklist_is_one_query(self, ocr_dirs, tmp_db):
+        _encounter(ocr_dirs, "P1", ["p1_a.pdf", "p1_b.pdf"])
+        reported = _encounter(ocr_dirs, "P2", ["p2_a.pdf"])
+        with Session() as db:
+            db.add(DiabeticRetinopathyReport(patient_encounter_id=reported, result="No DR"))
+            db.add(EncounterFile(patient_encounter_id=reported, filename="p2.jpg", file_type="image"))
+            db.query(EncounterFile).filter_by(filename="p1_b.pdf").update({"ocr_processed": True})
+            db.commit()
+
+        statements = []
+        event.listen(tmp_db, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        db = _writer_session()
+        try:
+            rows = _load_worklist(db, None)
+            assert [(ef.filename, enc.patient_id, has) for ef, enc, has in rows] == [
+                ("p1_a.pdf", "P1", False), ("p2_a.pdf", "P2", True)]
+        finally:
+            _close_writer_session(db)
+        assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 1
+
+    def test_encounters_with_reports_are_skipped(self, ocr_dirs, monkeypatch):
+        reported = _encounter(ocr_dirs, "P1", ["p1_a.pdf"])
+        _encounter(ocr_dirs, "P2", ["p2_a.pdf", "p2_b.pdf"])
+        with Session() as db:
+            db.add(DiabeticRetinopathyReport(patient_encounter_id=reported, result="No DR"))
+            db.commit()
+        calls: list[str] = []
+        monkeypatch.setattr(process_pdfs, "_analyze_isolated", _fake_analysis({"p2_a.pdf", "p2_b.pdf"}, calls))
+
+        assert process_all_pdfs_for_ocr(workers=1) == {"processed": 1, "failed": {}}
+        # p1_a.pdf: reports existed before the run; p2_b.pdf: p2_a.pdf found them during it
+        assert calls == ["p2_a.pdf"]
+        with Session() as db:
+            assert db.query(EncounterFile).filter_by(ocr_processed=False).count() == 0
+            assert db.query(DiabeticRetinopathyReport).count() == 2
+
+
+def test_failed_pdf_rolls_back_alone_within_batch(ocr_dirs, tmp_db, monkeypatch):
+    for n in (1, 2, 3):
+        _encounter(ocr_dirs, f"P{n}", [f"p{n}.pdf"])
+    apply_result = process_pdfs._apply_result
+
+    def failing_apply(db_session, patient_encounter, encounter_file, result):
+        apply_result(db_session, patient_encounter, encounter_file, result)
+        db_session.flush()
+        if encounter_file.filename == "p2.pdf":
+            raise ValueError("bad report row")
+    monkeypatch.setattr(process_pdfs, "_apply_result", failing_apply)
+    analyze = _fake_analysis({"p1.pdf", "p2.pdf", "p3.pdf"}, [])
+
+    def stored() -> tuple[int, list[str]]:
+        with tmp_db.connect() as other:
+            reports = other.execute(select(func.count()).select_from(DiabeticRetinopathyReport)).scalar()
+            done = other.execute(select(EncounterFile.filename).where(EncounterFile.ocr_processed)).scalars()
+            return reports, sorted(done)
+
+    db = _writer_session()
+    try:
+        summary = {"processed": 0, "failed": {}}
+        batch = _CommitBatcher(db, size=10, max_age=3600)
+        for ef, enc, _ in _load_worklist(db, None):
+            result = analyze(Path(ef.filename), process_pdfs.report_base_name(enc), None)
+            if _apply_in_savepoint(db, enc, ef, result, summary):
+                batch.added()
+        # Savepoints are released inside the batch's transaction, not committed one by one
+        assert stored() == (0, [])
+        batch.flush()
+    finally:
+        _close_writer_session(db)
+    assert summary["processed"] == 2 and list(summary["failed"]) == ["p2.pdf"]
+    assert stored() == (2, ["p1.pdf", "p3.pdf"])
+
+
+class TestPoolMode:
+    """Test cases for analyzing PDFs in a worker pool."""
+
+    def test_encounter_gets_reports_from_one_pdf_only(self, ocr_dirs, monkeypatch):
+        both = _encounter(ocr_dirs, "P1", ["p1_a.pdf", "p1_b.pdf"])
+        second = _encounter(ocr_dirs, "P2", ["p2_a.pdf", "p2_b.pdf"])
+        calls: list[str] = []
+        monkeypatch.setattr(process_pdfs, "_analyze_isolated",
+                            _fake_analysis({"p1_a.pdf", "p1_b.pdf", "p2_b.pdf"}, calls))
+
+        summary = process_all_pdfs_for_ocr(workers=4)
+        assert summary == {"processed": 3, "failed": {}}
+        # p1_b.pdf is never analyzed: its encounter already got reports from p1_a.pdf
+        assert sorted(calls) == ["p1_a.pdf", "p2_a.pdf", "p2_b.pdf"]
+        with Session() as db:
+            reports = {r.patient_encounter_id: r for r in db.query(DiabeticRetinopathyReport)}
+            assert len(db.query(DiabeticRetinopathyReport).all()) == 2
+            assert db.query(EncounterFile).filter_by(ocr_processed=False).count() == 0
+        assert reports[both].source_file_id is not None and reports[second].page_number == 1
+
+    def test_failed_pdf_falls_through_to_the_next_one(self, ocr_dirs, monkeypatch):
+        _encounter(ocr_dirs, "P1", ["p1_a.pdf", "p1_b.pdf"])
+        calls: list[str] = []
+        analyze = _fake_analysis({"p1_b.pdf"}, calls)
+
+        def flaky(pdf_path, *args):
+            if pdf_path.name == "p1_a.pdf":
+                raise RuntimeError("PDF analysis timed out")
+            return analyze(pdf_path, *args)
+        monkeypatch.setattr(process_pdfs, "_analyze_isolated", flaky)
+
+        summary = process_all_pdfs_for_ocr(workers=2)
+        assert summary["processed"] == 1 and list(summary["failed"]) == ["p1_a.pdf"]
+        assert calls == ["p1_b.pdf"]
+
+    def test_crashed_worker_fails_pdfs_in_flight_and_the_pool_is_restarted(self, ocr_dirs, monkeypatch):
+        monkeypatch.setattr(process_pdfs, "OCR_SANDBOX", False)
+        _encounter(ocr_dirs, "P1", ["p1_a.pdf"])
+        _encounter(ocr_dirs, "P2", ["p2_a.pdf", "p2_b.pdf"])
+        calls: list[str] = []
+        analyze = _fake_analysis({"p2_b.pdf"}, calls)
+        pools: list[_CrashingPool] = []
+
+        def make_pool(workers):
+            pools.append(_CrashingPool(analyze, crash_on="p1_a.pdf" if not pools else None))
+            return pools[-1]
+        monkeypatch.setattr(process_pdfs, "_make_pool", make_pool)
+
+        summary = process_all_pdfs_for_ocr(workers=2)
+        # p2_a.pdf was in the same pool when p1_a.pdf killed its worker
+        assert summary["processed"] == 1 and sorted(summary["failed"]) == ["p1_a.pdf", "p2_a.pdf"]
+        assert "worker process crashed" in summary["failed"]["p2_a.pdf"]
+        assert len(pools) == 2 and calls == ["p2_b.pdf"]
+
+
+class _CrashingPool:
+    """
+    Stands in for a ProcessPoolExecutor (OCR_SANDBOX off) whose worker dies on `crash_on`:
+    that PDF and every other one in flight fail with BrokenProcessPool, and later submits raise.
+    """
+
+    def __init__(self, analyze, crash_on: str | None):
+        self.analyze = analyze
+        self.crash_on = crash_on
+        self.in_flight: list[tuple] = []
+        self.broken = False
+        self.lock = threading.Lock()
+
+    def submit(self, fn, pdf_path, base_name, page_hints):
+        if self.broken:
+            raise BrokenProcessPool("A child process terminated abruptly, the process pool is not usable anymore")
+        fut = Future()
+        with self.lock:
+            self.in_flight.append((fut, Path(pdf_path), base_name, page_hints))
+        threading.Timer(0.05, self._run_one).start()
+        return fut
+
+    def _run_one(self):
+        with self.lock:
+            if self.broken:
+                return
+            if any(pdf_path.name == self.crash_on for _fut, pdf_path, *_ in self.in_flight):
+                self.broken = True
+                for fut, *_ in self.in_flight:
+                    fut.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+                return
+            fut, *args = self.in_flight.pop(0)
+        fut.set_result(self.analyze(*args))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_failure_cleanup_only_removes_this_pdfs_partial_pages(ocr_dirs):
+    dr_dir = ocr_dirs / "DR_PDF_DIR"
+    kept = ["P1_Test_Patient_2024-01-01_DR_Page1.pdf",  # published by a sibling PDF
+            _partial_name("P1_Test_Patient_2024-01-01_DR_Page2.pdf", "scan[2].pdf")]
+    removed = _partial_name("P1_Test_Patient_2024-01-01_DR_Page3.pdf", "scan[1].pdf")
+    for name in kept + [removed]:
+        (dr_dir / name).write_bytes(b"%PDF-1.4")
+
+    _discard_partial_splits("scan[1].pdf")
+    assert sorted(p.name for p in dr_dir.iterdir()) == sorted(kept)
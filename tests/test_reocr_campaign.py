@@ -0,0 +1,118 @@
+import fitz  # PyMuPDF
+import pytest
+
+import reocr_campaign
+from models import (
+    DiabeticRetinopathyReport, EncounterFile, PatientEncounters, ReocrCampaign, ReocrResult, Session, ZipFile,
+)
+from reocr_campaign import apply_campaign, diff_campaign
+from reports import page_cache
+
+
+def _make_pdf(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i + 1}")
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def dirs(tmp_db, tmp_path, monkeypatch):
+    for name in ("pdfs", "dr", "gl", "cache"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(reocr_campaign, "PDF_DIR", tmp_path / "pdfs")
+    monkeypatch.setattr(reocr_campaign, "DR_PDF_DIR", tmp_path / "dr")
+    monkeypatch.setattr(reocr_campaign, "GLAUCOMA_PDF_DIR", tmp_path / "gl")
+    monkeypatch.setattr(reocr_campaign, "REPORT_PAGES_VIRTUAL", False)
+    monkeypatch.setattr(page_cache, "CACHE_DIR", tmp_path / "cache")
+    return tmp_path
+
+
+def _moved_report(dirs, *proposals: tuple[str, int, str]) -> tuple[int, str]:
+    """
+    A DR report on page 1 of a.pdf, with its split file and cached page, and a campaign with one
+    (file, DR page, DR result) proposal per re-extracted PDF of the encounter.
+    """
+    _make_pdf(dirs / "pdfs" / "a.pdf", 3)
+    _make_pdf(dirs / "pdfs" / "b.pdf", 3)
+    with Session() as db:
+        enc = PatientEncounters(zip_file=ZipFile(zip_filename="p1.zip", md5_hash="p1"),
+                                name="Test Patient", patient_id="P1", capture_date="2024-01-01")
+        enc.encounter_files = [EncounterFile(filename="a.pdf", file_type="pdf"),
+                               EncounterFile(filename="b.pdf", file_type="pdf")]
+        db.add(enc)
+        db.flush()
+        files = {ef.filename: ef for ef in enc.encounter_files}
+        report = DiabeticRetinopathyReport(patient_encounter_id=enc.id, result="No DR", page_number=1,
+                                           report_file_name="P1_Test_Patient_2024-01-01_DR_Page1.pdf",
+                                           source_file_id=files["a.pdf"].id)
+        db.add(report)
+        campaign = ReocrCampaign(name="moved", template_version="v2", status="done")
+        db.add(campaign)
+        db.flush()
+        for filename, page, result in proposals:
+            db.add(ReocrResult(campaign_id=campaign.id, encounter_file_id=files[filename].id,
+                               patient_encounter_id=enc.id, dr_page=page, dr_result=result))
+        db.commit()
+        (dirs / "dr" / report.report_file_name).write_bytes(b"%PDF-1.4 old page")
+        cached = dirs / "cache" / page_cache.report_cache_name("dr", report.uuid)
+        cached.write_bytes(b"%PDF-1.4 old page")
+        return campaign.id, cached
+
+
+class TestApplyMovedReports:
+    """Test cases for applying campaigns that move a report to another page or source file."""
+
+    def test_old_split_and_cached_page_are_dropped(self, dirs):
+        campaign_id, cached = _moved_report(dirs, ("a.pdf", 2, "Mild NPDR"))
+        assert apply_campaign(campaign_id)["reports"] == 1
+
+        with Session() as db:
+            report = db.query(DiabeticRetinopathyReport).one()
+            assert (report.page_number, report.result) == (2, "Mild NPDR")
+        assert sorted(p.name for p in (dirs / "dr").iterdir()) == [report.report_file_name]
+        assert report.report_file_name.endswith("_DR_Page2.pdf")
+        assert not cached.exists()
+
+    def test_virtual_page_moved_to_another_file_is_not_served_stale(self, dirs, monkeypatch):
+        monkeypatch.setattr(reocr_campaign, "REPORT_PAGES_VIRTUAL", True)
+        campaign_id, cached = _moved_report(dirs, ("b.pdf", 1, "Mild NPDR"))
+        apply_campaign(campaign_id)
+
+        with Session() as db:
+            report = db.query(DiabeticRetinopathyReport).one()
+            source = db.get(EncounterFile, report.source_file_id).filename
+        assert (source, report.page_number) == ("b.pdf", 1)
+        # Same split name, but the file on disk held page 1 of a.pdf
+        assert list((dirs / "dr").iterdir()) == [] and not cached.exists()
+
+    def test_one_result_per_encounter_is_applied(self, dirs):
+        # Both PDFs of the encounter were re-extracted; the report's own source file decides
+        campaign_id, _cached = _moved_report(dirs, ("b.pdf", 3, "Severe NPDR"), ("a.pdf", 2, "Mild NPDR"))
+        with Session() as db:
+            rows = diff_campaign(db, campaign_id)
+        assert {r["filename"] for r in rows if r["applicable"]} == {"a.pdf"}
+        assert {r["filename"] for r in rows if r["superseded"]} == {"b.pdf"}
+
+        summary = apply_campaign(campaign_id)
+        assert (summary["reports"], summary["superseded_fields"]) == (1, 2)
+        with Session() as db:
+            report = db.query(DiabeticRetinopathyReport).one()
+            assert (report.page_number, report.result) == (2, "Mild NPDR")
+
+    def test_failed_apply_leaves_no_new_split_files(self, dirs, monkeypatch):
+        campaign_id, cached = _moved_report(dirs, ("a.pdf", 2, "Mild NPDR"))
+
+        def fail():
+            raise RuntimeError("database is locked")
+
+        monkeypatch.setattr(reocr_campaign, "_utcnow", fail)  # after the resplit, before the commit
+        with pytest.raises(RuntimeError):
+            apply_campaign(campaign_id)
+
+        with Session() as db:
+            report = db.query(DiabeticRetinopathyReport).one()
+            assert report.page_number == 1
+        assert [p.name for p in (dirs / "dr").iterdir()] == [report.report_file_name]
+        assert cached.exists()
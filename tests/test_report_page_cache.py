@@ -0,0 +1,61 @@
+import os
+
+import fitz  # PyMuPDF
+
+from reports import page_cache
+
+
+def _make_pdf(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i + 1}")
+    doc.save(str(path))
+    doc.close()
+
+
+class TestReportPageCache:
+    """Test cases for on-demand report page extraction."""
+
+    def _setup(self, tmp_path, monkeypatch, max_bytes=10 * 1024 * 1024):
+        pdf_dir = tmp_path / "pdfs"
+        pdf_dir.mkdir()
+        _make_pdf(pdf_dir / "enc.pdf", 3)
+        monkeypatch.setattr(page_cache, "PDF_DIR", pdf_dir)
+        monkeypatch.setattr(page_cache, "CACHE_DIR", tmp_path / "cache")
+        monkeypatch.setattr(page_cache, "CACHE_MAX_BYTES", max_bytes)
+
+    def test_extracts_single_page(self, tmp_path, monkeypatch):
+        self._setup(tmp_path, monkeypatch)
+        out = page_cache.get_page_pdf("enc.pdf", 2, "dr_abc.pdf")
+        with fitz.open(str(out)) as doc:
+            assert len(doc) == 1
+            assert "page 2" in doc[0].get_text()
+
+    def test_hit_reuses_cached_file(self, tmp_path, monkeypatch):
+        self._setup(tmp_path, monkeypatch)
+        first = page_cache.get_page_pdf("enc.pdf", 1, "dr_abc.pdf")
+        (tmp_path / "pdfs" / "enc.pdf").unlink()
+        assert page_cache.get_page_pdf("enc.pdf", 1, "dr_abc.pdf") == first
+
+    def test_missing_source_or_page(self, tmp_path, monkeypatch):
+        self._setup(tmp_path, monkeypatch)
+        assert page_cache.get_page_pdf("nope.pdf", 1, "dr_x.pdf") is None
+        assert page_cache.get_page_pdf("enc.pdf", 9, "dr_y.pdf") is None
+
+    def test_evicts_least_recently_used(self, tmp_path, monkeypatch):
+        self._setup(tmp_path, monkeypatch)
+        a = page_cache.get_page_pdf("enc.pdf", 1, "dr_a.pdf")
+        os.utime(a, (1, 1))
+        monkeypatch.setattr(page_cache, "CACHE_MAX_BYTES", a.stat().st_size + 1)
+        b = page_cache.get_page_pdf("enc.pdf", 2, "dr_b.pdf")
+        assert b.exists() and not a.exists()
+
+    def test_page_available_without_split_file(self, tmp_path, monkeypatch):
+        self._setup(tmp_path, monkeypatch)
+        split = tmp_path / "split.pdf"
+        # Virtual report pages: no split file, served from the source PDF
+        assert page_cache.page_available(split, "enc.pdf", 2)
+        assert not page_cache.page_available(split, "enc.pdf", None)
+        assert not page_cache.page_available(split, "gone.pdf", 2)
+        split.write_bytes(b"%PDF-1.4")
+        assert page_cache.page_available(split, None, None)
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import event
+
+import process_pdfs
+import text_index
+from models import EncounterFile, EncounterFileTextIndex, PatientEncounters, Session, ZipFile
+from text_index import _fts_query, _highlight, _HL_END, _HL_START, index_pending, search, start_background_index
+
+
+class TestTextIndexQuery:
+    """Test cases for full-text search query building."""
+
+    def test_terms_are_quoted_and_all_required(self):
+        assert _fts_query("VCDR 0.7") == '"VCDR" "0.7"'
+
+    def test_quoted_input_is_one_phrase(self):
+        assert _fts_query('"ungradable image"') == '"ungradable image"'
+
+    def test_fts_syntax_is_neutralised(self):
+        assert _fts_query('a"b OR NEAR(') == '"a""b" "OR" "NEAR("'
+        assert _fts_query("   ") == ""
+
+    def test_highlight_escapes_text(self):
+        html = str(_highlight(f"<b>{_HL_START}VCDR{_HL_END}</b>"))
+        assert html == "&lt;b&gt;<mark>VCDR</mark>&lt;/b&gt;"
+
+
+@pytest.fixture
+def pdf_file(tmp_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(text_index, "OCR_SANDBOX", False)
+    monkeypatch.setattr(process_pdfs, "ERROR_LOG", tmp_path / "error.txt")
+    with Session() as db:
+        enc = PatientEncounters(zip_file=ZipFile(zip_filename="p1.zip", md5_hash="p1"),
+                                name="Test Patient", patient_id="P1", capture_date="2024-01-01")
+        enc.encounter_files.append(EncounterFile(filename="p1.pdf", file_type="pdf"))
+        db.add(enc)
+        db.commit()
+        return enc.encounter_files[0].id
+
+
+class TestIndexing:
+    """Test cases for indexing PDF page text."""
+
+    def test_text_is_extracted_before_any_write(self, pdf_file, tmp_db, monkeypatch):
+        statements = []
+        event.listen(tmp_db, "before_cursor_execute", lambda *args: statements.append(args[2].lstrip().upper()))
+
+        def extract(path):
+            writes = [sql for sql in statements if sql.startswith(("INSERT", "UPDATE", "DELETE"))]
+            assert writes == [], "the write transaction must not span extraction"
+            return [("VCDR 0.7 right eye", False), ("", True)]
+        monkeypatch.setattr(text_index, "extract_page_texts", extract)
+
+        assert index_pending() == {"indexed": 1, "failed": 0, "skipped": False}
+        with Session() as db:
+            row = db.query(EncounterFileTextIndex).filter_by(encounter_file_id=pdf_file).one()
+            assert (row.page_count, row.pages_ocr, row.error) == (2, 1, None)
+            assert [h["page_number"] for h in search(db, "VCDR 0.7")] == [1]
+
+    def test_failed_extraction_is_retried(self, pdf_file, monkeypatch):
+        def broken(path):
+            raise RuntimeError("PDF analysis timed out")
+        monkeypatch.setattr(text_index, "extract_page_texts", broken)
+        assert index_pending()["failed"] == 1
+        assert index_pending() == {"indexed": 0, "failed": 0, "skipped": False}  # not due yet
+
+        monkeypatch.setattr(text_index, "TEXT_INDEX_RETRY_MINUTES", 0)
+        monkeypatch.setattr(text_index, "extract_page_texts", lambda path: [("No DR", False)])
+        assert index_pending()["indexed"] == 1
+        with Session() as db:
+            assert db.query(EncounterFileTextIndex).filter_by(encounter_file_id=pdf_file).one().error is None
+
+        # A failed re-index keeps the text indexed before
+        monkeypatch.setattr(text_index, "extract_page_texts", broken)
+        assert index_pending(reindex=True)["failed"] == 1
+        with Session() as db:
+            assert len(search(db, "No DR")) == 1
+
+    def test_background_index_runs_one_at_a_time(self, monkeypatch):
+        monkeypatch.setattr(text_index, "TEXT_INDEX_ENABLED", True)
+        with text_index._run_lock:
+            assert start_background_index() is False
@@ -0,0 +1,56 @@
+import zipfile
+
+import pytest
+
+import main
+import worker
+from models import Session, ZipFile
+
+
+class TestWorkerInit:
+    """Test cases for one-time worker initialization."""
+
+    def test_setup_and_hooks_run_once(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(worker, "_initialized_at", None)
+        monkeypatch.setattr(worker, "setup_environment", lambda: calls.append("env"))
+        monkeypatch.setattr(worker, "setup_database", lambda: calls.append("db"))
+        monkeypatch.setattr(worker, "_init_hooks", [lambda: calls.append("hook")])
+
+        first = worker.ensure_worker_initialized()
+        assert worker.ensure_worker_initialized() == first == worker.worker_initialized_at()
+        assert calls == ["env", "db", "hook"]
+
+    def test_failing_hook_does_not_block_init(self, monkeypatch):
+        def broken():
+            raise RuntimeError("no tesseract")
+
+        monkeypatch.setattr(worker, "_initialized_at", None)
+        monkeypatch.setattr(worker, "setup_environment", lambda: None)
+        monkeypatch.setattr(worker, "setup_database", lambda: None)
+        monkeypatch.setattr(worker, "_init_hooks", [broken])
+        assert worker.ensure_worker_initialized() is not None
+
+
+class TestCancelledIngest:
+    """Test cases for stopping a running ZIP ingest."""
+
+    def test_stop_between_members_removes_partial_files(self, tmp_db, tmp_path, monkeypatch):
+        for name in ("UPLOAD_DIR", "IMAGE_DIR", "PDF_DIR", "PROCESSED_DIR", "PROCESSING_ERROR_DIR"):
+            (tmp_path / name).mkdir()
+            monkeypatch.setattr(main, name, tmp_path / name)
+        monkeypatch.setattr(main, "LOG_FILE", tmp_path / "ingest.log")
+        zip_path = tmp_path / "UPLOAD_DIR" / "cancel_me.zip"
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            for n in range(3):
+                zf.writestr(f"Jane_Doe_Cancel_2024-01-01/eye{n}.jpg", b"\xff\xd8\xff\xe0" + bytes([n]))
+
+        checks = iter([False, True])
+        with Session() as db, pytest.raises(main.ProcessingCancelled):
+            main.process_zip_file(zip_path, db, should_stop=lambda: next(checks))
+
+        assert list((tmp_path / "IMAGE_DIR").iterdir()) == []
+        assert (tmp_path / "PROCESSING_ERROR_DIR" / "cancel_me.zip").exists()
+        assert "CANCELLED" in (tmp_path / "ingest.log").read_text()
+        with Session() as db:
+            assert db.query(ZipFile).filter_by(zip_filename="cancel_me.zip").first() is None
@@ -0,0 +1,264 @@
+# text_index.py
+# Full-text index of per-page PDF text in an SQLite FTS5 virtual table
+# (`encounter_file_text`), linked to EncounterFile. Page text comes from the
+# PDF text layer, falling back to whole-page OCR for scanned pages, so
+# questions like "VCDR 0.7" or warning/operator-note text can be answered
+# without re-OCRing the archive.
+#
+# CLI:
+#   python text_index.py                 # index PDFs not indexed yet
+#   python text_index.py --reindex       # rebuild the index for all PDFs
+#   python text_index.py --search "VCDR 0.7"
+
+import argparse
+import os
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+from markupsafe import Markup, escape
+from sqlalchemy import and_, or_, text as sql_text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as DBSession
+
+from models import (
+    engine,
+    Session,
+    PDF_DIR,
+    EncounterFile,
+    EncounterFileTextIndex,
+    PatientEncounters,
+    utcnow,
+)
+from process_pdfs import OCR_SANDBOX, OCR_PDF_TIMEOUT, OCR_PDF_MEMORY_MB, log_error
+from pdf_sandbox import run_sandboxed
+
+# --- Text index from .env ---
+TEXT_INDEX_ENABLED = str(os.getenv("TEXT_INDEX", "true")).lower() in ("1", "true", "yes")
+# Pages whose text layer has fewer characters than this are OCR'd instead
+TEXT_INDEX_MIN_CHARS = int(os.getenv("TEXT_INDEX_MIN_CHARS", "20"))
+TEXT_INDEX_OCR_DPI = int(os.getenv("TEXT_INDEX_OCR_DPI", "200"))
+# PDFs indexed per background run after a job
+TEXT_INDEX_BATCH = int(os.getenv("TEXT_INDEX_BATCH", "200"))
+# PDFs whose extraction failed are tried again once their last attempt is this old
+TEXT_INDEX_RETRY_MINUTES = float(os.getenv("TEXT_INDEX_RETRY_MINUTES", "60"))
+
+FTS_TABLE = "encounter_file_text"
+# Snippet highlight markers; control characters never occur in page text
+_HL_START, _HL_END = "\x02", "\x03"
+
+_run_lock = threading.Lock()
+
+
+def fts_available() -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def ensure_fts_table() -> None:
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "text, encounter_file_id UNINDEXED, page_number UNINDEXED, tokenize='unicode61')"
+        )
+
+
+def extract_page_texts(pdf_path: str) -> list[tuple[str, bool]]:
+    """[(text, from_ocr)] per page: text layer when present, else whole-page OCR. No DB access."""
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            text = page.get_text("text") or ""
+            from_ocr = len(text.strip()) < TEXT_INDEX_MIN_CHARS
+            if from_ocr:
+                pix = page.get_pixmap(dpi=TEXT_INDEX_OCR_DPI)
+                image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                text = pytesseract.image_to_string(image)
+            pages.append((" ".join(text.split()), from_ocr))
+    return pages
+
+
+def _extract(pdf_path: Path) -> list[tuple[str, bool]]:
+    if OCR_SANDBOX:
+        return run_sandboxed(extract_page_texts, str(pdf_path),
+                             timeout=OCR_PDF_TIMEOUT, mem_limit_mb=OCR_PDF_MEMORY_MB)
+    return extract_page_texts(str(pdf_path))
+
+
+def index_file(db: DBSession, encounter_file: EncounterFile) -> EncounterFileTextIndex:
+    """
+    (Re)index one PDF; the caller commits right away. Text is extracted before the first
+    statement, so the write transaction (DELETE + INSERTs) never spans a slow sandboxed OCR run.
+    Extraction errors are recorded on the tracking row and the previously indexed text is kept.
+    """
+    try:
+        pages, error = _extract(PDF_DIR / (encounter_file.filename or "")), None
+    except Exception as e:
+        pages, error = [], str(e)[:1000]
+        log_error(encounter_file.filename, f"Text indexing failed: {e}")
+
+    row = db.query(EncounterFileTextIndex).filter_by(encounter_file_id=encounter_file.id).first()
+    if row is None:
+        row = EncounterFileTextIndex(encounter_file_id=encounter_file.id)
+        db.add(row)
+    row.indexed_at = utcnow()  # also on a repeated failure: it times the next retry
+    row.error = error
+    if error is not None:
+        return row
+
+    db.execute(sql_text(f"DELETE FROM {FTS_TABLE} WHERE encounter_file_id = :fid"), {"fid": encounter_file.id})
+    for page_number, (page_text, _from_ocr) in enumerate(pages, start=1):
+        if page_text:
+            db.execute(
+                sql_text(f"INSERT INTO {FTS_TABLE} (text, encounter_file_id, page_number) VALUES (:t, :fid, :p)"),
+                {"t": page_text, "fid": encounter_file.id, "p": page_number},
+            )
+    row.page_count = len(pages)
+    row.pages_ocr = sum(1 for _t, from_ocr in pages if from_ocr)
+    return row
+
+
+def index_pending(limit_filenames: set[str] | None = None, limit: int | None = None,
+                  reindex: bool = False) -> dict:
+    """
+    Index PDFs that have no tracking row yet, then retry failed ones whose last attempt is
+    TEXT_INDEX_RETRY_MINUTES old (all PDFs with `reindex`), committing per file.
+    Only one run per process at a time; a concurrent call returns immediately.
+    """
+    summary = {"indexed": 0, "failed": 0, "skipped": False}
+    if not fts_available():
+        print("Text index needs SQLite FTS5; skipping.")
+        summary["skipped"] = True
+        return summary
+    if not _run_lock.acquire(blocking=False):
+        summary["skipped"] = True
+        return summary
+    try:
+        ensure_fts_table()
+        db = Session()
+        try:
+            q = (
+                db.query(EncounterFile)
+                .outerjoin(EncounterFileTextIndex, EncounterFileTextIndex.encounter_file_id == EncounterFile.id)
+                .filter(EncounterFile.file_type == "pdf")
+            )
+            if not reindex:
+                retry_before = utcnow() - timedelta(minutes=TEXT_INDEX_RETRY_MINUTES)
+                q = q.filter(or_(
+                    EncounterFileTextIndex.id.is_(None),
+                    and_(EncounterFileTextIndex.error.isnot(None), EncounterFileTextIndex.indexed_at < retry_before),
+                ))
+            if limit_filenames:
+                q = q.filter(EncounterFile.filename.in_(limit_filenames))
+            # New PDFs first, then retries
+            q = q.order_by(EncounterFileTextIndex.id.isnot(None), EncounterFile.id)
+            if limit:
+                q = q.limit(limit)
+            for ef in q.all():
+                try:
+                    row = index_file(db, ef)
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()  # indexed concurrently by another process
+                    continue
+                if row.error:
+                    summary["failed"] += 1
+                else:
+                    summary["indexed"] += 1
+                    print(f"Indexed text of '{ef.filename}' ({row.page_count} page(s), {row.pages_ocr} by OCR).")
+        finally:
+            db.close()
+    finally:
+        _run_lock.release()
+    return summary
+
+
+def _index_in_background() -> None:
+    try:
+        index_pending(limit=TEXT_INDEX_BATCH)
+    except Exception as e:
+        print(f"Text indexing failed: {e}")
+
+
+def start_background_index() -> bool:
+    """
+    Post-job hook: run index_pending(limit=TEXT_INDEX_BATCH) in a background thread, so text
+    extraction never holds up the queue thread that finalized the job. Returns whether one was started.
+    """
+    if not TEXT_INDEX_ENABLED or not fts_available() or _run_lock.locked():
+        return False
+    threading.Thread(target=_index_in_background, name="text-index", daemon=True).start()
+    return True
+
+
+def _fts_query(q: str) -> str:
+    """User input -> safe FTS5 query: a quoted phrase stays a phrase, otherwise every term must match."""
+    q = (q or "").strip()
+    if len(q) > 1 and q.startswith('"') and q.endswith('"'):
+        terms = [q[1:-1]]
+    else:
+        terms = q.split()
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms if t.strip('"'))
+
+
+def _highlight(snippet: str) -> Markup:
+    return Markup(str(escape(snippet)).replace(_HL_START, "<mark>").replace(_HL_END, "</mark>"))
+
+
+def search(db: DBSession, query: str, limit: int = 50, offset: int = 0) -> list[dict]:
+    """Pages matching `query`, best bm25 rank first, with highlighted snippets and encounter details."""
+    match = _fts_query(query)
+    if not match or not fts_available():
+        return []
+    ensure_fts_table()
+    rows = db.execute(
+        sql_text(
+            f"SELECT encounter_file_id, page_number, "
+            f"snippet({FTS_TABLE}, 0, :hs, :he, ' … ', 16) AS snip, bm25({FTS_TABLE}) AS rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        {"hs": _HL_START, "he": _HL_END, "q": match, "limit": limit, "offset": offset},
+    ).all()
+    files = {
+        ef.id: (ef, enc)
+        for ef, enc in db.query(EncounterFile, PatientEncounters)
+        .join(PatientEncounters, EncounterFile.patient_encounter_id == PatientEncounters.id)
+        .filter(EncounterFile.id.in_({r.encounter_file_id for r in rows}))
+    } if rows else {}
+    hits = []
+    for r in rows:
+        ef, enc = files.get(r.encounter_file_id, (None, None))
+        if ef is None:
+            continue  # file deleted since indexing
+        hits.append({
+            "encounter_file": ef,
+            "encounter": enc,
+            "page_number": r.page_number,
+            "snippet": _highlight(r.snip),
+            "rank": r.rank,
+        })
+    return hits
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Build or query the full-text index of PDF page text")
+    ap.add_argument("--reindex", action="store_true", help="Re-index all PDFs, not just new ones")
+    ap.add_argument("--limit", type=int, default=None, help="Index at most N PDFs")
+    ap.add_argument("--search", metavar="QUERY", help="Search the index instead of indexing")
+    args = ap.parse_args()
+    if args.search:
+        db = Session()
+        try:
+            for h in search(db, args.search):
+                snippet = str(h["snippet"]).replace("<mark>", "[").replace("</mark>", "]")
+                print(f"{h['rank']:8.3f}  {h['encounter_file'].filename} p{h['page_number']}  {snippet}")
+        finally:
+            db.close()
+        return
+    print(index_pending(limit=args.limit, reindex=args.reindex))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@ import os
 from pathlib import Path
 from datetime import datetime
 from flask import (
-    render_template, request, redirect, url_for, flash, current_app
+    render_template, request, redirect, url_for, flash, current_app, make_response
 )
 from flask_login import current_user
 from werkzeug.utils import secure_filename
 from models import Session, UPLOAD_DIR
 import json
-from job_store import db_create_job
+from job_store import DEFERRED, db_create_job
+from job_queue import JOB_PRIORITIES, PRIORITY_NORMAL, PRIORITY_URGENT
+from job_admission import UPLOAD_BACKPRESSURE, check_admission, format_wait
 from worker import queue_job
 from . import bp
 from auth.roles import roles_required
@@ -48,15 +50,32 @@ def _file_size_bytes(file_storage) -> int:
     stream.seek(pos, os.SEEK_SET)
     return size
 
-@bp.route("/upload_files", methods=["GET"])
-@roles_required("admin", "fileUploader")
-def upload_form():
+def _upload_priorities() -> tuple[str, ...]:
+    """Priorities the current user may choose; urgent skips admission limits, so it is admin-only."""
+    if current_user.has_role("admin"):
+        return JOB_PRIORITIES
+    return tuple(p for p in JOB_PRIORITIES if p != PRIORITY_URGENT)
+
+def _render_upload_form():
+    # Wait estimate for a normal upload of one ZIP; urgent uploads are always admitted
+    admission = check_admission(1, PRIORITY_NORMAL)
     return render_template(
         "upload/upload_multi.html",
         per_file_mb=int(current_app.config["PER_FILE_MAX_BYTES"] / (1024 * 1024)),
         max_files=current_app.config["MAX_FILES_PER_UPLOAD"],
+        priorities=_upload_priorities(),
+        default_priority=PRIORITY_NORMAL,
+        load=admission.load,
+        wait=format_wait(admission.load.drain_seconds),
+        admission=admission,
+        backpressure=UPLOAD_BACKPRESSURE,
     )
 
+@bp.route("/upload_files", methods=["GET"])
+@roles_required("admin", "fileUploader")
+def upload_form():
+    return _render_upload_form()
+
 @bp.route("/upload", methods=["POST"])
 @roles_required("admin", "fileUploader")
 def upload_files():
@@ -72,6 +91,19 @@ def upload_files():
         flash(f"Too many files. Max allowed is {max_files}.", "danger")
         return redirect(url_for("uploads.upload_form"))
 
+    priority = request.form.get("priority") or PRIORITY_NORMAL
+    if priority not in _upload_priorities():
+        # Unknown, or urgent from a non-admin: it would bypass backpressure and fair scheduling
+        priority = PRIORITY_NORMAL
+    # Checked before anything is saved, so a refused upload leaves no files behind
+    admission = check_admission(len(files), priority)
+    if admission.action == "reject":
+        flash(f"The processing queue is full ({admission.reason}). "
+              f"Please try again in {format_wait(admission.retry_after)}.", "danger")
+        resp = make_response(_render_upload_form(), 429)
+        resp.headers["Retry-After"] = str(admission.retry_after)
+        return resp
+
     saved_paths: list[Path] = []
     rejected: list[str] = []
 
@@ -134,13 +166,20 @@ def upload_files():
     ip = xff or (request.remote_addr or "-")
     uploader_username = getattr(current_user, "username", None)
     uploader_user_id = getattr(current_user, "id", None)
+    deferred = admission.action == "defer"
     job_token = db_create_job(
         [p.name for p in saved_paths],
         rejected,
         uploader_user_id=uploader_user_id,
         uploader_username=uploader_username,
         uploader_ip=ip,
+        priority=priority,
+        status=DEFERRED if deferred else "queued",
     )
+    if deferred:
+        flash(f"The processing queue is busy ({admission.reason}). Accepted {len(saved_paths)} file(s) as a "
+              f"deferred job; it starts automatically once the backlog drops. Rejected: {len(rejected)}", "warning")
+        return redirect(url_for("jobs.job_status_page", job_token=job_token))
     queue_job(current_app, job_token, saved_paths)
 
     flash(f"Queued {len(saved_paths)} file(s) for processing. Rejected: {len(rejected)}", "info")
@@ -1,53 +1,263 @@
 # worker.py
+# Runs upload jobs from the durable queue (job_queue.py): embedded in the web
+# process (EMBEDDED_WORKER=true), or standalone with
+#   python -m worker serve --concurrency 4 --ocr-concurrency 2
+import argparse
+import json
+import os
+import shutil
+import signal
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
+from typing import Callable
 from flask import current_app
-from models import Session
-from main import setup_environment, setup_database, process_zip_file
-from process_pdfs import process_all_pdfs_for_ocr
-from job_store import (
-    db_set_job_status, db_set_item_state, db_any_item_error,
+from sqlalchemy.exc import IntegrityError
+from models import Session, PROCESSING_ERROR_DIR, UPLOAD_DIR, ZipFile, engine, utcnow
+from main import setup_environment, setup_database, process_zip_file, clean_filename, ProcessingCancelled
+from process_pdfs import process_all_pdfs_for_ocr, OCR_WORKERS
+from ocr_extraction import _engine_version
+from ocr_cache import get_ocr_cache
+from page_classifier import PAGE_TYPES, get_classifier
+from text_index import start_background_index
+from job_store import CANCELLED, db_finalize_job
+from job_admission import release_deferred_jobs
+from job_retention import run_retention_if_due
+from job_queue import (
+    JOB_LEASE_SECONDS, JOB_POLL_SECONDS, STAGE_INGEST, STAGE_OCR, WORKER_ID,
+    CancelCheck, ClaimedItem, Dispatcher, Lease, fail_item, finish_item, is_transient_error,
 )
 
-def _process_one_zip(zip_path: Path) -> dict:
+# --- Worker lifecycle ---
+# Process-wide, one-time setup (directories, schema, warm OCR resources); per-item
+# work only does per-item things.
+_init_hooks: list[Callable[[], None]] = []
+_init_lock = threading.Lock()
+_initialized_at: datetime | None = None
+
+def on_worker_init(fn: Callable[[], None]) -> Callable[[], None]:
+    """Register a hook run once by ensure_worker_initialized(), in registration order."""
+    _init_hooks.append(fn)
+    return fn
+
+@on_worker_init
+def _warm_db() -> None:
+    with engine.connect():
+        pass  # opens the pool's first connection
+
+@on_worker_init
+def _warm_ocr() -> None:
+    # Probes the Tesseract binary and loads header templates once; sandboxed and pool children
+    # start from this state (ocr_extraction.warm_state) instead of repeating it per PDF
+    version = _engine_version()
+    classifier = get_classifier()
+    get_ocr_cache()
+    print(f"OCR engine: {version or 'unavailable'}; header templates: "
+          f"{'disabled' if classifier is None else {t: classifier.count(t) for t in PAGE_TYPES}}")
+
+def ensure_worker_initialized() -> datetime:
+    """Create directories and schema and run the init hooks, once per process; returns when that happened."""
+    global _initialized_at
+    if _initialized_at is not None:
+        return _initialized_at
+    with _init_lock:
+        if _initialized_at is None:
+            setup_environment()
+            setup_database()
+            for hook in _init_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    # A cold resource is only slower, never fatal: it is created on first use instead
+                    print(f"Worker init hook {hook.__name__} failed: {e}")
+            _initialized_at = utcnow()
+    return _initialized_at
+
+def worker_initialized_at() -> datetime | None:
+    return _initialized_at
+
+def _recover_ingested(filename: str) -> list[str] | None:
     """
-    Reuse existing pipeline:
-      - setup env & db
-      - process_zip_file(zip_path, db)     # extract + DB + moves zip
-      - process_all_pdfs_for_ocr()         # OCR all PDFs (your current runner behavior)
+    An upload no longer in UPLOAD_DIR whose ZipFile row exists was ingested by a worker that
+    died before recording it: return that ZIP's PDFs still awaiting OCR, else None.
     """
-    setup_environment()
-    setup_database()
     db = Session()
     try:
-        pdfs = process_zip_file(zip_path, db)
-        if not pdfs:
-            # Nothing extracted (e.g., images only), treat as ok but skip OCR
-            return {"status": "ok", "message": "Ingested (no PDFs to OCR)"}
-        # Limit OCR strictly to PDFs from this zip
-        process_all_pdfs_for_ocr(limit_filenames=set(pdfs))
-        return {"status": "ok", "message": f"Ingested + OCR for {len(pdfs)} PDF(s)"}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+        zip_row = db.query(ZipFile).filter_by(zip_filename=clean_filename(filename)).first()
+        if zip_row is None or zip_row.patient_encounter is None:
+            return None
+        return [
+            ef.filename for ef in zip_row.patient_encounter.encounter_files
+            if ef.file_type == "pdf" and not ef.ocr_processed
+        ]
     finally:
         db.close()
 
-def _job_worker(job_token: str, saved_paths: list[Path]):
-    db_set_job_status(job_token, "processing")
-    try:
-        for p in saved_paths:
-            db_set_item_state(job_token, p.name, "processing")
-            result = _process_one_zip(p)
-            db_set_item_state(job_token, p.name, result["status"], result.get("message"))
-        if db_any_item_error(job_token):
-            db_set_job_status(job_token, "error", error="One or more files failed")
+def _restore_failed_upload(zip_path: Path) -> bool:
+    """A retried ZIP that process_zip_file moved to PROCESSING_ERROR_DIR goes back to the upload folder."""
+    failed = PROCESSING_ERROR_DIR / zip_path.name
+    if not failed.exists():
+        return False
+    shutil.move(str(failed), str(zip_path))
+    return True
+
+def _ingest_one_zip(zip_path: Path, should_stop: Callable[[], bool] | None = None) -> dict:
+    """
+    Stage 1 (ingest): extract the ZIP and create DB rows; no OCR.
+    Returns {"status": "ingested"|"error"|"cancelled", "message": str, "pdfs": [filenames], "transient": bool}.
+    """
+    if not zip_path.exists():
+        pdfs = _recover_ingested(zip_path.name)
+        if pdfs is None and _restore_failed_upload(zip_path):
+            print(f"Retrying '{zip_path.name}' from {PROCESSING_ERROR_DIR.name}.")
+        elif pdfs is None:
+            return {"status": "error", "message": "Uploaded ZIP is missing", "pdfs": []}
         else:
-            db_set_job_status(job_token, "done")
-    except Exception as e:
-        db_set_job_status(job_token, "error", error=str(e))
+            print(f"'{zip_path.name}' was already ingested; resuming with OCR of {len(pdfs)} PDF(s).")
+    if zip_path.exists():
+        db = Session()
+        try:
+            pdfs = process_zip_file(zip_path, db, should_stop=should_stop) or []
+        except ProcessingCancelled as e:
+            return {"status": CANCELLED, "message": str(e), "pdfs": []}
+        except IntegrityError as e:
+            if "md5_hash" not in str(e.orig):
+                return {"status": "error", "message": str(e), "pdfs": [], "transient": is_transient_error(e)}
+            # Same content as a ZIP ingested in parallel (e.g. one job's items): a duplicate,
+            # as if it had been processed after the other one
+            return {"status": "ingested", "message": "Duplicate of a ZIP ingested at the same time", "pdfs": []}
+        except Exception as e:
+            return {"status": "error", "message": str(e), "pdfs": [], "transient": is_transient_error(e)}
+        finally:
+            db.close()
+    if not pdfs:
+        # Nothing extracted (e.g., images only), treat as ok but skip OCR
+        return {"status": "ingested", "message": "Ingested (no PDFs to OCR)", "pdfs": []}
+    return {"status": "ingested", "message": f"Ingested {len(pdfs)} PDF(s); OCR queued", "pdfs": list(pdfs)}
+
+def _ocr_pdfs(pdfs: list[str], should_stop: Callable[[], bool] | None = None) -> dict:
+    """Stage 2 (OCR): OCR exactly the PDFs one ZIP produced."""
+    summary = process_all_pdfs_for_ocr(limit_filenames=set(pdfs), workers=OCR_WORKERS, should_stop=should_stop)
+    failed = summary.get("failed") or {}
+    if summary.get("cancelled"):
+        return {"status": CANCELLED, "message": f"Cancelled after OCR of {summary['processed']} of {len(pdfs)} PDF(s)"}
+    if summary.get("error"):
+        return {"status": "error", "message": summary["error"], "transient": is_transient_error(summary["error"])}
+    if failed:
+        details = "; ".join(f"{name}: {reason}" for name, reason in sorted(failed.items()))
+        # A retry only re-runs PDFs not OCR'd yet, so one transient failure is worth it
+        return {"status": "error",
+                "message": f"OCR failed for {len(failed)} of {len(pdfs)} PDF(s) - {details}",
+                "transient": any(is_transient_error(reason) for reason in failed.values())}
+    return {"status": "ok", "message": f"OCR for {len(pdfs)} PDF(s)"}
+
+def _finalize_job(job_token: str) -> None:
+    """Close the job once both stages of every item are finished; the last stage to finish does it."""
+    if db_finalize_job(job_token) is None:
+        return
+    # After the job is final: add the new PDFs (and any backlog) to the full-text index
+    start_background_index()
+
+def run_ingest_item(claimed: ClaimedItem) -> None:
+    """Queue handler for the ingest stage of one claimed JobItem."""
+    ensure_worker_initialized()
+    should_stop = CancelCheck(claimed.job_token)
+    with Lease(claimed):
+        result = _ingest_one_zip(UPLOAD_DIR / claimed.filename, should_stop)
+    if result["status"] == "error":
+        fail_item(claimed, STAGE_INGEST, result["message"], result.get("transient", False))
+    elif result["status"] == CANCELLED:
+        finish_item(claimed, STAGE_INGEST, CANCELLED, result["message"])
+    elif not result["pdfs"]:
+        finish_item(claimed, STAGE_INGEST, "ingested", result["message"], ocr_state="skipped")
+    else:
+        # OCR is queued in the same UPDATE, so finalization never sees the item as finished;
+        # a job cancelled after this ZIP was extracted does not get its OCR
+        finish_item(claimed, STAGE_INGEST, "ingested", result["message"],
+                    ocr_state=CANCELLED if should_stop(force=True) else "queued",
+                    ocr_pdfs=json.dumps(result["pdfs"]))
+    _finalize_job(claimed.job_token)
+
+def run_ocr_item(claimed: ClaimedItem) -> None:
+    """Queue handler for the OCR stage of one claimed JobItem."""
+    ensure_worker_initialized()
+    with Lease(claimed):
+        try:
+            result = _ocr_pdfs(json.loads(claimed.ocr_pdfs or "[]"), CancelCheck(claimed.job_token))
+        except Exception as e:
+            result = {"status": "error", "message": str(e), "transient": is_transient_error(e)}
+    if result["status"] == "error":
+        fail_item(claimed, STAGE_OCR, result["message"], result.get("transient", False))
+    else:
+        finish_item(claimed, STAGE_OCR, result["status"], result.get("message"))
+    _finalize_job(claimed.job_token)
+
+_dispatcher: Dispatcher | None = None
+_dispatcher_lock = threading.Lock()
+
+def start_dispatcher(ingest_executor: Executor | None, ingest_slots: int,
+                     ocr_executor: Executor | None, ocr_slots: int) -> Dispatcher:
+    """Start this process's queue dispatcher (once); a stage without an executor is left to other workers."""
+    global _dispatcher
+    stages = {}
+    if ingest_executor is not None and ingest_slots > 0:
+        stages[STAGE_INGEST] = (ingest_executor, ingest_slots, run_ingest_item)
+    if ocr_executor is not None and ocr_slots > 0:
+        stages[STAGE_OCR] = (ocr_executor, ocr_slots, run_ocr_item)
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(stages, hooks=(release_deferred_jobs, run_retention_if_due)).start()
+        return _dispatcher
 
 def queue_job(app, job_token: str, saved_paths: list[Path]):
     """
-    Submit a job to the shared executor (ThreadPoolExecutor stored in app.config).
+    The job's items are already queued in the DB (db_create_job); wake the embedded dispatcher
+    so they are claimed now instead of at the next poll. Standalone workers
+    (`python -m worker serve`) pick them up on their next poll.
     """
-    executor = app.config["EXECUTOR"]
-    executor.submit(_job_worker, job_token, saved_paths)
+    dispatcher = app.config.get("JOB_DISPATCHER")
+    if dispatcher is not None:
+        dispatcher.wake()
+
+def serve(concurrency: int, ocr_concurrency: int, stage: str = "all") -> None:
+    """Run queued ZIP ingest and OCR from the shared job tables until SIGINT/SIGTERM."""
+    ensure_worker_initialized()
+    ingest_slots = concurrency if stage in ("all", STAGE_INGEST) else 0
+    ocr_slots = ocr_concurrency if stage in ("all", STAGE_OCR) else 0
+    ingest_pool = ThreadPoolExecutor(max_workers=ingest_slots, thread_name_prefix="ingest") if ingest_slots else None
+    ocr_pool = ThreadPoolExecutor(max_workers=ocr_slots, thread_name_prefix="ocr") if ocr_slots else None
+
+    stopping = threading.Event()
+    def _on_signal(signum, frame):
+        print(f"Received signal {signum}; finishing running items, claiming no new ones...", flush=True)
+        stopping.set()
+    signal.signal(signal.SIGINT, _on_signal)
+    signal.signal(signal.SIGTERM, _on_signal)
+
+    dispatcher = start_dispatcher(ingest_pool, ingest_slots, ocr_pool, ocr_slots)
+    print(f"Worker {WORKER_ID} serving: ingest={ingest_slots} ocr={ocr_slots} "
+          f"(poll {JOB_POLL_SECONDS}s, lease {JOB_LEASE_SECONDS}s)", flush=True)
+    stopping.wait()
+    dispatcher.stop()
+    for pool in (ingest_pool, ocr_pool):
+        if pool is not None:
+            pool.shutdown(wait=True)
+    print("Worker stopped.", flush=True)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Background worker for upload jobs (ZIP ingest + OCR)")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sp = sub.add_parser("serve", help="Run queued jobs from the shared database until stopped")
+    sp.add_argument("--concurrency", type=int, default=int(os.getenv("WORKERS", "4")),
+                    help="Concurrent ZIP ingests (default WORKERS)")
+    sp.add_argument("--ocr-concurrency", type=int, default=int(os.getenv("OCR_QUEUE_WORKERS", "1")),
+                    help="Concurrent OCR tasks (default OCR_QUEUE_WORKERS)")
+    sp.add_argument("--stage", choices=("all", STAGE_INGEST, STAGE_OCR), default="all",
+                    help="Only run one stage, e.g. dedicated OCR boxes")
+    args = ap.parse_args()
+    if args.command == "serve":
+        serve(args.concurrency, args.ocr_concurrency, args.stage)
+
+if __name__ == "__main__":
+    main()